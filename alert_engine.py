@@ -0,0 +1,191 @@
+import heapq
+import itertools
+import math
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+
+class Alert(NamedTuple):
+    """A one-shot notification request for a currency crossing a threshold"""
+    alert_id: int
+    user_id: int
+    currency: str
+    threshold: float
+    is_above: bool
+
+    @property
+    def direction(self) -> str:
+        return 'above' if self.is_above else 'below'
+
+    def is_triggered(self, rate: float) -> bool:
+        return rate > self.threshold if self.is_above else rate < self.threshold
+
+
+class CurrencyAlertIndex:
+    """Threshold heaps for a single currency
+
+    ``above`` is a min-heap of thresholds (rate > threshold triggers the
+    smallest first), ``below`` a max-heap stored negated (rate < threshold
+    triggers the largest first). Cancelled alerts are deleted lazily: their
+    entries stay in the heap until popped or until compaction.
+    """
+
+    def __init__(self):
+        self.above: List[Tuple[float, int]] = []
+        self.below: List[Tuple[float, int]] = []
+
+    def push(self, alert: Alert) -> None:
+        if alert.is_above:
+            heapq.heappush(self.above, (alert.threshold, alert.alert_id))
+        else:
+            heapq.heappush(self.below, (-alert.threshold, alert.alert_id))
+
+    def pop_triggered(self, rate: float, live: Mapping[int, Alert]) -> List[int]:
+        """Pop ids of every live alert triggered by rate, O(k log n)"""
+        triggered = []
+        above, below = self.above, self.below
+        while above and above[0][0] < rate:
+            alert_id = heapq.heappop(above)[1]
+            if alert_id in live:
+                triggered.append(alert_id)
+        while below and -below[0][0] > rate:
+            alert_id = heapq.heappop(below)[1]
+            if alert_id in live:
+                triggered.append(alert_id)
+        return triggered
+
+    def compact(self, live: Mapping[int, Alert]) -> None:
+        """Drop heap entries of cancelled alerts"""
+        self.above = [entry for entry in self.above if entry[1] in live]
+        self.below = [entry for entry in self.below if entry[1] in live]
+        heapq.heapify(self.above)
+        heapq.heapify(self.below)
+
+    def __len__(self) -> int:
+        return len(self.above) + len(self.below)
+
+
+class AlertEngine:
+    """Per-currency threshold index of rate alerts
+
+    Evaluating a new rate only touches alerts that actually trigger, instead
+    of scanning every user's alerts on each tick. A user may hold any number
+    of alerts per currency; triggered alerts are removed as they are returned.
+    """
+
+    def __init__(self):
+        self.alerts: Dict[int, Alert] = {}
+        self.by_user: Dict[int, Set[int]] = {}
+        self.indexes: Dict[str, CurrencyAlertIndex] = {}
+        self._ids = itertools.count(1)
+        self._dead = 0
+
+    def add(self, user_id: int, currency: str, threshold: float, is_above: bool,
+            alert_id: Optional[int] = None) -> Alert:
+        """Register an alert, assigning the next id unless one is given"""
+        if alert_id is None:
+            alert_id = next(self._ids)
+        alert = Alert(alert_id, user_id, currency, float(threshold), is_above)
+        self.restore(alert)
+        return alert
+
+    def restore(self, alert: Alert) -> None:
+        """Register an existing alert, e.g. one loaded from storage"""
+        if not math.isfinite(alert.threshold):
+            # A NaN at the top of a heap would stop every pop for that currency
+            raise ValueError(f"Alert threshold must be a finite number, got {alert.threshold!r}")
+        self.alerts[alert.alert_id] = alert
+        self.by_user.setdefault(alert.user_id, set()).add(alert.alert_id)
+        index = self.indexes.get(alert.currency)
+        if index is None:
+            index = self.indexes[alert.currency] = CurrencyAlertIndex()
+        index.push(alert)
+
+    def bulk_restore(self, alerts: Iterable[Alert]) -> int:
+        """Register many alerts at once, e.g. a page loaded from storage
+
+        Small heaps are extended and re-heapified in O(n); once a heap is
+        much larger than the batch, entries are pushed one by one instead,
+        so loading page after page stays O(n log n) overall.
+        """
+        added: Dict[Tuple[str, bool], List[Tuple[float, int]]] = {}
+        count = 0
+        for alert in alerts:
+            if not math.isfinite(alert.threshold):
+                continue
+            self.alerts[alert.alert_id] = alert
+            self.by_user.setdefault(alert.user_id, set()).add(alert.alert_id)
+            entry = (alert.threshold, alert.alert_id) if alert.is_above else (-alert.threshold, alert.alert_id)
+            added.setdefault((alert.currency, alert.is_above), []).append(entry)
+            count += 1
+        for (currency, is_above), entries in added.items():
+            index = self.indexes.get(currency)
+            if index is None:
+                index = self.indexes[currency] = CurrencyAlertIndex()
+            heap = index.above if is_above else index.below
+            if len(heap) > 8 * len(entries):
+                for entry in entries:
+                    heapq.heappush(heap, entry)
+            else:
+                heap.extend(entries)
+                heapq.heapify(heap)
+        return count
+
+    def merge(self, other: "AlertEngine") -> None:
+        """Take over other's alerts and id sequence, e.g. those set while this engine was loading"""
+        for alert in other.alerts.values():
+            if alert.alert_id not in self.alerts:
+                self.restore(alert)
+        self._ids = other._ids
+
+    def reserve_ids(self, last_id: int) -> None:
+        """Make sure newly assigned ids start after last_id"""
+        self._ids = itertools.count(max(last_id, self.last_id) + 1)
+
+    @property
+    def last_id(self) -> int:
+        return max(self.alerts, default=0)
+
+    def remove(self, alert_id: int) -> Optional[Alert]:
+        """Cancel an alert; its heap entry is discarded lazily"""
+        alert = self._forget(alert_id)
+        if alert is not None:
+            self._dead += 1
+            if self._dead > 1024 and self._dead > len(self.alerts):
+                self.compact()
+        return alert
+
+    def _forget(self, alert_id: int) -> Optional[Alert]:
+        alert = self.alerts.pop(alert_id, None)
+        if alert is not None:
+            user_alerts = self.by_user.get(alert.user_id)
+            if user_alerts is not None:
+                user_alerts.discard(alert_id)
+                if not user_alerts:
+                    del self.by_user[alert.user_id]
+        return alert
+
+    def compact(self) -> None:
+        for index in self.indexes.values():
+            index.compact(self.alerts)
+        self._dead = 0
+
+    def user_alerts(self, user_id: int) -> List[Alert]:
+        return sorted((self.alerts[alert_id] for alert_id in self.by_user.get(user_id, ())),
+                      key=lambda alert: alert.alert_id)
+
+    def evaluate(self, rates: Mapping[str, float]) -> List[Alert]:
+        """Remove and return every alert triggered by rates"""
+        triggered = []
+        for currency, rate in rates.items():
+            index = self.indexes.get(currency)
+            if index is None or rate is None:
+                continue
+            for alert_id in index.pop_triggered(rate, self.alerts):
+                # A removed and restored alert can have a stale heap entry besides its new one
+                alert = self._forget(alert_id)
+                if alert is not None:
+                    triggered.append(alert)
+        return triggered
+
+    def __len__(self) -> int:
+        return len(self.alerts)
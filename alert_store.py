@@ -0,0 +1,386 @@
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Collection, Iterator, List, Optional, Sequence, Tuple
+
+from alert_engine import Alert
+from config import (
+    ALERT_STORE_BACKEND, ALERT_DB_PATH, ALERT_STORE_BATCH_SIZE,
+    ALERT_STORE_FLUSH_INTERVAL, ALERT_LOAD_PAGE_SIZE, CLUSTER_SHARDS
+)
+from logger import logger
+from subscriptions import Subscription
+
+# Seconds a deleted alert id is remembered, so a save still queued elsewhere cannot revive it
+TOMBSTONE_TTL = 3600.0
+
+
+def shard_of(user_id: int, shards: int = CLUSTER_SHARDS) -> int:
+    """Stable shard of a user (Fibonacci hashing, so sequential ids spread evenly)"""
+    return (((user_id * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32) % shards
+
+
+class AlertStore(ABC):
+    """Storage backend for alerts, users and digest subscriptions
+
+    Writes are fire-and-forget so handlers never wait on disk; reads are
+    paged so large tables can be loaded incrementally.
+    """
+
+    @abstractmethod
+    def save(self, alert: Alert) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, alert_id: int) -> None:
+        pass
+
+    @abstractmethod
+    def save_user(self, user_id: int, language_code: Optional[str] = None) -> None:
+        pass
+
+    @abstractmethod
+    def last_id(self) -> int:
+        """Highest alert id ever stored, so new ids never collide"""
+
+    @abstractmethod
+    def iter_pages(self, page_size: int = ALERT_LOAD_PAGE_SIZE,
+                   shards: Optional[Collection[int]] = None) -> Iterator[List[Alert]]:
+        """Stored alerts, optionally only those of users in the given shards"""
+
+    @abstractmethod
+    def save_subscriptions(self, subscriptions: Sequence[Subscription]) -> None:
+        """Insert or update digest subscriptions, typically a whole tick's worth at once"""
+
+    @abstractmethod
+    def delete_subscription(self, chat_id: int) -> None:
+        pass
+
+    @abstractmethod
+    def iter_subscriptions(self, page_size: int = ALERT_LOAD_PAGE_SIZE) -> Iterator[List[Subscription]]:
+        pass
+
+    def flush(self) -> None:
+        """Block until pending writes are durable"""
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryAlertStore(AlertStore):
+    """No persistence: alerts live only in the engine, as before"""
+
+    def save(self, alert: Alert) -> None:
+        pass
+
+    def delete(self, alert_id: int) -> None:
+        pass
+
+    def save_user(self, user_id: int, language_code: Optional[str] = None) -> None:
+        pass
+
+    def last_id(self) -> int:
+        return 0
+
+    def iter_pages(self, page_size: int = ALERT_LOAD_PAGE_SIZE,
+                   shards: Optional[Collection[int]] = None) -> Iterator[List[Alert]]:
+        return iter(())
+
+    def save_subscriptions(self, subscriptions: Sequence[Subscription]) -> None:
+        pass
+
+    def delete_subscription(self, chat_id: int) -> None:
+        pass
+
+    def iter_subscriptions(self, page_size: int = ALERT_LOAD_PAGE_SIZE) -> Iterator[List[Subscription]]:
+        return iter(())
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    alert_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    currency TEXT NOT NULL,
+    is_above INTEGER NOT NULL,
+    threshold REAL NOT NULL,
+    created_at REAL NOT NULL,
+    shard INTEGER
+);
+CREATE INDEX IF NOT EXISTS alerts_by_threshold ON alerts (currency, is_above, threshold);
+CREATE INDEX IF NOT EXISTS alerts_by_user ON alerts (user_id);
+CREATE TABLE IF NOT EXISTS deleted_alerts (
+    alert_id INTEGER PRIMARY KEY,
+    deleted_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    language_code TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    chat_id INTEGER PRIMARY KEY,
+    cadence TEXT NOT NULL,
+    currencies TEXT NOT NULL,
+    language TEXT NOT NULL,
+    next_due REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_SAVE, _DELETE, _USER, _FLUSH, _SUBSCRIBE, _UNSUBSCRIBE = range(6)
+
+
+class SQLiteAlertStore(AlertStore):
+    """SQLite backend in WAL mode with a write-behind batching thread
+
+    save/delete only enqueue the operation; a background thread groups up
+    to ``batch_size`` operations (or whatever arrived within
+    ``flush_interval``) into a single transaction.
+
+    Every alert row carries its user's cluster shard in an indexed column,
+    so a worker loads only the shards it owns. Deletes leave a tombstone
+    for ``TOMBSTONE_TTL`` seconds: in cluster mode the coordinator saves an
+    alert and a worker process deletes it through separate queues, and a
+    save that lands after the delete must not bring the alert back.
+    """
+
+    def __init__(self, path: str = ALERT_DB_PATH, batch_size: int = ALERT_STORE_BATCH_SIZE,
+                 flush_interval: float = ALERT_STORE_FLUSH_INTERVAL, shards: int = CLUSTER_SHARDS):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.shards = shards
+        self.written = 0
+        self.batches = 0
+        self._pruned_at = 0.0
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        conn.close()
+        self._ops: "queue.Queue[Tuple]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name='alert-store-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # WAL + NORMAL only fsyncs at checkpoints; a crash can lose the last batch, never corrupt
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """Add the shard column to older databases and fill it in if the shard count changed"""
+        if 'shard' not in {row[1] for row in conn.execute('PRAGMA table_info(alerts)')}:
+            conn.execute('ALTER TABLE alerts ADD COLUMN shard INTEGER')
+        conn.execute('CREATE INDEX IF NOT EXISTS alerts_by_shard ON alerts (shard, alert_id)')
+        row = conn.execute("SELECT value FROM meta WHERE key = 'shards'").fetchone()
+        if row is not None and row[0] == self.shards:
+            return
+        # One pass per change of CLUSTER_SHARDS, instead of hashing every row on every shard load
+        with conn:
+            users = [user_id for user_id, in conn.execute('SELECT DISTINCT user_id FROM alerts')]
+            conn.executemany('UPDATE alerts SET shard = ? WHERE user_id = ?',
+                             ((shard_of(user_id, self.shards), user_id) for user_id in users))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('shards', ?)", (self.shards,))
+        if users:
+            logger.info(f"Assigned {len(users)} users' alerts to {self.shards} shards")
+
+    def save(self, alert: Alert) -> None:
+        self._ops.put((_SAVE, alert))
+
+    def delete(self, alert_id: int) -> None:
+        self._ops.put((_DELETE, alert_id))
+
+    def save_user(self, user_id: int, language_code: Optional[str] = None) -> None:
+        self._ops.put((_USER, (user_id, language_code)))
+
+    def save_subscriptions(self, subscriptions: Sequence[Subscription]) -> None:
+        self._ops.put((_SUBSCRIBE, subscriptions))
+
+    def delete_subscription(self, chat_id: int) -> None:
+        self._ops.put((_UNSUBSCRIBE, chat_id))
+
+    def flush(self) -> None:
+        done = threading.Event()
+        self._ops.put((_FLUSH, done))
+        done.wait()
+
+    def close(self) -> None:
+        if self._writer.is_alive():
+            self._ops.put(None)
+            self._writer.join()
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            op = self._ops.get()
+            batch = [op]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._ops.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                stopping = True
+                batch.pop()
+            waiters = [payload for kind, payload in batch if kind == _FLUSH]
+            ops = [op for op in batch if op[0] != _FLUSH]
+            try:
+                self._write(conn, ops)
+            finally:
+                for done in waiters:
+                    done.set()
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, ops: List[Tuple]) -> None:
+        """Apply ops in one transaction; if that fails, one by one so a bad row only loses itself"""
+        try:
+            self._apply(conn, ops)
+            return
+        except Exception as e:
+            if len(ops) == 1:
+                logger.error(f"Dropping alert store operation {ops[0]!r}: {str(e)}")
+                return
+            logger.error(f"Error writing {len(ops)} alert store operations, retrying one by one: {str(e)}")
+        for op in ops:
+            try:
+                self._apply(conn, [op])
+            except Exception as e:
+                logger.error(f"Dropping alert store operation {op!r}: {str(e)}")
+
+    def _apply(self, conn: sqlite3.Connection, batch: List[Tuple]) -> None:
+        saves, deletes, users = [], [], []
+        subscribes, unsubscribes = {}, {}
+        now = time.time()
+        for kind, payload in batch:
+            if kind == _SAVE:
+                saves.append((payload.alert_id, payload.user_id, payload.currency, int(payload.is_above),
+                              payload.threshold, now, shard_of(payload.user_id, self.shards), payload.alert_id))
+            elif kind == _DELETE:
+                deletes.append((payload, now))
+            elif kind == _USER:
+                users.append((payload[0], payload[1], now, now))
+            elif kind == _SUBSCRIBE:
+                # Only the latest state of each chat in the batch is written
+                for sub in payload:
+                    unsubscribes.pop(sub.chat_id, None)
+                    subscribes[sub.chat_id] = (sub.chat_id, sub.cadence, ','.join(sub.currencies),
+                                               sub.language, sub.next_due)
+            elif kind == _UNSUBSCRIBE:
+                subscribes.pop(payload, None)
+                unsubscribes[payload] = (payload,)
+
+        if saves or deletes or users or subscribes or unsubscribes:
+            with conn:
+                if saves:
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO alerts '
+                        '(alert_id, user_id, currency, is_above, threshold, created_at, shard) '
+                        'SELECT ?, ?, ?, ?, ?, ?, ? '
+                        'WHERE NOT EXISTS (SELECT 1 FROM deleted_alerts WHERE alert_id = ?)',
+                        saves
+                    )
+                    conn.execute(
+                        "INSERT INTO meta VALUES ('last_id', ?) "
+                        "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+                        (max(row[0] for row in saves),)
+                    )
+                if deletes:
+                    conn.executemany('INSERT OR REPLACE INTO deleted_alerts VALUES (?, ?)', deletes)
+                    conn.executemany('DELETE FROM alerts WHERE alert_id = ?', (row[:1] for row in deletes))
+                    if now - self._pruned_at > 60:
+                        conn.execute('DELETE FROM deleted_alerts WHERE deleted_at < ?', (now - TOMBSTONE_TTL,))
+                        self._pruned_at = now
+                if users:
+                    conn.executemany(
+                        'INSERT INTO users VALUES (?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET '
+                        'language_code = COALESCE(excluded.language_code, language_code), '
+                        'last_seen = excluded.last_seen',
+                        users
+                    )
+                if subscribes:
+                    conn.executemany('INSERT OR REPLACE INTO subscriptions VALUES (?, ?, ?, ?, ?)',
+                                     subscribes.values())
+                if unsubscribes:
+                    conn.executemany('DELETE FROM subscriptions WHERE chat_id = ?', unsubscribes.values())
+            self.written += len(saves) + len(deletes) + len(users) + len(subscribes) + len(unsubscribes)
+            self.batches += 1
+
+    def last_id(self) -> int:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'last_id'").fetchone()
+            return row[0] if row else 0
+        finally:
+            conn.close()
+
+    def iter_pages(self, page_size: int = ALERT_LOAD_PAGE_SIZE,
+                   shards: Optional[Collection[int]] = None) -> Iterator[List[Alert]]:
+        """Yield alerts in id order, one page per query (keyset pagination)
+
+        With ``shards``, each shard is paged on its own through the shard
+        index, so only the requested shards' rows are read.
+        """
+        conn = self._connect()
+        try:
+            if shards is None:
+                yield from self._pages(conn, '', (), page_size)
+            else:
+                for shard in sorted(shards):
+                    yield from self._pages(conn, 'shard = ? AND', (shard,), page_size)
+        finally:
+            conn.close()
+
+    def _pages(self, conn: sqlite3.Connection, where: str, params: Tuple,
+               page_size: int) -> Iterator[List[Alert]]:
+        after = 0
+        while True:
+            rows = conn.execute(
+                'SELECT alert_id, user_id, currency, threshold, is_above FROM alerts '
+                f'WHERE {where} alert_id > ? ORDER BY alert_id LIMIT ?',
+                params + (after, page_size)
+            ).fetchall()
+            if not rows:
+                return
+            after = rows[-1][0]
+            yield [Alert(alert_id, user_id, currency, threshold, bool(is_above))
+                   for alert_id, user_id, currency, threshold, is_above in rows]
+
+    def iter_subscriptions(self, page_size: int = ALERT_LOAD_PAGE_SIZE) -> Iterator[List[Subscription]]:
+        """Yield digest subscriptions in chat id order, one page per query"""
+        conn = self._connect()
+        try:
+            after = -2 ** 63  # group chat ids are negative
+            while True:
+                rows = conn.execute(
+                    'SELECT chat_id, cadence, currencies, language, next_due FROM subscriptions '
+                    'WHERE chat_id > ? ORDER BY chat_id LIMIT ?',
+                    (after, page_size)
+                ).fetchall()
+                if not rows:
+                    return
+                after = rows[-1][0]
+                yield [Subscription(chat_id, cadence, tuple(currencies.split(',')), language, next_due)
+                       for chat_id, cadence, currencies, language, next_due in rows]
+        finally:
+            conn.close()
+
+
+def create_alert_store(backend: str = ALERT_STORE_BACKEND) -> AlertStore:
+    """Build the configured storage backend"""
+    if backend == 'sqlite':
+        return SQLiteAlertStore()
+    if backend == 'memory':
+        return MemoryAlertStore()
+    raise ValueError(f"Unknown alert store backend: {backend}")
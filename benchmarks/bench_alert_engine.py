@@ -0,0 +1,106 @@
+"""Alert evaluation with the threshold index vs. the old nested-dict scan
+
+Builds N synthetic alerts spread over every currency, then feeds a series
+of rate moves that trigger a small fraction of them.
+
+    python -m benchmarks.bench_alert_engine --alerts 1000000
+"""
+import argparse
+import json
+import random
+import time
+
+from alert_engine import AlertEngine
+from benchmarks.stub_servers import DEFAULT_RATES
+
+
+def synthetic_alerts(count: int, seed: int = 1):
+    rng = random.Random(seed)
+    currencies = list(DEFAULT_RATES)
+    for user_id in range(count):
+        currency = rng.choice(currencies)
+        base = DEFAULT_RATES[currency]
+        is_above = rng.random() < 0.5
+        # Thresholds sit 1-30% away from the current rate on the side they watch
+        offset = base * rng.uniform(0.01, 0.30)
+        yield user_id, currency, base + offset if is_above else base - offset, is_above
+
+
+def rate_moves(steps: int, seed: int = 2):
+    rng = random.Random(seed)
+    rates = dict(DEFAULT_RATES)
+    for _ in range(steps):
+        rates = {currency: rate * (1 + rng.gauss(0, 0.004)) for currency, rate in rates.items()}
+        yield rates
+
+
+def bench_engine(alerts, moves):
+    engine = AlertEngine()
+    start = time.perf_counter()
+    for user_id, currency, threshold, is_above in alerts:
+        engine.add(user_id, currency, threshold, is_above)
+    build = time.perf_counter() - start
+
+    triggered, ticks = 0, []
+    for rates in moves:
+        start = time.perf_counter()
+        triggered += len(engine.evaluate(rates))
+        ticks.append(time.perf_counter() - start)
+    return build, ticks, triggered
+
+
+def bench_scan(alerts, moves):
+    # The previous structure: {user_id: {currency: (threshold, is_above)}}
+    table = {}
+    start = time.perf_counter()
+    for user_id, currency, threshold, is_above in alerts:
+        table.setdefault(user_id, {})[currency] = (threshold, is_above)
+    build = time.perf_counter() - start
+
+    triggered, ticks = 0, []
+    for rates in moves:
+        start = time.perf_counter()
+        fired = []
+        for user_id, user_alerts in table.items():
+            for currency, (threshold, is_above) in user_alerts.items():
+                rate = rates[currency]
+                if (is_above and rate > threshold) or (not is_above and rate < threshold):
+                    fired.append((user_id, currency))
+        for user_id, currency in fired:
+            del table[user_id][currency]
+            if not table[user_id]:
+                del table[user_id]
+        triggered += len(fired)
+        ticks.append(time.perf_counter() - start)
+    return build, ticks, triggered
+
+
+def summarize(build, ticks, triggered):
+    ticks = sorted(ticks)
+    return {
+        'build_s': round(build, 3),
+        'tick_p50_ms': round(ticks[len(ticks) // 2] * 1000, 3),
+        'tick_max_ms': round(ticks[-1] * 1000, 3),
+        'total_eval_s': round(sum(ticks), 3),
+        'triggered': triggered,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alerts', type=int, default=1_000_000)
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--skip-scan', action='store_true', help='only run the indexed engine')
+    args = parser.parse_args()
+
+    alerts = list(synthetic_alerts(args.alerts))
+    moves = list(rate_moves(args.ticks))
+    results = {'alerts': args.alerts, 'ticks': args.ticks,
+               'engine': summarize(*bench_engine(alerts, moves))}
+    if not args.skip_scan:
+        results['scan'] = summarize(*bench_scan(alerts, moves))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Write-behind throughput and paged startup load of the SQLite alert store
+
+    python -m benchmarks.bench_alert_store --alerts 1000000
+    python -m benchmarks.bench_alert_store --alerts 20000000 --path /tmp/alerts.db
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+from alert_engine import Alert, AlertEngine
+from alert_store import SQLiteAlertStore
+from benchmarks.bench_alert_engine import synthetic_alerts
+from logger import logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alerts', type=int, default=1_000_000)
+    parser.add_argument('--page-size', type=int, default=50_000)
+    parser.add_argument('--path', help='database file (default: a temporary file)')
+    parser.add_argument('--no-engine', action='store_true', help='page rows without building the index')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    path = args.path or os.path.join(tempfile.mkdtemp(), 'alerts.db')
+    store = SQLiteAlertStore(path, batch_size=10_000)
+
+    start = time.perf_counter()
+    for alert_id, (user_id, currency, threshold, is_above) in enumerate(synthetic_alerts(args.alerts), 1):
+        store.save(Alert(alert_id, user_id, currency, threshold, is_above))
+    enqueue = time.perf_counter() - start
+    store.flush()
+    durable = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine = AlertEngine()
+    loaded = pages = 0
+    for page in store.iter_pages(args.page_size):
+        pages += 1
+        loaded += len(page) if args.no_engine else engine.bulk_restore(page)
+    load = time.perf_counter() - start
+    store.close()
+
+    print(json.dumps({
+        'alerts': args.alerts,
+        'save_call_us': round(enqueue / args.alerts * 1e6, 3),
+        'enqueue_s': round(enqueue, 3),
+        'durable_s': round(durable, 3),
+        'batches': store.batches,
+        'load_s': round(load, 3),
+        'pages': pages,
+        'loaded': loaded,
+        'db_mb': round(os.path.getsize(path) / 2 ** 20, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Concurrent handler latency with the blocking and the async MOEX client
+
+Simulates rate handlers arriving at a steady pace while the stub ISS server
+answers slowly, and a trivial handler (like /start) that never touches the
+network. With the blocking client every upstream round trip stalls the loop,
+so even the trivial handler's latency grows.
+
+    python -m benchmarks.bench_async_client --requests 100 --latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+
+from benchmarks.stub_servers import StubUpstreamServer
+from exchange_api import AsyncMOEXAPI, MOEXAPI
+from logger import logger
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {
+        'p50_ms': round(pick(0.50) * 1000, 2),
+        'p99_ms': round(pick(0.99) * 1000, 2),
+        'max_ms': round(samples[-1] * 1000, 2),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 2),
+    }
+
+
+async def drive(fetch, requests: int, interval: float):
+    rate_latency, trivial_latency = [], []
+
+    # Arrivals follow a fixed timeline; latency is measured from the scheduled
+    # arrival, so time spent waiting for a blocked loop counts against it
+    async def rate_handler(arrived):
+        await fetch()
+        rate_latency.append(time.perf_counter() - arrived)
+
+    async def trivial_handler(arrived):
+        trivial_latency.append(time.perf_counter() - arrived)
+
+    await fetch()  # warm up connections and the CBR fallback
+    tasks = []
+    start = time.perf_counter()
+    for i in range(requests):
+        arrived = start + i * interval
+        delay = arrived - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(rate_handler(arrived)))
+        tasks.append(asyncio.create_task(trivial_handler(arrived)))
+    await asyncio.gather(*tasks)
+    return {'rate_handler': percentiles(rate_latency), 'trivial_handler': percentiles(trivial_latency)}
+
+
+async def run(args):
+    results = {}
+    with StubUpstreamServer(latency=args.latency) as stub:
+        sync_api = MOEXAPI(stub.iss_url, stub.cbr_url)
+
+        async def sync_fetch():
+            # What the handlers did before: a blocking call on the event loop
+            return sync_api.get_exchange_rates()
+
+        results['sync'] = await drive(sync_fetch, args.requests, args.interval)
+
+        async_api = AsyncMOEXAPI(stub.iss_url, stub.cbr_url)
+        results['async'] = await drive(async_api.get_exchange_rates, args.requests, args.interval)
+        await async_api.aclose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--interval', type=float, default=0.02, help='seconds between arrivals')
+    parser.add_argument('--latency', type=float, default=0.2, help='stub upstream latency in seconds')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Alert-check throughput vs. number of cluster worker processes
+
+Seeds a SQLite alert store with N synthetic alerts. Then, for every worker
+count, it starts a ClusterCoordinator over a fresh copy of that store (the
+workers run without a Telegram bot) and publishes a series of rate moves,
+waiting for every worker to finish each tick. It reports startup
+(shard loading) time, tick latency, and triggered alerts processed per
+second. After the last run it adds one worker and removes one to time
+shard rebalancing.
+
+Scaling is bounded by the cores available; the core count is reported.
+
+    python -m benchmarks.bench_cluster --alerts 200000 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from alert_engine import Alert
+from alert_store import SQLiteAlertStore
+from benchmarks.bench_alert_engine import rate_moves, synthetic_alerts
+from cluster import ClusterCoordinator
+from logger import logger
+from rate_cache import RateSnapshot
+
+
+def seed_store(path: str, count: int) -> None:
+    store = SQLiteAlertStore(path, batch_size=50_000)
+    for alert_id, (user_id, currency, threshold, is_above) in enumerate(synthetic_alerts(count), 1):
+        store.save(Alert(alert_id, user_id, currency, threshold, is_above))
+    store.close()
+
+
+async def run(path: str, workers: int, ticks: int, rebalance: bool) -> dict:
+    coordinator = ClusterCoordinator(SQLiteAlertStore(path), token=None)
+    start = time.perf_counter()
+    await coordinator.start(workers)
+    startup = time.perf_counter() - start
+
+    latencies, triggered_before = [], 0
+    start = time.perf_counter()
+    for rates in rate_moves(ticks):
+        tick = time.perf_counter()
+        seq = coordinator.publish(RateSnapshot.from_rates(rates))
+        await coordinator.wait_evaluated(seq)
+        latencies.append(time.perf_counter() - tick)
+    elapsed = time.perf_counter() - start
+    stats = coordinator.stats()
+    triggered = sum(worker['triggered'] for worker in stats.values())
+    latencies.sort()
+    result = {
+        'startup_s': round(startup, 2),
+        'alerts_per_worker': [worker['alerts'] + worker['triggered'] for worker in stats.values()],
+        'triggered': triggered,
+        'triggered_per_s': round(triggered / elapsed),
+        'tick_ms': {'p50': round(latencies[len(latencies) // 2] * 1000, 2),
+                    'max': round(latencies[-1] * 1000, 2)},
+    }
+    if rebalance:
+        held = sum(worker['alerts'] for worker in stats.values())
+        start = time.perf_counter()
+        await coordinator.add_worker()
+        result['rebalance_join_s'] = round(time.perf_counter() - start, 2)
+        start = time.perf_counter()
+        await coordinator.remove_worker(min(coordinator.workers))
+        result['rebalance_leave_s'] = round(time.perf_counter() - start, 2)
+        after = sum(worker['alerts'] for worker in coordinator.stats().values())
+        result['alerts_conserved'] = held == after
+    await coordinator.stop()
+    await asyncio.to_thread(coordinator.store.close)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alerts', type=int, default=200_000)
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed = os.path.join(tmp, 'seed.db')
+        seed_store(seed, args.alerts)
+        results = {'cpu_count': os.cpu_count(), 'alerts': args.alerts}
+        for workers in args.workers:
+            path = os.path.join(tmp, f'workers{workers}.db')
+            shutil.copy(seed, path)
+            results[f'{workers}_workers'] = asyncio.run(
+                run(path, workers, args.ticks, rebalance=workers == args.workers[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Cross-rate matrix lookups vs. per-call dict arithmetic
+
+The old /convert computed each conversion from the RUB rate dict, and only
+to or from RUB. The baseline here extends that arithmetic to any pair
+(a * rates[from] / rates[to]) so both sides answer the same question.
+
+    python -m benchmarks.bench_cross_rates --conversions 1000000
+"""
+import argparse
+import json
+import random
+import time
+
+import cross_rates
+from benchmarks.stub_servers import DEFAULT_RATES
+from cross_rates import CrossRateMatrix
+
+
+def dict_convert(rates, amount, from_currency, to_currency):
+    from_rub = 1.0 if from_currency == 'RUB' else rates[from_currency]
+    to_rub = 1.0 if to_currency == 'RUB' else rates[to_currency]
+    return amount * from_rub / to_rub
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--conversions', type=int, default=1_000_000)
+    parser.add_argument('--batch', type=int, default=1000, help='amounts per batch conversion')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    currencies = list(DEFAULT_RATES) + ['RUB']
+    pairs = [(rng.uniform(1, 10_000), rng.choice(currencies), rng.choice(currencies))
+             for _ in range(args.conversions)]
+    rates = dict(DEFAULT_RATES)
+    cross_rates.load_numpy()  # NumPy is imported on first use; keep that out of the build timing
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        matrix = CrossRateMatrix(rates)
+    build_us = (time.perf_counter() - start) / 1000 * 1e6
+
+    start = time.perf_counter()
+    for amount, a, b in pairs:
+        dict_convert(rates, amount, a, b)
+    dict_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    convert = matrix.convert
+    for amount, a, b in pairs:
+        convert(amount, a, b)
+    matrix_s = time.perf_counter() - start
+
+    amounts = [amount for amount, _, _ in pairs]
+    batches = [amounts[i:i + args.batch] for i in range(0, len(amounts), args.batch)]
+    start = time.perf_counter()
+    for batch in batches:
+        [dict_convert(rates, amount, 'USD', 'EUR') for amount in batch]
+    dict_batch_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for batch in batches:
+        matrix.convert_many(batch, 'USD', 'EUR')
+    matrix_batch_s = time.perf_counter() - start
+
+    print(json.dumps({
+        'numpy': cross_rates.load_numpy() is not None,
+        'matrix_build_us': round(build_us, 2),
+        'single_ns': {
+            'dict': round(dict_s / args.conversions * 1e9, 1),
+            'matrix': round(matrix_s / args.conversions * 1e9, 1),
+        },
+        'batch_of_%d_us' % args.batch: {
+            'dict': round(dict_batch_s / len(batches) * 1e6, 1),
+            'matrix': round(matrix_batch_s / len(batches) * 1e6, 1),
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
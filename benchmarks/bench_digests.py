@@ -0,0 +1,134 @@
+"""Rate digest delivery to many subscribers against a flood-limited fake bot
+
+Subscribes N chats (mixed languages, cadences and currency sets) through a
+DigestScheduler backed by a SQLite store, reloads them as a restart would,
+then runs the tick for the first daily slot and waits until the
+NotificationDispatcher has delivered every digest. The fake bot uses a
+high global limit by default so the run finishes quickly; Telegram's real
+limit (~30 msgs/s) bounds production delivery time regardless of the bot.
+
+The baseline is a one-message-at-a-time loop that scans every
+subscription, renders each digest separately and awaits each send; it runs
+on --naive chats and is projected to N.
+
+    python -m benchmarks.bench_digests --subscribers 100000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from alert_store import SQLiteAlertStore
+from benchmarks.fake_bot import FakeBot
+from benchmarks.stub_servers import DEFAULT_RATES
+from config import CURRENCY_PAIRS
+from digests import DigestScheduler, render_digest
+from logger import logger
+from notifier import NotificationDispatcher
+from rate_cache import RateSnapshot
+from subscriptions import next_due_time
+
+CURRENCY_SETS = [list(CURRENCY_PAIRS), ['USD', 'EUR'], ['USD', 'EUR', 'CNY'], ['CNY'], ['USD'], ['BYN', 'USD']]
+
+
+def synthetic_subscriptions(count: int, seed: int = 1):
+    """(chat_id, cadence, currencies, language) with a realistic skew"""
+    rng = random.Random(seed)
+    for chat_id in range(1, count + 1):
+        cadence = 'daily' if rng.random() < 0.8 else 'hourly'
+        if rng.random() < 0.9:
+            currencies = rng.choice(CURRENCY_SETS)
+        else:
+            currencies = rng.sample(list(CURRENCY_PAIRS), rng.randint(1, len(CURRENCY_PAIRS)))
+        language = 'ru' if rng.random() < 0.7 else 'en'
+        yield chat_id, cadence, currencies, language
+
+
+async def naive(scheduler: DigestScheduler, snapshot: RateSnapshot, now: float, sample: int, args) -> dict:
+    bot = FakeBot(latency=args.latency, global_rate=args.global_rate)
+    start = time.perf_counter()
+    for subscription in list(scheduler.index.by_chat.values())[:sample]:
+        if subscription.next_due <= now:
+            text = render_digest(snapshot, subscription.language, subscription.cadence, subscription.currencies)
+            try:
+                await bot.send_message(chat_id=subscription.chat_id, text=text)
+            except Exception:
+                pass  # a plain loop has nowhere to put a failed send
+    elapsed = time.perf_counter() - start
+    return {'chats': sample, 'seconds': round(elapsed, 3),
+            'projected_seconds': round(elapsed / sample * args.subscribers, 1),
+            'delivered': len(bot.sent), 'flood_errors': bot.flood_errors}
+
+
+async def run(args, tmp: str) -> dict:
+    now = time.time()
+    snapshot = RateSnapshot.from_rates(DEFAULT_RATES)
+    store = SQLiteAlertStore(os.path.join(tmp, 'alerts.db'), batch_size=50_000)
+    scheduler = DigestScheduler(store, lambda: snapshot)
+
+    start = time.perf_counter()
+    for chat_id, cadence, currencies, language in synthetic_subscriptions(args.subscribers):
+        scheduler.subscribe(chat_id, cadence, currencies, language, now=now)
+    subscribe_s = time.perf_counter() - start
+    await asyncio.to_thread(store.flush)
+
+    restarted = DigestScheduler(store, lambda: snapshot)
+    start = time.perf_counter()
+    await restarted.load()
+    load_s = time.perf_counter() - start
+
+    # The first daily slot: every subscriber is due (hourly ones are too, on the hour)
+    slot = next_due_time('daily', now)
+    baseline = await naive(restarted, snapshot, slot, min(args.naive, args.subscribers), args)
+
+    bot = FakeBot(latency=args.latency, global_rate=args.global_rate)
+    dispatcher = NotificationDispatcher(bot, workers=args.workers, global_rate=args.global_rate * 0.9)
+    dispatcher.start()
+    restarted.notifier = dispatcher
+    start = time.perf_counter()
+    queued = await restarted.tick(now=slot)
+    tick_s = time.perf_counter() - start
+    await dispatcher.join()
+    delivery_s = time.perf_counter() - start
+    await dispatcher.stop()
+    await asyncio.to_thread(store.close)
+
+    return {
+        'subscribers': args.subscribers,
+        'subscribe_us_each': round(subscribe_s / args.subscribers * 1e6, 2),
+        'load_s': round(load_s, 3),
+        'naive_loop': baseline,
+        'scheduled': {
+            'queued': queued,
+            'distinct_renders': restarted.renders,
+            'tick_s': round(tick_s, 3),
+            'delivery_s': round(delivery_s, 3),
+            'digests_per_s': round(len(bot.sent) / delivery_s),
+            'delivered': len(bot.sent),
+            'flood_errors': bot.flood_errors,
+            'max_queue_depth': dispatcher.max_depth,
+        },
+        'still_due_after_tick': len(restarted.index.pop_due(slot)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subscribers', type=int, default=100_000)
+    parser.add_argument('--naive', type=int, default=2000, help='chats the baseline loop is run on')
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=0.005, help='fake send_message latency in seconds')
+    parser.add_argument('--global-rate', type=float, default=100_000, help='fake bot global limit, msgs/second')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        print(json.dumps(asyncio.run(run(args, tmp)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Update ingestion throughput and end-to-end latency: polling vs webhook
+
+A fake Bot API runs in-process. In polling mode updates are queued on the
+fake server and fetched with the bot's getUpdates settings; in webhook mode
+a load generator POSTs synthetic Update JSON to the ingestion endpoint.
+Each update is a /ping from its own chat, answered by sendMessage, and
+latency runs from injection until the fake server receives that reply.
+
+    python -m benchmarks.bench_ingestion --updates 2000 --rate 500
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+from telegram import Update
+from telegram.ext import Application, CommandHandler
+
+from benchmarks.fake_telegram import FAKE_TOKEN, FakeTelegramServer, command_update
+from logger import logger
+from webhook import SECRET_HEADER, WebhookIngestor
+
+
+async def ping(update: Update, context) -> None:
+    await update.message.reply_text('pong')
+
+
+def build_application(server: FakeTelegramServer, workers: int) -> Application:
+    application = (
+        Application.builder()
+        .token(FAKE_TOKEN)
+        .base_url(server.base_url)
+        .concurrent_updates(workers)
+        .connection_pool_size(workers * 2)
+        .build()
+    )
+    application.add_handler(CommandHandler('ping', ping))
+    return application
+
+
+def summarize(injected, server, started, count):
+    latencies = sorted(server_record['received_at'] - injected[server_record['chat_id']]
+                       for server_record in server.sent if server_record.get('chat_id') in injected)
+    finished = max(record['received_at'] for record in server.sent)
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    return {
+        'updates': count,
+        'answered': len(latencies),
+        'updates_per_s': round(count / (finished - started), 1),
+        'latency_ms': {'p50': round(pick(0.5), 2), 'p99': round(pick(0.99), 2), 'max': round(latencies[-1] * 1000, 2)},
+    }
+
+
+async def wait_answered(server: FakeTelegramServer, count: int, timeout: float = 120) -> None:
+    deadline = time.perf_counter() + timeout
+    while len(server.sent) < count and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def paced(count: int, rate: float):
+    start = time.perf_counter()
+    for i in range(count):
+        if rate:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield i
+
+
+async def run_polling(args) -> dict:
+    server = await FakeTelegramServer().start()
+    application = build_application(server, args.workers)
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=args.poll_interval, timeout=30)
+
+    injected = {}
+    started = time.perf_counter()
+    async for i in paced(args.updates, args.rate):
+        chat_id = 1_000_000 + i
+        injected[chat_id] = time.perf_counter()
+        server.push_update(command_update(i + 1, chat_id, '/ping'))
+    await wait_answered(server, args.updates)
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await server.stop()
+    return summarize(injected, server, started, args.updates)
+
+
+async def run_webhook(args) -> dict:
+    server = await FakeTelegramServer().start()
+    application = build_application(server, args.workers)
+    ingestor = WebhookIngestor(application, secret='bench-secret', host='127.0.0.1', port=0,
+                               workers=args.workers)
+    await application.initialize()
+    await application.start()
+    await ingestor.start()
+    url = f'http://127.0.0.1:{ingestor.server.bound_port}{ingestor.path}'
+
+    injected = {}
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        inflight = set()
+        semaphore = asyncio.Semaphore(args.connections)
+
+        async def post(i):
+            chat_id = 2_000_000 + i
+            body = json.dumps(command_update(i + 1, chat_id, '/ping'))
+            async with semaphore:
+                injected[chat_id] = time.perf_counter()
+                response = await client.post(url, content=body, headers={
+                    SECRET_HEADER: 'bench-secret', 'Content-Type': 'application/json'})
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        async for i in paced(args.updates, args.rate):
+            task = asyncio.create_task(post(i))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+        await asyncio.gather(*inflight)
+    await wait_answered(server, args.updates)
+
+    await ingestor.stop()
+    await application.stop()
+    await application.shutdown()
+    await server.stop()
+    result = summarize(injected, server, started, args.updates)
+    result['ingestor'] = ingestor.stats()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=0, help='updates per second to inject (0 = as fast as possible)')
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--connections', type=int, default=40, help='concurrent webhook connections')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="polling mode's poll_interval")
+    parser.add_argument('--mode', choices=['both', 'polling', 'webhook'], default='both')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    logging.getLogger('telegram').setLevel(logging.WARNING)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    results = {}
+    if args.mode in ('both', 'polling'):
+        results['polling'] = asyncio.run(run_polling(args))
+    if args.mode in ('both', 'webhook'):
+        results['webhook'] = asyncio.run(run_webhook(args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Inline query answers: in-process answer time and end-to-end through a fake Bot API
+
+Users type queries such as "100 usd eur" one keystroke at a time, and
+every prefix arrives as an inline query. The first part times
+InlineAnswerCache.answer alone, for cache misses and hits, and publishes a
+new snapshot every --snapshot-every queries the way the poller would,
+precomputing the most common answers. The second part runs the real CurrencyBot against the fake Bot API and the
+ISS/CBR stub. It times each keystroke from injection until
+answerInlineQuery arrives and counts upstream requests made meanwhile
+(the poller is parked for this phase, so any request would come from the
+inline path).
+
+    python -m benchmarks.bench_inline --users 2000 --e2e-queries 3000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from alert_store import SQLiteAlertStore
+from benchmarks.bench_ingestion import paced
+from benchmarks.fake_telegram import FAKE_TOKEN, FakeTelegramServer, inline_update
+from benchmarks.stub_servers import DEFAULT_RATES, StubUpstreamServer
+from bot import CurrencyBot, build_application
+from cross_rates import CrossRateCache, load_numpy
+from exchange_api import AsyncMOEXAPI
+from inline import InlineAnswerCache
+from logger import logger
+from rate_cache import RateSnapshot
+from rate_history import RateHistory
+from rendering import RateRenderer
+
+CURRENCIES = ['usd', 'eur', 'cny', 'jpy', 'byn', 'gbp', 'rub']
+
+
+def keystrokes(users: int, seed: int = 1):
+    """Every prefix of every user's query, in typing order"""
+    rng = random.Random(seed)
+    for _ in range(users):
+        source, target = rng.sample(CURRENCIES, 2)
+        amount = rng.choice(['1', '10', '100', '250', '1000', str(rng.randint(1, 5000))])
+        query = rng.choice([f"{amount} {source} {target}", f"{amount} {source} to {target}", f"{source}"])
+        for end in range(len(query) + 1):
+            yield query[:end]
+
+
+def percentiles_us(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))] / 1000, 2)
+    return {'count': len(values), 'p50': pick(0.5), 'p99': pick(0.99), 'max': round(values[-1] / 1000, 2)}
+
+
+def in_process(args) -> dict:
+    load_numpy()  # the bot preloads it at startup; keep the import out of the first miss
+    cache = InlineAnswerCache(RateRenderer(), CrossRateCache())
+    rng = random.Random(args.seed)
+    snapshot = RateSnapshot.from_rates(DEFAULT_RATES)
+    asyncio.run(cache.on_snapshot(snapshot))
+    hit_ns, miss_ns = [], []
+    for i, query in enumerate(keystrokes(args.users, args.seed)):
+        if i and i % args.snapshot_every == 0:
+            snapshot = RateSnapshot.from_rates({currency: rate * rng.uniform(0.99, 1.01)
+                                                for currency, rate in DEFAULT_RATES.items()})
+            asyncio.run(cache.on_snapshot(snapshot))
+        hits = cache.hits
+        start = time.perf_counter_ns()
+        cache.answer(snapshot, query)
+        elapsed = time.perf_counter_ns() - start
+        (hit_ns if cache.hits > hits else miss_ns).append(elapsed)
+    return {
+        'queries': len(hit_ns) + len(miss_ns),
+        'answer_us': percentiles_us(hit_ns + miss_ns),
+        'hit_us': percentiles_us(hit_ns),
+        'miss_us': percentiles_us(miss_ns),
+        'cache': cache.stats(),
+    }
+
+
+async def end_to_end(args, tmp: str) -> dict:
+    server = await FakeTelegramServer().start()
+    injected, latencies = {}, []
+
+    def on_send(record):
+        sent_at = injected.pop(record.get('inline_query_id'), None)
+        if sent_at is not None:
+            latencies.append((record['received_at'] - sent_at) * 1e9)
+
+    server.on_send = on_send
+    with StubUpstreamServer() as stub:
+        bot = CurrencyBot(
+            moex_api=AsyncMOEXAPI(stub.iss_url, stub.cbr_url),
+            store=SQLiteAlertStore(os.path.join(tmp, 'alerts.db')),
+            history=RateHistory(os.path.join(tmp, 'history')),
+            metrics_port=0,
+            snapshot_path='',
+        )
+        bot.poller.moex_interval = bot.poller.cbr_interval = 3600  # one fetch at startup, then quiet
+        application = build_application(bot, token=FAKE_TOKEN, base_url=server.base_url)
+        await application.initialize()
+        await application.post_init(application)
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+        while not bot.poller.snapshot:
+            await asyncio.sleep(0.01)
+        upstream_before = dict(stub.requests)
+
+        queries = keystrokes(args.users, args.seed + 1)
+        started = time.perf_counter()
+        async for i in paced(args.e2e_queries, args.rate):
+            update_id = i + 1
+            injected[str(update_id)] = time.perf_counter()
+            server.push_update(inline_update(update_id, 1_000_000 + i % 500, next(queries)))
+        deadline = time.perf_counter() + 30
+        while injected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        upstream = {kind: stub.requests[kind] - upstream_before[kind] for kind in stub.requests}
+
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        await application.post_shutdown(application)
+    await server.stop()
+    cache_times = {record.get('cache_time') for record in server.sent if 'inline_query_id' in record}
+    return {
+        'queries': args.e2e_queries,
+        'answered': len(latencies),
+        'queries_per_s': round(len(latencies) / elapsed, 1),
+        'latency_ms': {key: (round(value / 1000, 3) if key != 'count' else value)
+                       for key, value in percentiles_us(latencies).items()},
+        'upstream_requests_during_queries': upstream,
+        'cache_time_values': sorted(int(value) for value in cache_times if value is not None),
+        'cache': bot.inline.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000, help='users typing one query each')
+    parser.add_argument('--snapshot-every', type=int, default=5000, help='queries between new snapshots')
+    parser.add_argument('--e2e-queries', type=int, default=3000)
+    parser.add_argument('--rate', type=float, default=100, help='inline queries per second in the end-to-end run')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    logging.getLogger('telegram').setLevel(logging.WARNING)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    results = {'in_process': in_process(args)}
+    with tempfile.TemporaryDirectory() as tmp:
+        results['end_to_end'] = asyncio.run(end_to_end(args, tmp))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""ISS marketdata parse time per response: old row scan vs. indexed parser
+
+Responses are decoded from bytes and parsed into a rate dict, timing both
+steps. Payloads come from the fixture in benchmarks/fixtures, an ISS
+selt marketdata block with every column and board. It is used as-is
+(``full``), projected to the four columns the bot now requests
+(``compact``), and with extra non-tradable board rows per security
+(``multiboard``).
+
+The ``legacy`` parser is the pre-index implementation kept here as the
+baseline: json.loads, a CURRENCY_PAIRS scan per row, and eager f-string
+logs. The bot logger is set to WARNING, so neither parser emits records.
+
+    python -m benchmarks.bench_iss_parsing --repeat 2000 --extra-boards 50
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+import exchange_api
+from config import CURRENCY_PAIRS
+from exchange_api import ISS_COLUMNS, RateParser, json_loads
+from logger import logger
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'iss_selt_marketdata.json')
+
+
+def legacy_parse(data, valid_boards=('CETS', 'CNGD', 'LICU')):
+    rates = {}
+    columns = data['marketdata']['columns']
+    indices = {name: columns.index(name) for name in ('LAST', 'TRADINGSTATUS', 'BOARDID', 'SECID')}
+    for row in data['marketdata']['data']:
+        if not row:
+            continue
+        secid = row[indices['SECID']]
+        boardid = row[indices['BOARDID']]
+        trading_status = row[indices['TRADINGSTATUS']]
+        last_price = row[indices['LAST']]
+        if boardid not in valid_boards or trading_status != 'T':
+            logger.debug(f"Skipping {secid}: board={boardid}, status={trading_status}")
+            continue
+        currency = None
+        for curr, pair in CURRENCY_PAIRS.items():
+            if pair == secid:
+                currency = curr
+                break
+        if not currency:
+            continue
+        if last_price is not None:
+            price = float(last_price)
+            if price > 0:
+                if currency == 'JPY':
+                    price = price / 100
+                rates[currency] = round(price, 4)
+                logger.info(f"Using MOEX rate for {currency}: {rates[currency]} (LAST price)")
+    return rates
+
+
+def project(data, columns):
+    block = data['marketdata']
+    positions = [block['columns'].index(column) for column in columns]
+    return {'marketdata': {'columns': list(columns),
+                           'data': [[row[i] for i in positions] for row in block['data']]}}
+
+
+def add_boards(data, extra_boards):
+    block = data['marketdata']
+    board, status = block['columns'].index('BOARDID'), block['columns'].index('TRADINGSTATUS')
+    rows = list(block['data'])
+    for row in block['data']:
+        for n in range(extra_boards):
+            extra = list(row)
+            extra[board], extra[status] = f'BRD{n}', 'N'
+            rows.append(extra)
+    return {'marketdata': {'columns': block['columns'], 'data': rows}}
+
+
+def per_response_us(fn, body, repeat):
+    fn(body)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    return round((time.perf_counter() - start) / repeat * 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--extra-boards', type=int, default=50)
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    with open(FIXTURE, 'rb') as f:
+        full = json.loads(f.read())
+    payloads = {
+        'full': full,
+        'compact': project(full, ISS_COLUMNS),
+        'multiboard': add_boards(full, args.extra_boards),
+        'multiboard_compact': project(add_boards(full, args.extra_boards), ISS_COLUMNS),
+    }
+
+    rate_parser = RateParser()
+    legacy = lambda body: legacy_parse(json.loads(body))
+    indexed = lambda body: rate_parser._parse_moex_rates(json_loads(body))
+    results = {'decoder': json_loads.__module__}
+    for name, data in payloads.items():
+        body = json.dumps(data).encode()
+        assert legacy(body) == indexed(body)
+        repeat = max(1, args.repeat * 500 // len(data['marketdata']['data']))
+        results[name] = {
+            'rows': len(data['marketdata']['data']),
+            'bytes': len(body),
+            'legacy_us': per_response_us(legacy, body, repeat),
+            'indexed_us': per_response_us(indexed, body, repeat),
+        }
+    results['column_layouts_cached'] = len(exchange_api.RateParser._column_indices)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Alert fan-out through the NotificationDispatcher against a flood-limited fake bot
+
+Compares the old one-await-per-user loop with the dispatcher. The fake bot
+uses a high global limit by default so the run finishes quickly; lower
+--global-rate to watch the limiter keep RetryAfter errors at zero.
+
+    python -m benchmarks.bench_notifier --messages 5000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from benchmarks.fake_bot import FakeBot
+from logger import logger
+from notifier import NotificationDispatcher, PRIORITY_ALERT
+
+
+async def sequential(messages: int, args) -> dict:
+    bot = FakeBot(latency=args.latency, global_rate=args.global_rate)
+    start = time.perf_counter()
+    for chat_id in range(messages):
+        try:
+            await bot.send_message(chat_id=chat_id, text='🚨 Alert!')
+        except Exception:
+            pass  # the old loop only logged failures
+    elapsed = time.perf_counter() - start
+    return {'seconds': round(elapsed, 3), 'delivered': len(bot.sent), 'flood_errors': bot.flood_errors}
+
+
+async def dispatched(messages: int, args) -> dict:
+    bot = FakeBot(latency=args.latency, global_rate=args.global_rate)
+    dispatcher = NotificationDispatcher(bot, workers=args.workers, global_rate=args.global_rate * 0.9)
+    dispatcher.start()
+    start = time.perf_counter()
+    for chat_id in range(messages):
+        dispatcher.submit(chat_id, '🚨 Alert!', priority=PRIORITY_ALERT)
+    # Duplicates of pending messages are collapsed
+    for chat_id in range(min(messages, 100)):
+        dispatcher.submit(chat_id, '🚨 Alert!', priority=PRIORITY_ALERT)
+    await dispatcher.join()
+    elapsed = time.perf_counter() - start
+    await dispatcher.stop()
+    result = {'seconds': round(elapsed, 3), 'delivered': len(bot.sent), 'flood_errors': bot.flood_errors}
+    result.update(dispatcher.stats())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.02, help='fake send_message latency in seconds')
+    parser.add_argument('--global-rate', type=float, default=1000, help='fake bot global limit, msgs/second')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.ERROR)
+    results = {
+        'sequential': asyncio.run(sequential(args.messages, args)),
+        'dispatcher': asyncio.run(dispatched(args.messages, args)),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Appending and querying years of tick-level rate history
+
+Writes one currency's ticks at a fixed interval over the requested number
+of years, then times range, last-N and rollup queries and reports how much
+memory the process holds afterwards.
+
+    python -m benchmarks.bench_rate_history --years 1 --interval 10
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+
+from rate_history import RateHistory
+
+YEAR = 365 * 86400
+
+
+def timed(func, repeat: int = 20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return round((time.perf_counter() - start) / repeat * 1000, 3), len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=float, default=1.0)
+    parser.add_argument('--interval', type=float, default=10.0, help='seconds between ticks')
+    parser.add_argument('--path', help='history directory (default: a temporary directory)')
+    args = parser.parse_args()
+
+    root = args.path or tempfile.mkdtemp()
+    history = RateHistory(root, flush_records=4096)
+    ticks = int(args.years * YEAR / args.interval)
+    start_ts = time.time() - ticks * args.interval
+    rng = random.Random(1)
+
+    price = 90.0
+    start = time.perf_counter()
+    for i in range(ticks):
+        price *= 1 + rng.gauss(0, 0.0002)
+        history.append('USD', start_ts + i * args.interval, price)
+    history.flush()
+    append = time.perf_counter() - start
+
+    # Reopen so queries run against the files, not the write buffers
+    history = RateHistory(root)
+    end_ts = start_ts + ticks * args.interval
+    mid = start_ts + (end_ts - start_ts) / 2
+    queries = {
+        'range_1h_ms': timed(lambda: history.range('USD', mid, mid + 3600)),
+        'range_1d_ms': timed(lambda: history.range('USD', mid, mid + 86400)),
+        'last_100_ms': timed(lambda: history.last('USD', 100)),
+        'last_1000_1m_ms': timed(lambda: history.last('USD', 1000, '1m')),
+        'range_all_1d_ms': timed(lambda: history.range('USD', start_ts, end_ts, '1d')),
+    }
+
+    disk = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+    print(json.dumps({
+        'ticks': ticks,
+        'append_s': round(append, 3),
+        'appends_per_s': round(ticks / append),
+        'queries': {name: {'ms': ms, 'points': points} for name, (ms, points) in queries.items()},
+        'disk_mb': round(disk / 2 ** 20, 1),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
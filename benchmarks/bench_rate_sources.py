@@ -0,0 +1,106 @@
+"""Rate reads under upstream faults: sequential fallback vs. hedged aggregator
+
+ISS and CBR are served by two separate stub servers, so each can be
+delayed or made to fail on its own. Every scenario issues a series of rate
+reads, like consecutive poller ticks, through two paths:
+
+  sequential  AsyncMOEXAPI.get_exchange_rates(): MOEX first, CBR only after
+              MOEX failed or timed out
+  hedged      RateAggregator over MOEXSource + CBRSource
+
+    python -m benchmarks.bench_rate_sources --reads 40 --hedge-delay 0.2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from benchmarks.stub_servers import StubUpstreamServer
+from exchange_api import AsyncMOEXAPI
+from logger import logger
+from rate_sources import CBRSource, CircuitBreaker, MOEXSource, RateAggregator
+
+SCENARIOS = {
+    'healthy': {'iss_latency': 0.01, 'iss_errors': 0.0},
+    'moex_slow': {'iss_latency': 1.0, 'iss_errors': 0.0},
+    'moex_flaky': {'iss_latency': 0.01, 'iss_errors': 0.5},
+    'moex_down': {'iss_latency': 0.01, 'iss_errors': 1.0},
+}
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return {'p50_ms': round(pick(0.5), 1), 'p99_ms': round(pick(0.99), 1), 'max_ms': round(samples[-1] * 1000, 1)}
+
+
+async def timed_reads(read, reads, interval):
+    latencies, complete = [], 0
+    for _ in range(reads):
+        start = time.perf_counter()
+        try:
+            rates = await read()
+        except Exception:
+            rates = {}
+        latencies.append(time.perf_counter() - start)
+        complete += len(rates) == 6
+        await asyncio.sleep(interval)
+    return latencies, complete
+
+
+async def run_sequential(iss, cbr, args):
+    api = AsyncMOEXAPI(iss.iss_url, cbr.cbr_url)
+    latencies, complete = await timed_reads(api.get_exchange_rates, args.reads, args.interval)
+    await api.aclose()
+    return latencies, complete
+
+
+async def run_hedged(iss, cbr, args):
+    api = AsyncMOEXAPI(iss.iss_url, cbr.cbr_url)
+    aggregator = RateAggregator([
+        MOEXSource(api, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=args.reset_timeout)),
+        CBRSource(api),
+    ], hedge_delay=args.hedge_delay)
+    await aggregator.refresh('cbr')
+
+    async def read():
+        return (await aggregator.fetch()).rates
+
+    latencies, complete = await timed_reads(read, args.reads, args.interval)
+    await asyncio.sleep(0)
+    await api.aclose()
+    return latencies, complete, aggregator.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reads', type=int, default=40)
+    parser.add_argument('--interval', type=float, default=0.05, help='seconds between reads')
+    parser.add_argument('--hedge-delay', type=float, default=0.2)
+    parser.add_argument('--reset-timeout', type=float, default=1.0, help='MOEX breaker open time')
+    args = parser.parse_args()
+    logger.setLevel(logging.CRITICAL)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    results = {}
+    for name, scenario in SCENARIOS.items():
+        result = {}
+        for mode in ('sequential', 'hedged'):
+            with StubUpstreamServer(latency=scenario['iss_latency'], error_rate=scenario['iss_errors']) as iss, \
+                    StubUpstreamServer(latency=0.02) as cbr:
+                runner = run_sequential if mode == 'sequential' else run_hedged
+                outcome = asyncio.run(runner(iss, cbr, args))
+                latencies, complete = outcome[:2]
+                result[mode] = {**percentiles(latencies), 'complete_reads': complete,
+                                'iss_requests': iss.requests['iss'], 'cbr_requests': cbr.requests['cbr']}
+                if mode == 'hedged':
+                    stats = outcome[2]
+                    result[mode].update(hedged=stats['hedged'], wins=stats['wins'],
+                                        moex_breaker_trips=stats['sources']['moex']['trips'])
+        results[name] = result
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Cold start: time from process launch until the first command is answered
+
+Every run launches a fresh interpreter that imports the bot, starts it in
+polling mode against the fake Bot API with an /allrates update already
+queued, and stops once the reply arrives. Upstream rates come from the
+ISS/CBR stub, which can be slow or down. "warm" runs start with a
+last-known-good snapshot file on disk, "cold" runs without one.
+
+Reported per scenario (median of --runs, seconds since launch): imports
+finished, bot running, and first reply received, plus whether that reply
+carried rates.
+
+    python -m benchmarks.bench_startup --runs 5 --slow-latency 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_servers import DEFAULT_RATES, StubUpstreamServer
+
+STARTED_AT = 'BENCH_STARTED_AT'
+
+
+async def serve_first_update(tmp: str, iss_url: str, cbr_url: str, snapshot_path: str) -> dict:
+    from alert_store import SQLiteAlertStore
+    from benchmarks.fake_telegram import FAKE_TOKEN, FakeTelegramServer, command_update
+    from bot import CurrencyBot, build_application
+    from exchange_api import AsyncMOEXAPI
+    from rate_history import RateHistory
+
+    started_at = float(os.environ[STARTED_AT])
+    server = await FakeTelegramServer().start()
+    replied = asyncio.Event()
+    server.on_send = lambda record: replied.set()
+    server.push_update(command_update(1, 1_000_001, '/allrates'))
+
+    bot = CurrencyBot(
+        moex_api=AsyncMOEXAPI(iss_url, cbr_url),
+        store=SQLiteAlertStore(os.path.join(tmp, 'alerts.db')),
+        history=RateHistory(os.path.join(tmp, 'history')),
+        metrics_port=0,
+        snapshot_path=snapshot_path,
+    )
+    application = build_application(bot, token=FAKE_TOKEN, base_url=server.base_url)
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=10)
+    running = time.time() - started_at
+    await asyncio.wait_for(replied.wait(), 60)
+    first_reply = time.time() - started_at
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await application.post_shutdown(application)
+    await server.stop()
+    return {'running_s': running, 'first_reply_s': first_reply,
+            'reply_has_rates': 'USD' in server.sent[0]['text']}
+
+
+def child(args) -> None:
+    """Runs in the launched interpreter: import the bot, serve one update, print timings"""
+    import logging
+
+    import bot  # noqa: F401  (timed: this is the import cost of a real start)
+    imported = time.time() - float(os.environ[STARTED_AT])
+    from logger import logger
+    logger.setLevel(logging.WARNING)
+    logging.getLogger('telegram').setLevel(logging.WARNING)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        result = asyncio.run(serve_first_update(tmp, args.iss_url, args.cbr_url, args.snapshot_path))
+    result['imported_s'] = imported
+    print(json.dumps(result))
+
+
+def launch(stub: StubUpstreamServer, snapshot_path: str) -> dict:
+    env = dict(os.environ, **{STARTED_AT: repr(time.time())})
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_startup', '--child', '--iss-url', stub.iss_url,
+         '--cbr-url', stub.cbr_url, '--snapshot-path', snapshot_path],
+        env=env, capture_output=True, text=True, check=True, timeout=120,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def write_snapshot(path: str) -> None:
+    from rate_cache import RateSnapshot, save_snapshot
+    save_snapshot(RateSnapshot.from_rates(DEFAULT_RATES, {currency: 'moex' for currency in DEFAULT_RATES}), path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--slow-latency', type=float, default=3.0, help='stub latency in the slow-upstream scenarios')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--iss-url', help=argparse.SUPPRESS)
+    parser.add_argument('--cbr-url', help=argparse.SUPPRESS)
+    parser.add_argument('--snapshot-path', default='', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    scenarios = {
+        'cold_fast_upstream': (0.0, 0.0, False),
+        'cold_slow_upstream': (args.slow_latency, 0.0, False),
+        'warm_slow_upstream': (args.slow_latency, 0.0, True),
+        'warm_upstream_down': (0.0, 1.0, True),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (latency, error_rate, warm) in scenarios.items():
+            runs = []
+            with StubUpstreamServer(latency=latency, error_rate=error_rate) as stub:
+                for run in range(args.runs):
+                    snapshot_path = os.path.join(tmp, f'{name}-{run}.json')
+                    if warm:
+                        write_snapshot(snapshot_path)
+                    runs.append(launch(stub, snapshot_path))
+            results[name] = {
+                key: round(statistics.median(run[key] for run in runs), 3)
+                for key in ('imported_s', 'running_s', 'first_reply_s')
+            }
+            results[name]['reply_has_rates'] = all(run['reply_has_rates'] for run in runs)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
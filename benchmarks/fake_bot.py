@@ -0,0 +1,38 @@
+"""In-process stand-in for telegram.Bot used by the fan-out benchmarks"""
+import asyncio
+import time
+from collections import defaultdict, deque
+
+from telegram.error import RetryAfter
+
+
+class FakeBot:
+    """Records send_message calls and enforces Telegram-like flood limits
+
+    Exceeding ``global_rate`` messages per second overall, or ``chat_rate``
+    per chat, raises RetryAfter just as the Bot API would.
+    """
+
+    def __init__(self, latency: float = 0.01, global_rate: float = 30, chat_rate: float = 1,
+                 retry_after: int = 1):
+        self.latency = latency
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.retry_after = retry_after
+        self.sent = []
+        self.flood_errors = 0
+        self._recent = deque()
+        self._last_per_chat = defaultdict(lambda: float('-inf'))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 1.0:
+            self._recent.popleft()
+        if len(self._recent) >= self.global_rate or now - self._last_per_chat[chat_id] < 1.0 / self.chat_rate:
+            self.flood_errors += 1
+            raise RetryAfter(self.retry_after)
+        self._recent.append(now)
+        self._last_per_chat[chat_id] = now
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent.append((chat_id, text))
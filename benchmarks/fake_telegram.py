@@ -0,0 +1,151 @@
+"""In-process fake of the Telegram Bot API for load tests
+
+Point an Application at it with ``.base_url(server.base_url)``. It answers
+the methods the bot uses, long-polls getUpdates from an injectable update
+queue, and records every outgoing message with its arrival time.
+"""
+import asyncio
+import itertools
+import json
+import time
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from http_server import HTTPServer, Request, Response
+
+FAKE_TOKEN = '123456:FAKE-TOKEN'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_currency_bot'}
+
+
+def command_update(update_id: int, chat_id: int, text: str) -> dict:
+    """Synthetic Update JSON for a private-chat message"""
+    command = text.split()[0]
+    user = {'id': chat_id, 'is_bot': False, 'first_name': f'User{chat_id}', 'language_code': 'en'}
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private', 'first_name': user['first_name']},
+        'from': user,
+        'text': text,
+    }
+    if command.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return {'update_id': update_id, 'message': message}
+
+
+def inline_update(update_id: int, user_id: int, query: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'language_code': 'en'}
+    return {'update_id': update_id,
+            'inline_query': {'id': str(update_id), 'from': user, 'query': query, 'offset': ''}}
+
+
+class FakeTelegramServer:
+    """Fake Bot API: getMe, getUpdates, sendMessage, webhook methods and a few more"""
+
+    def __init__(self, token: str = FAKE_TOKEN, host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0.0):
+        self.token = token
+        self.latency = latency
+        self.server = HTTPServer(host, port)
+        self.updates: List[dict] = []
+        self.sent: List[dict] = []
+        self.calls: Dict[str, int] = {}
+        self.webhook: Dict[str, str] = {}
+        self.on_send: Optional[Callable[[dict], None]] = None
+        self._new_updates = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        for method in ('getMe', 'getUpdates', 'sendMessage', 'setWebhook', 'deleteWebhook',
+                       'getWebhookInfo', 'answerInlineQuery', 'setMyCommands', 'close', 'logOut'):
+            handler = getattr(self, '_' + method, self._ok)
+            for verb in ('GET', 'POST'):
+                self.server.route(verb, f'/bot{token}/{method}', self._wrap(method, handler))
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.server.host}:{self.server.bound_port}/bot'
+
+    async def start(self) -> 'FakeTelegramServer':
+        await self.server.start()
+        return self
+
+    async def stop(self) -> None:
+        self._new_updates.set()
+        await self.server.stop(timeout=1.0)
+
+    def push_update(self, update: dict) -> None:
+        """Queue an update for the next getUpdates call"""
+        self.updates.append(update)
+        self._new_updates.set()
+
+    def _wrap(self, method: str, handler):
+        async def wrapped(request: Request) -> Response:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            params = self._params(request)
+            if self.latency and method != 'getUpdates':
+                await asyncio.sleep(self.latency)
+            result = await handler(params)
+            return Response(200, json.dumps({'ok': True, 'result': result}).encode(), 'application/json')
+        return wrapped
+
+    @staticmethod
+    def _params(request: Request) -> dict:
+        if not request.body:
+            return dict(request.query)
+        if request.headers.get('content-type', '').startswith('application/json'):
+            return json.loads(request.body)
+        return dict(parse_qsl(request.body.decode()))
+
+    async def _ok(self, params: dict):
+        return True
+
+    async def _getMe(self, params: dict):
+        return BOT_USER
+
+    async def _getWebhookInfo(self, params: dict):
+        return {'url': self.webhook.get('url', ''), 'has_custom_certificate': False, 'pending_update_count': 0}
+
+    async def _setWebhook(self, params: dict):
+        self.webhook = params
+        return True
+
+    async def _deleteWebhook(self, params: dict):
+        self.webhook = {}
+        if params.get('drop_pending_updates') in ('true', 'True', True):
+            self.updates.clear()
+        return True
+
+    async def _getUpdates(self, params: dict):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        limit = int(params.get('limit') or 100)
+        if offset:
+            self.updates = [u for u in self.updates if u['update_id'] >= offset]
+        if not self.updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:limit]
+
+    async def _sendMessage(self, params: dict):
+        chat_id = int(params['chat_id'])
+        record = {'chat_id': chat_id, 'text': params.get('text', ''), 'received_at': time.perf_counter()}
+        self.sent.append(record)
+        if self.on_send is not None:
+            self.on_send(record)
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': record['text'],
+        }
+
+    async def _answerInlineQuery(self, params: dict):
+        record = {'inline_query_id': params.get('inline_query_id'), 'results': params.get('results'),
+                  'cache_time': params.get('cache_time'), 'received_at': time.perf_counter()}
+        self.sent.append(record)
+        if self.on_send is not None:
+            self.on_send(record)
+        return True
@@ -0,0 +1,299 @@
+"""End-to-end load test of CurrencyBot against simulated Telegram and MOEX/CBR
+
+The real CurrencyBot (handlers, middleware, poller, alert store) runs
+against a local ISS/CBR stub and the in-process fake Bot API. A seeded
+generator sends a configurable mix of /allrates, /convert and /setalert
+from a pool of users, either through getUpdates (polling) or as webhook
+POSTs. Latency runs from injection until the fake server receives the
+reply; replies are matched to requests per chat in arrival order.
+
+The JSON report (throughput, latency percentiles per command, memory,
+upstream and Bot API call counts, middleware counters) is tagged with the
+current commit so runs can be compared between commits.
+
+    python -m benchmarks.loadtest --requests 5000 --rate 500 --mix allrates=0.5,convert=0.3,setalert=0.2
+    python -m benchmarks.loadtest --mode webhook --upstream-latency 0.05 --output before.json
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from alert_store import SQLiteAlertStore
+from benchmarks.bench_ingestion import paced
+from benchmarks.fake_telegram import FAKE_TOKEN, FakeTelegramServer, command_update
+from benchmarks.stub_servers import DEFAULT_RATES, StubUpstreamServer
+from bot import CurrencyBot, build_application
+from exchange_api import AsyncMOEXAPI
+from logger import logger
+from middleware import THROTTLED_MESSAGE
+from rate_history import RateHistory
+from webhook import SECRET_HEADER, WebhookIngestor, serve_webhook
+
+CURRENCIES = sorted(DEFAULT_RATES) + ['RUB']
+WEBHOOK_SECRET = 'loadtest-secret'
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Parse ``allrates=0.5,convert=0.3,setalert=0.2`` into normalised weights"""
+    mix = {}
+    for part in text.split(','):
+        command, _, weight = part.partition('=')
+        if command not in ('allrates', 'convert', 'setalert'):
+            raise argparse.ArgumentTypeError(f"unknown command in mix: {command}")
+        mix[command] = float(weight or 1)
+    total = sum(mix.values())
+    if total <= 0:
+        raise argparse.ArgumentTypeError("mix weights must add up to more than 0")
+    return {command: weight / total for command, weight in mix.items()}
+
+
+def workload(count: int, users: int, mix: Dict[str, float], seed: int):
+    """Yield (chat_id, command, text) for a seeded random request stream"""
+    rng = random.Random(seed)
+    commands, weights = list(mix), list(mix.values())
+    for _ in range(count):
+        chat_id = 1_000_000 + rng.randrange(users)
+        command = rng.choices(commands, weights)[0]
+        if command == 'convert':
+            source, target = rng.sample(CURRENCIES, 2)
+            text = f"/convert {rng.randint(1, 10_000)} {source} to {target}"
+        elif command == 'setalert':
+            currency = rng.choice(sorted(DEFAULT_RATES))
+            # Thresholds away from the stub's rates, so no alert fires and adds unmatched replies
+            if rng.random() < 0.5:
+                text = f"/setalert {currency} > {DEFAULT_RATES[currency] * rng.uniform(1.1, 2.0):.4f}"
+            else:
+                text = f"/setalert {currency} < {DEFAULT_RATES[currency] * rng.uniform(0.1, 0.9):.4f}"
+        else:
+            text = '/allrates'
+        yield chat_id, command, text
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2)
+    return {'count': len(values), 'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99),
+            'max': round(values[-1] * 1000, 2)}
+
+
+def rss_mb() -> float:
+    """Current resident set size; falls back to the peak where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if platform.system() == 'Darwin' else peak / 2**10
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class ReplyTracker:
+    """Matches sendMessage calls on the fake server to injected requests, per chat in order"""
+
+    def __init__(self):
+        self.pending: Dict[int, collections.deque] = collections.defaultdict(collections.deque)
+        self.latencies: Dict[str, List[float]] = collections.defaultdict(list)
+        self.throttled = 0
+        self.unmatched = 0
+        self.replies = 0
+        self.last_reply = 0.0
+
+    def injected(self, chat_id: int, command: str) -> None:
+        self.pending[chat_id].append((command, time.perf_counter()))
+
+    def on_send(self, record: dict) -> None:
+        self.replies += 1
+        self.last_reply = record['received_at']
+        queue = self.pending.get(record['chat_id'])
+        if not queue:
+            self.unmatched += 1
+            return
+        command, sent_at = queue.popleft()
+        if record['text'] == THROTTLED_MESSAGE:
+            self.throttled += 1
+            return
+        self.latencies[command].append(record['received_at'] - sent_at)
+
+    def answered(self) -> int:
+        return sum(len(values) for values in self.latencies.values())
+
+
+async def wait_idle(bot: CurrencyBot, tracker: ReplyTracker, count: int, timeout: float) -> None:
+    """Wait until every request went through the middleware and replies stopped arriving"""
+    deadline = time.perf_counter() + timeout
+    middleware = bot.middleware
+    while time.perf_counter() < deadline:
+        handled = middleware.served + middleware.dropped
+        if handled >= count and not middleware.busy and tracker.answered() >= middleware.served:
+            return
+        await asyncio.sleep(0.01)
+    logger.warning("Load test timed out waiting for replies")
+
+
+async def inject_polling(server: FakeTelegramServer, tracker: ReplyTracker, args) -> None:
+    requests = workload(args.requests, args.users, args.mix, args.seed)
+    async for i in paced(args.requests, args.rate):
+        chat_id, command, text = next(requests)
+        tracker.injected(chat_id, command)
+        server.push_update(command_update(i + 1, chat_id, text))
+
+
+async def inject_webhook(url: str, tracker: ReplyTracker, args) -> None:
+    requests = workload(args.requests, args.users, args.mix, args.seed)
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    semaphore = asyncio.Semaphore(args.connections)
+    inflight = set()
+
+    async def post(client, i, chat_id, command, text):
+        body = json.dumps(command_update(i + 1, chat_id, text))
+        async with semaphore:
+            tracker.injected(chat_id, command)
+            response = await client.post(url, content=body, headers={
+                SECRET_HEADER: WEBHOOK_SECRET, 'Content-Type': 'application/json'})
+            response.raise_for_status()
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async for i in paced(args.requests, args.rate):
+            task = asyncio.create_task(post(client, i, *next(requests)))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+        await asyncio.gather(*inflight)
+
+
+async def run(args, tmp: str) -> dict:
+    server = await FakeTelegramServer(latency=args.telegram_latency).start()
+    tracker = ReplyTracker()
+    server.on_send = tracker.on_send
+
+    with StubUpstreamServer(latency=args.upstream_latency) as stub:
+        bot = CurrencyBot(
+            moex_api=AsyncMOEXAPI(stub.iss_url, stub.cbr_url),
+            store=SQLiteAlertStore(os.path.join(tmp, 'alerts.db')),
+            history=RateHistory(os.path.join(tmp, 'history')),
+            metrics_port=0,
+            snapshot_path=os.path.join(tmp, 'snapshot.json'),
+        )
+        application = build_application(bot, token=FAKE_TOKEN, base_url=server.base_url)
+        rss_before = rss_mb()
+
+        if args.mode == 'webhook':
+            stop_event = asyncio.Event()
+            ingestor = WebhookIngestor(application, secret=WEBHOOK_SECRET, host='127.0.0.1', port=0)
+            serving = asyncio.create_task(serve_webhook(application, stop_event, url='https://loadtest.invalid',
+                                                        ingestor=ingestor))
+            # setWebhook is the last startup step, after the ingestor is listening
+            while not server.calls.get('setWebhook') or not bot.poller.snapshot:
+                await asyncio.sleep(0.01)
+            started = time.perf_counter()
+            await inject_webhook(f'http://127.0.0.1:{ingestor.server.bound_port}{ingestor.path}', tracker, args)
+        else:
+            await application.initialize()
+            await application.post_init(application)
+            await application.start()
+            await application.updater.start_polling(poll_interval=args.poll_interval, timeout=30)
+            while not bot.poller.snapshot:
+                await asyncio.sleep(0.01)
+            started = time.perf_counter()
+            await inject_polling(server, tracker, args)
+
+        await wait_idle(bot, tracker, args.requests, args.timeout)
+        elapsed = (tracker.last_reply or time.perf_counter()) - started
+        rss_after = rss_mb()
+        middleware = bot.middleware.stats()
+        sources = bot.rate_sources.stats()
+
+        if args.mode == 'webhook':
+            stop_event.set()
+            await serving
+        else:
+            await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+            await application.post_shutdown(application)
+        upstream = dict(stub.requests)
+    await server.stop()
+
+    everything = [latency for values in tracker.latencies.values() for latency in values]
+    return {
+        'answered': len(everything),
+        'throttled': tracker.throttled,
+        'unmatched_replies': tracker.unmatched,
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_s': round(len(everything) / elapsed, 1) if elapsed > 0 else None,
+        'latency_ms': percentiles(everything),
+        'latency_ms_by_command': {command: percentiles(values)
+                                  for command, values in sorted(tracker.latencies.items())},
+        'memory_mb': {'rss_before': round(rss_before, 1), 'rss_after': round(rss_after, 1),
+                      'peak_rss': round(peak_rss_mb(), 1)},
+        'upstream_requests': upstream,
+        'telegram_calls': dict(sorted(server.calls.items())),
+        'middleware': middleware,
+        'rate_sources': {'hedged': sources['hedged'], 'wins': sources['wins']},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=2000, help='distinct users sending the requests')
+    parser.add_argument('--rate', type=float, default=500, help='requests per second to inject (0 = as fast as possible)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('allrates=0.5,convert=0.3,setalert=0.2'),
+                        help='command weights, e.g. allrates=0.5,convert=0.3,setalert=0.2')
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default='polling')
+    parser.add_argument('--upstream-latency', type=float, default=0.0, help='seconds added to every ISS/CBR response')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='seconds added to every Bot API call')
+    parser.add_argument('--connections', type=int, default=40, help='concurrent webhook connections')
+    parser.add_argument('--poll-interval', type=float, default=0.0, help="polling mode's poll_interval")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=120, help='seconds to wait for outstanding replies')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    logging.getLogger('telegram').setLevel(logging.WARNING)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        result = asyncio.run(run(args, tmp))
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': {'requests': args.requests, 'users': args.users, 'rate': args.rate, 'mix': args.mix,
+                   'mode': args.mode, 'upstream_latency': args.upstream_latency,
+                   'telegram_latency': args.telegram_latency, 'seed': args.seed},
+        'result': result,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
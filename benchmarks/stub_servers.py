@@ -0,0 +1,127 @@
+"""Local stand-ins for the MOEX ISS and CBR endpoints used by the benchmarks"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence
+from urllib.parse import parse_qs, urlsplit
+
+from config import CURRENCY_PAIRS
+
+DEFAULT_RATES = {
+    'USD': 92.15,
+    'EUR': 99.80,
+    'CNY': 12.61,
+    'JPY': 0.6132,
+    'BYN': 28.05,
+    'GBP': 116.40,
+}
+
+MARKETDATA_COLUMNS = ['SECID', 'BOARDID', 'BID', 'OFFER', 'LAST', 'TRADINGSTATUS', 'UPDATETIME']
+
+
+def iss_payload(rates: Optional[Dict[str, float]] = None, extra_boards: int = 0,
+                columns: Optional[Sequence[str]] = None) -> dict:
+    """Build an ISS securities.json body; extra_boards adds non-tradable rows per security
+
+    ``columns`` projects the marketdata block like ISS ``marketdata.columns``.
+    """
+    rates = rates or DEFAULT_RATES
+    rows = []
+    for currency, secid in CURRENCY_PAIRS.items():
+        price = rates[currency] * (100 if currency == 'JPY' else 1)
+        for board in range(extra_boards):
+            rows.append([secid, f'BRD{board}', None, None, None, 'N', '10:00:00'])
+        rows.append([secid, 'CETS', price - 0.01, price + 0.01, price, 'T', '10:00:00'])
+    if columns:
+        positions = [MARKETDATA_COLUMNS.index(column) for column in columns]
+        return {'marketdata': {'columns': list(columns),
+                               'data': [[row[i] for i in positions] for row in rows]}}
+    return {'marketdata': {'columns': MARKETDATA_COLUMNS, 'data': rows}}
+
+
+def cbr_payload(rates: Optional[Dict[str, float]] = None) -> dict:
+    rates = rates or DEFAULT_RATES
+    valute = {}
+    for currency, rate in rates.items():
+        nominal = 100 if currency == 'JPY' else 1
+        valute[currency] = {'CharCode': currency, 'Nominal': nominal, 'Value': rate * nominal}
+    return {'Valute': valute}
+
+
+class StubUpstreamServer:
+    """Threaded HTTP server answering ISS and CBR requests with configurable latency and errors
+
+    ``latency`` is added to every response; ``error_rate`` is the fraction of
+    requests answered with HTTP 503. Both can be changed while running.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, extra_boards: int = 0,
+                 rates: Optional[Dict[str, float]] = None, host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rates = dict(rates or DEFAULT_RATES)
+        self.extra_boards = extra_boards
+        self.requests = {'iss': 0, 'cbr': 0}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                kind = 'cbr' if 'daily_json' in self.path else 'iss'
+                with stub._lock:
+                    stub.requests[kind] += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.error_rate and random.random() < stub.error_rate:
+                    self._send(503, b'{}')
+                    return
+                if kind == 'cbr':
+                    body = cbr_payload(stub.rates)
+                else:
+                    query = parse_qs(urlsplit(self.path).query)
+                    columns = query.get('marketdata.columns', [''])[0]
+                    body = iss_payload(stub.rates, stub.extra_boards,
+                                       columns.split(',') if columns else None)
+                self._send(200, json.dumps(body).encode())
+
+            def _send(self, status, body):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (timeout, hedge winner, process exit)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def iss_url(self) -> str:
+        return f'{self.url}/iss/engines/currency/markets/selt/securities.json'
+
+    @property
+    def cbr_url(self) -> str:
+        return f'{self.url}/daily_json.js'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
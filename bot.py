@@ -1,4 +1,7 @@
 import asyncio
+import math
+from datetime import datetime
+from typing import Optional
 from telegram import __version__ as TG_VER
 
 try:
@@ -13,18 +16,182 @@ if __version_info__ < (20, 0, 0, "alpha", 1):
     )
 
 from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
-from config import TELEGRAM_BOT_TOKEN
-from exchange_api import MOEXAPI
-from utils import format_currency_message
+from telegram.ext import Application, CommandHandler, ContextTypes, InlineQueryHandler
+from config import (
+    TELEGRAM_BOT_TOKEN, CURRENCY_PAIRS, BOT_RUN_MODE, UPDATE_WORKERS, CLUSTER_WORKERS, METRICS_PORT,
+    SNAPSHOT_PATH
+)
+from alert_engine import AlertEngine
+from alert_store import AlertStore, create_alert_store
+from cross_rates import CrossRateCache, load_numpy
+from digests import DigestScheduler, digest_language
+from inline import InlineAnswerCache
+from exchange_api import AsyncMOEXAPI
+from notifier import NotificationDispatcher, PRIORITY_ALERT
+from poller import RatePoller
+from rate_cache import RateCache, RateSnapshot, load_snapshot, save_snapshot
+from rate_sources import default_sources
+from rate_history import RateHistory, RESOLUTIONS
+from rendering import RateRenderer
+from subscriptions import CADENCES
+from utils import format_history_message, format_chart_message, format_alert_message
+from metrics import ALERT_EVALUATION, INLINE_ANSWER, REGISTRY, MetricsServer
+from middleware import CommandMiddleware
 from logger import logger
 
 class CurrencyBot:
-    def __init__(self):
-        self.moex_api = MOEXAPI()
-        self.alerts = {}  # Structure: {user_id: {currency: (threshold, above/below)}}
+    def __init__(self, moex_api: Optional[AsyncMOEXAPI] = None, store: Optional[AlertStore] = None,
+                 history: Optional[RateHistory] = None, metrics_port: int = METRICS_PORT,
+                 snapshot_path: str = SNAPSHOT_PATH):
+        self.moex_api = moex_api or AsyncMOEXAPI()
+        self.rate_sources = default_sources(self.moex_api)
+        self.rate_cache = RateCache(self._fetch_rates)
+        self.poller = RatePoller(self.rate_sources, self.rate_cache)
+        self.renderer = RateRenderer()
+        self.poller.subscribe(self.renderer.on_snapshot)
+        self.history = history or RateHistory()
+        self.cross_rates = CrossRateCache()
+        self.inline = InlineAnswerCache(self.renderer, self.cross_rates)
+        self.poller.subscribe(self.inline.on_snapshot)
+        self.poller.subscribe(self.record_history)
+        self.alerts = AlertEngine()
+        self.store = store or create_alert_store()
+        # With CLUSTER_WORKERS set, alerts live in worker processes instead of self.alerts
+        self.cluster = None
+        if CLUSTER_WORKERS:
+            from cluster import ClusterCoordinator  # multiprocessing is only needed in cluster mode
+            self.cluster = ClusterCoordinator(self.store)
+        self.poller.subscribe(self.check_alerts if self.cluster is None else self.cluster.on_snapshot)
+        self.snapshot_path = snapshot_path
+        if snapshot_path:
+            self.poller.subscribe(self.persist_snapshot)
+        self.digests = DigestScheduler(self.store, lambda: self.poller.snapshot)
+        self._load_task: Optional[asyncio.Task] = None
+        self._digest_load_task: Optional[asyncio.Task] = None
+        self.notifier: Optional[NotificationDispatcher] = None  # created once the Telegram bot exists
+        self.middleware = CommandMiddleware()
+        self.metrics_port = metrics_port
+        self.metrics_server: Optional[MetricsServer] = None
+        self.register_metrics()
+        self.warm_start()
         logger.info("CurrencyBot initialized")
 
+    def warm_start(self) -> None:
+        """Serve the last-known-good snapshot from disk until the first poll completes"""
+        snapshot = load_snapshot(self.snapshot_path) if self.snapshot_path else None
+        if snapshot is not None:
+            # Published into the cache only, so handlers serve it through poller.snapshot while
+            # snapshot listeners (alerts, history, renderer) wait for live rates
+            self.rate_cache.publish(snapshot)
+            logger.info(f"Warm start from a snapshot taken {snapshot.age():.0f}s ago")
+
+    def register_metrics(self) -> None:
+        """Expose component counters on /metrics; they are read at scrape time"""
+        REGISTRY.callback('bot_rate_cache_hit_ratio', 'Share of handler rate lookups served without an upstream fetch',
+                          'gauge', lambda: self.rate_cache.stats()['hit_ratio'])
+        REGISTRY.callback('bot_render_cache_hit_ratio', 'Share of rate messages served pre-rendered',
+                          'gauge', lambda: self.renderer.stats()['hit_ratio'])
+        REGISTRY.callback('bot_inline_cache_hit_ratio', 'Share of inline queries answered from cache',
+                          'gauge', lambda: self.inline.stats()['hit_ratio'])
+        REGISTRY.callback('bot_cross_rate_builds_total', 'Cross-rate matrices built',
+                          'counter', lambda: self.cross_rates.builds)
+        REGISTRY.callback('bot_snapshot_age_seconds', 'Age of the current rate snapshot',
+                          'gauge', lambda: self.poller.snapshot.age() if self.poller.snapshot else None)
+        REGISTRY.callback('bot_poll_staleness_seconds', 'Seconds since each polling loop last succeeded',
+                          'gauge', lambda: {loop: age for loop, age in self.poller.staleness().items()
+                                            if loop != 'snapshot' and age is not None},
+                          ['loop'])
+        REGISTRY.callback('bot_notification_queue_depth', 'Notifications waiting to be sent',
+                          'gauge', lambda: self.notifier.depth if self.notifier else 0)
+        REGISTRY.callback('bot_notifications_total', 'Notifications by outcome', 'counter',
+                          lambda: {outcome: self.notifier.stats()[outcome] if self.notifier else 0
+                                   for outcome in ('sent', 'failed', 'retried', 'dropped')},
+                          ['outcome'])
+        REGISTRY.callback('bot_commands_total', 'Commands by middleware outcome', 'counter',
+                          lambda: {outcome: getattr(self.middleware, outcome)
+                                   for outcome in ('served', 'dropped', 'coalesced')},
+                          ['outcome'])
+        REGISTRY.callback('bot_alerts', 'Active alerts, summed over the workers in cluster mode', 'gauge',
+                          lambda: len(self.alerts) if self.cluster is None
+                          else sum(worker['alerts'] for worker in self.cluster.stats().values()))
+        REGISTRY.callback('bot_cluster_worker_alerts', 'Active alerts held by each cluster worker', 'gauge',
+                          lambda: {str(worker_id): worker['alerts']
+                                   for worker_id, worker in self.cluster.stats().items()} if self.cluster else None,
+                          ['worker'])
+        REGISTRY.callback('bot_digest_subscriptions', 'Chats subscribed to rate digests',
+                          'gauge', lambda: len(self.digests))
+        REGISTRY.callback('bot_digests_queued_total', 'Rate digests queued for sending',
+                          'counter', lambda: self.digests.queued)
+        REGISTRY.callback('bot_rate_source_circuit_open', 'Whether a rate source circuit breaker is open',
+                          'gauge', lambda: {source.name: source.breaker.state == 'open'
+                                            for source in self.rate_sources.sources},
+                          ['source'])
+
+    async def _fetch_rates(self) -> RateSnapshot:
+        """Fetch rates upstream without blocking the event loop"""
+        return await self.rate_sources.fetch()
+
+    async def get_snapshot(self) -> RateSnapshot:
+        """Return the current snapshot, from the poller when it has published one"""
+        snapshot = self.rate_cache.current()
+        if snapshot is None:
+            # Poller has not published yet; fall back to a coalesced fetch
+            snapshot = await self.rate_cache.get()
+        return snapshot
+
+    async def post_init(self, application: Application) -> None:
+        """Start background rate polling and notification senders once the application is running"""
+        # Polling goes first: the first snapshot is fetched while the rest starts up
+        self.poller.start()
+        self.notifier = NotificationDispatcher(application.bot)
+        self.notifier.start()
+        self.digests.start(self.notifier)
+        self._digest_load_task = asyncio.create_task(self.digests.load())
+        if self.metrics_port:
+            self.metrics_server = MetricsServer(port=self.metrics_port)
+            await self.metrics_server.start()
+        if self.cluster is not None:
+            self._load_task = asyncio.create_task(self.cluster.start(CLUSTER_WORKERS, self.notifier))
+        else:
+            last_id = await asyncio.to_thread(self.store.last_id)
+            self.alerts.reserve_ids(last_id)
+            self._load_task = asyncio.create_task(self.load_alerts(last_id))
+        # Import NumPy for the cross-rate matrix in the background rather than on the first /convert
+        asyncio.get_running_loop().run_in_executor(None, load_numpy)
+
+    async def load_alerts(self, last_id: int) -> None:
+        """Load stored alerts into a new engine off the event loop, then swap it in"""
+        try:
+            engine = AlertEngine()
+            loaded = await asyncio.to_thread(self._read_alerts, engine, last_id)
+            # Alerts set while loading move over; the loaded ones are evaluated from the next snapshot
+            engine.merge(self.alerts)
+            self.alerts = engine
+            logger.info(f"Loaded {loaded} stored alerts")
+        except Exception as e:
+            logger.error(f"Error loading stored alerts: {str(e)}")
+
+    def _read_alerts(self, engine: AlertEngine, last_id: int) -> int:
+        """Page alerts stored before startup into engine; newer ones already live in self.alerts"""
+        loaded = 0
+        for page in self.store.iter_pages():
+            loaded += engine.bulk_restore([alert for alert in page if alert.alert_id <= last_id])
+        return loaded
+
+    async def shutdown(self, application: Application) -> None:
+        """Stop polling, drain notifications and release upstream connections when the application stops"""
+        await self.poller.stop()
+        await self.digests.stop()
+        if self.notifier is not None:
+            await self.notifier.stop()
+        if self.cluster is not None:
+            await self.cluster.stop()
+        await asyncio.to_thread(self.store.close)
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await asyncio.to_thread(self.history.flush)
+        await self.moex_api.aclose()
+
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle the /start command"""
         try:
@@ -40,10 +207,16 @@ class CurrencyBot:
                 "/bynrate - Get BYN rate\n"
                 "/gbprate - Get GBP rate\n"
                 "/allrates - Get all rates\n"
-                "/convert - Convert currencies (e.g., /convert 100 USD to RUB)\n"
-                "/setalert - Set rate alert (e.g., /setalert USD > 100)"
+                "/convert - Convert currencies (e.g., /convert 100 EUR to CNY)\n"
+                "/convertbatch - Convert several amounts (e.g., /convertbatch 100 250 USD to EUR)\n"
+                "/setalert - Set rate alert (e.g., /setalert USD > 100)\n"
+                "/subscribe - Rate digests (e.g., /subscribe daily USD EUR)\n"
+                "/unsubscribe - Stop rate digests\n"
+                "/history - Recent rates (e.g., /history USD 1h 10)\n"
+                "/chart - Rate chart (e.g., /chart USD 1d)"
             )
             await update.message.reply_text(welcome_message)
+            self.store.save_user(update.effective_user.id, update.effective_user.language_code)
             logger.info(f"New user started the bot: {update.effective_user.id}")
         except Exception as e:
             logger.error(f"Error in start command: {str(e)}")
@@ -58,18 +231,19 @@ class CurrencyBot:
             logger.error(f"Error in stop command: {str(e)}")
             await update.message.reply_text("An error occurred. Please try again.")
 
+    async def single_rate_message(self, currency: str) -> str:
+        message = self.renderer.single(await self.get_snapshot(), currency)
+        if message is None:
+            message = f"Sorry, unable to fetch {currency} rate at the moment."
+        return message
+
+    async def all_rates_message(self) -> str:
+        return self.renderer.all_rates(await self.get_snapshot())
+
     async def get_single_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE, currency: str) -> None:
         """Handle single currency rate requests"""
         try:
-            logger.info(f"Fetching {currency} rate...")
-            rates = self.moex_api.get_exchange_rates()
-            logger.debug(f"Received rates: {rates}")
-
-            if rates and rates.get(currency):
-                message = format_currency_message({currency: rates[currency]})
-            else:
-                message = f"Sorry, unable to fetch {currency} rate at the moment."
-
+            message = await self.middleware.shared(('rate', currency), lambda: self.single_rate_message(currency))
             await update.message.reply_text(message)
             logger.info(f"User {update.effective_user.id} requested {currency} rate")
         except Exception as e:
@@ -79,11 +253,7 @@ class CurrencyBot:
     async def get_all_rates(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle all rates request"""
         try:
-            logger.info("Fetching all rates...")
-            rates = self.moex_api.get_exchange_rates()
-            logger.debug(f"Received rates: {rates}")
-
-            message = format_currency_message(rates)
+            message = await self.middleware.shared('allrates', self.all_rates_message)
             await update.message.reply_text(message)
             logger.info(f"User {update.effective_user.id} requested all rates")
         except Exception as e:
@@ -108,26 +278,78 @@ class CurrencyBot:
     async def gbp_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await self.get_single_rate(update, context, 'GBP')
 
-    async def check_alerts(self) -> None:
-        """Check all alerts against current rates"""
+    async def check_alerts(self, snapshot: RateSnapshot) -> None:
+        """Check all alerts against a newly published snapshot and queue notifications"""
+        rates = snapshot.rates
+        with ALERT_EVALUATION.time():
+            triggered = self.alerts.evaluate(rates)
+        kept = 0
+        for alert in triggered:
+            text = format_alert_message(alert, rates[alert.currency])
+            if (not self.notifier.submit(alert.user_id, text, priority=PRIORITY_ALERT)
+                    and not self.notifier.is_pending(alert.user_id, text)):
+                # Refused for lack of room, not as a duplicate: keep the alert so the next snapshot
+                # triggers it again
+                self.alerts.restore(alert)
+                kept += 1
+            else:
+                self.store.delete(alert.alert_id)
+        if kept:
+            logger.error(f"Notification queue full, kept {kept} triggered alerts for the next snapshot")
+
+    async def persist_snapshot(self, snapshot: RateSnapshot) -> None:
+        """Keep the latest snapshot on disk for the next warm start"""
+        await asyncio.to_thread(save_snapshot, snapshot, self.snapshot_path)
+
+    async def record_history(self, snapshot: RateSnapshot) -> None:
+        """Append every published snapshot to the rate history"""
+        await asyncio.to_thread(self.history.append_snapshot, snapshot)
+
+    def _parse_history_args(self, args, default_count: int):
+        """Parse CURRENCY [RESOLUTION] [COUNT], returning None if invalid"""
+        if not args or len(args) > 3:
+            return None
+        currency = args[0].upper()
+        resolution = '1h'
+        count = default_count
+        for arg in args[1:]:
+            if arg.lower() in RESOLUTIONS:
+                resolution = arg.lower()
+            elif arg.isdigit():
+                count = min(int(arg), 100)
+            else:
+                return None
+        if currency not in CURRENCY_PAIRS or count < 1:
+            return None
+        return currency, resolution, count
+
+    async def rate_history(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Show recent rates with format: /history USD [1m|1h|1d|tick] [COUNT]"""
+        try:
+            parsed = self._parse_history_args(context.args, 10)
+            if parsed is None:
+                await update.message.reply_text("Usage: /history USD [1m|1h|1d|tick] [COUNT]")
+                return
+            currency, resolution, count = parsed
+            points = await asyncio.to_thread(self.history.last, currency, count, resolution)
+            await update.message.reply_text(format_history_message(currency, resolution, points))
+        except Exception as e:
+            logger.error(f"Error reading rate history: {str(e)}")
+            await update.message.reply_text("An error occurred. Please try again.")
+
+    async def rate_chart(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Show a rate chart with format: /chart USD [1m|1h|1d|tick] [COUNT]"""
         try:
-            rates = self.moex_api.get_exchange_rates()
-            for user_id, alerts in self.alerts.items():
-                for currency, (threshold, is_above) in alerts.items():
-                    if currency in rates:
-                        current_rate = rates[currency]
-                        if (is_above and current_rate > threshold) or (not is_above and current_rate < threshold):
-                            await self.application.bot.send_message(
-                                chat_id=user_id,
-                                text=f"🚨 Alert! {currency} rate is {'above' if is_above else 'below'} {threshold:.2f}.\n"
-                                     f"Current rate: {current_rate:.2f} RUB"
-                            )
-                            # Remove triggered alert
-                            del self.alerts[user_id][currency]
-                            if not self.alerts[user_id]:
-                                del self.alerts[user_id]
+            parsed = self._parse_history_args(context.args, 24)
+            if parsed is None:
+                await update.message.reply_text("Usage: /chart USD [1m|1h|1d|tick] [COUNT]")
+                return
+            currency, resolution, count = parsed
+            points = await asyncio.to_thread(self.history.last, currency, count, resolution)
+            await update.message.reply_text(format_chart_message(currency, resolution, points))
         except Exception as e:
-            logger.error(f"Error checking alerts: {str(e)}")
+            logger.error(f"Error drawing rate chart: {str(e)}")
+            await update.message.reply_text("An error occurred. Please try again.")
 
     async def setalert(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Set alert for currency rate with format: /setalert USD > 100"""
@@ -144,6 +366,9 @@ class CurrencyBot:
             try:
                 threshold = float(context.args[2])
             except ValueError:
+                threshold = math.nan
+            # float() also accepts 'nan' and 'inf', which no rate can cross
+            if not math.isfinite(threshold):
                 await update.message.reply_text("Please provide a valid number for the threshold")
                 return
 
@@ -155,11 +380,11 @@ class CurrencyBot:
                 await update.message.reply_text("Invalid currency. Supported currencies: USD, EUR, CNY, JPY, BYN, GBP")
                 return
 
-            user_id = update.effective_user.id
-            if user_id not in self.alerts:
-                self.alerts[user_id] = {}
-
-            self.alerts[user_id][currency] = (threshold, operator == '>')
+            if self.cluster is not None:
+                self.cluster.add_alert(update.effective_user.id, currency, threshold, operator == '>')
+            else:
+                alert = self.alerts.add(update.effective_user.id, currency, threshold, operator == '>')
+                self.store.save(alert)
             await update.message.reply_text(
                 f"Alert set! You will be notified when {currency} rate goes "
                 f"{'above' if operator == '>' else 'below'} {threshold:.2f} RUB"
@@ -169,71 +394,174 @@ class CurrencyBot:
             logger.error(f"Error setting alert: {str(e)}")
             await update.message.reply_text("An error occurred while setting the alert")
 
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Answer "@bot 100 usd eur" from the current snapshot, without any upstream I/O"""
+        query = update.inline_query
+        try:
+            snapshot = self.poller.snapshot
+            if snapshot is None:
+                await query.answer([], cache_time=0)
+                return
+            with INLINE_ANSWER.time():
+                results, cache_time = self.inline.answer(snapshot, query.query)
+            await query.answer(results, cache_time=cache_time)
+        except Exception as e:
+            logger.error(f"Error answering inline query: {str(e)}")
+
+    async def subscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Subscribe the chat to rate digests with format: /subscribe [hourly|daily] [USD EUR ...]"""
+        try:
+            args = list(context.args)
+            cadence = 'daily'
+            if args and args[0].lower() in CADENCES:
+                cadence = args.pop(0).lower()
+            currencies = [arg.upper() for arg in args] or list(CURRENCY_PAIRS)
+            if any(currency not in CURRENCY_PAIRS for currency in currencies):
+                await update.message.reply_text(
+                    "Usage: /subscribe [hourly|daily] [CURRENCY ...]\n"
+                    "Example: /subscribe daily USD EUR\n"
+                    "Supported currencies: USD, EUR, CNY, JPY, BYN, GBP"
+                )
+                return
+
+            subscription = self.digests.subscribe(update.effective_chat.id, cadence, currencies,
+                                                  digest_language(update.effective_user.language_code))
+            next_due = datetime.fromtimestamp(subscription.next_due).strftime("%d.%m.%Y %H:%M")
+            await update.message.reply_text(
+                f"Subscribed to {cadence} rate digests for {', '.join(subscription.currencies)}.\n"
+                f"Next digest: {next_due}"
+            )
+            logger.info(f"Chat {update.effective_chat.id} subscribed to {cadence} digests")
+        except Exception as e:
+            logger.error(f"Error subscribing to digests: {str(e)}")
+            await update.message.reply_text("An error occurred. Please try again.")
+
+    async def unsubscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Stop the chat's rate digests"""
+        try:
+            if self.digests.unsubscribe(update.effective_chat.id):
+                await update.message.reply_text("Unsubscribed from rate digests.")
+            else:
+                await update.message.reply_text("This chat has no rate digest subscription.")
+        except Exception as e:
+            logger.error(f"Error unsubscribing from digests: {str(e)}")
+            await update.message.reply_text("An error occurred. Please try again.")
+
+    def _parse_conversion(self, args):
+        """Parse AMOUNT [AMOUNT ...] FROM to TO, returning None if invalid"""
+        if len(args) < 4 or args[-2].lower() != 'to':
+            return None
+        amounts = [float(arg.replace(',', '.')) for arg in args[:-3]]
+        # float() also accepts 'nan', 'inf' and negatives, none of which is an amount
+        if not all(math.isfinite(amount) and amount > 0 for amount in amounts):
+            raise ValueError(f"Invalid amount in {args[:-3]}")
+        return amounts, args[-3].upper(), args[-1].upper()
+
     async def convert(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Convert between currencies using format: /convert 100 USD to RUB"""
+        """Convert between currencies using format: /convert 100 USD to EUR"""
         try:
             args = context.args
             if len(args) != 4 or args[2].lower() != 'to':
                 await update.message.reply_text("Usage: /convert 100 USD to RUB")
                 return
 
-            amount = float(args[0])
-            from_currency = args[1].upper()
-            to_currency = args[3].upper()
+            (amount,), from_currency, to_currency = self._parse_conversion(args)
+            matrix = self.cross_rates.get(await self.get_snapshot())
 
-            if to_currency != 'RUB' and from_currency != 'RUB':
-                await update.message.reply_text("One currency must be RUB")
+            if from_currency not in matrix:
+                await update.message.reply_text(f"Cannot convert from {from_currency}")
+                return
+            if to_currency not in matrix:
+                await update.message.reply_text(f"Cannot convert to {to_currency}")
                 return
 
-            rates = self.moex_api.get_exchange_rates()
+            result = matrix.convert(amount, from_currency, to_currency)
+            await update.message.reply_text(f"{amount:.2f} {from_currency} = {result:.2f} {to_currency}")
 
-            if from_currency == 'RUB':
-                if to_currency not in rates:
-                    await update.message.reply_text(f"Cannot convert to {to_currency}")
-                    return
-                result = amount / rates[to_currency]
-                await update.message.reply_text(f"{amount:.2f} RUB = {result:.2f} {to_currency}")
-            else:
-                if from_currency not in rates:
-                    await update.message.reply_text(f"Cannot convert from {from_currency}")
-                    return
-                result = amount * rates[from_currency]
-                await update.message.reply_text(f"{amount:.2f} {from_currency} = {result:.2f} RUB")
+        except (ValueError, KeyError) as e:
+            logger.error(f"Conversion error: {str(e)}")
+            await update.message.reply_text("Invalid currency or amount")
+
+    async def convert_batch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Convert several amounts at once using format: /convertbatch 100 250 1000 USD to EUR"""
+        try:
+            parsed = self._parse_conversion(context.args)
+            if parsed is None or not parsed[0] or len(parsed[0]) > 50:
+                await update.message.reply_text("Usage: /convertbatch 100 250 1000 USD to EUR (up to 50 amounts)")
+                return
+
+            amounts, from_currency, to_currency = parsed
+            matrix = self.cross_rates.get(await self.get_snapshot())
+            if from_currency not in matrix or to_currency not in matrix:
+                await update.message.reply_text(f"Cannot convert {from_currency} to {to_currency}")
+                return
+
+            results = matrix.convert_many(amounts, from_currency, to_currency)
+            await update.message.reply_text("\n".join(
+                f"{amount:.2f} {from_currency} = {result:.2f} {to_currency}"
+                for amount, result in zip(amounts, results)
+            ))
 
         except (ValueError, KeyError) as e:
             logger.error(f"Conversion error: {str(e)}")
             await update.message.reply_text("Invalid currency or amount")
 
+def build_application(bot: CurrencyBot, token: str = TELEGRAM_BOT_TOKEN,
+                      base_url: Optional[str] = None) -> Application:
+    """Create the Application and register the bot's command handlers"""
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(UPDATE_WORKERS)
+        .post_init(bot.post_init)
+        .post_shutdown(bot.shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+    bot.application = application # Added this line to pass application instance to CurrencyBot
+
+    # Add command handlers
+    logger.info("Setting up command handlers...")
+    guard = bot.middleware.wrap  # per-user/per-chat limits and bounded concurrency
+    application.add_handler(CommandHandler("start", guard(bot.start)))
+    application.add_handler(CommandHandler("stop", guard(bot.stop)))
+    application.add_handler(CommandHandler("usdrate", guard(bot.usd_rate)))
+    application.add_handler(CommandHandler("eurrate", guard(bot.eur_rate)))
+    application.add_handler(CommandHandler("cnyrate", guard(bot.cny_rate)))
+    application.add_handler(CommandHandler("jpyrate", guard(bot.jpy_rate)))
+    application.add_handler(CommandHandler("bynrate", guard(bot.byn_rate)))
+    application.add_handler(CommandHandler("gbprate", guard(bot.gbp_rate)))
+    application.add_handler(CommandHandler("allrates", guard(bot.get_all_rates)))
+    application.add_handler(CommandHandler("convert", guard(bot.convert)))
+    application.add_handler(CommandHandler("convertbatch", guard(bot.convert_batch)))
+    application.add_handler(CommandHandler("setalert", guard(bot.setalert)))
+    application.add_handler(CommandHandler("subscribe", guard(bot.subscribe)))
+    application.add_handler(CommandHandler("unsubscribe", guard(bot.unsubscribe)))
+    application.add_handler(CommandHandler("history", guard(bot.rate_history)))
+    application.add_handler(CommandHandler("chart", guard(bot.rate_chart)))
+    # Inline queries arrive on every keystroke and are answered from memory, so they skip the rate limits
+    application.add_handler(InlineQueryHandler(bot.inline_query))
+    return application
+
 def main() -> None:
     """Main function to run the bot"""
     try:
         logger.info("Initializing bot...")
         logger.debug(f"Bot token present: {bool(TELEGRAM_BOT_TOKEN)}")
 
-        # Create the Application and pass it your bot's token
-        application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-
-        # Create bot instance
+        # Create bot instance and the Application with its handlers
         bot = CurrencyBot()
-        bot.application = application # Added this line to pass application instance to CurrencyBot
-
-        # Add command handlers
-        logger.info("Setting up command handlers...")
-        application.add_handler(CommandHandler("start", bot.start))
-        application.add_handler(CommandHandler("stop", bot.stop))
-        application.add_handler(CommandHandler("usdrate", bot.usd_rate))
-        application.add_handler(CommandHandler("eurrate", bot.eur_rate))
-        application.add_handler(CommandHandler("cnyrate", bot.cny_rate))
-        application.add_handler(CommandHandler("jpyrate", bot.jpy_rate))
-        application.add_handler(CommandHandler("bynrate", bot.byn_rate))
-        application.add_handler(CommandHandler("gbprate", bot.gbp_rate))
-        application.add_handler(CommandHandler("allrates", bot.get_all_rates))
-        application.add_handler(CommandHandler("convert", bot.convert))
-        application.add_handler(CommandHandler("setalert", bot.setalert))
+        application = build_application(bot)
 
         # Start the bot
-        logger.info("Starting bot polling...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True, poll_interval=1.0, timeout=30)
+        if BOT_RUN_MODE == 'webhook':
+            from webhook import serve_webhook
+            logger.info("Starting bot in webhook mode...")
+            asyncio.run(serve_webhook(application))
+        else:
+            logger.info("Starting bot polling...")
+            application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True, poll_interval=1.0, timeout=30)
 
     except Exception as e:
         logger.error(f"Bot crashed: {str(e)}")
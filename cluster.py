@@ -0,0 +1,410 @@
+import asyncio
+import itertools
+import math
+import multiprocessing
+import time
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from telegram import Bot
+
+from alert_engine import Alert, AlertEngine
+from alert_store import AlertStore, SQLiteAlertStore, shard_of
+from config import (
+    ALERT_DB_PATH, CLUSTER_SHARDS, NOTIFY_GLOBAL_RATE, TELEGRAM_BOT_TOKEN
+)
+from logger import logger
+from metrics import ALERT_EVALUATION
+from notifier import NotificationDispatcher, PRIORITY_ALERT
+from rate_cache import RateSnapshot
+from utils import format_alert_message
+
+ACK_TIMEOUT = 60.0
+ACKS = {'acquired': 'acquire', 'released': 'release'}
+
+
+def plan_assignment(shards: int, current: Dict[int, int], workers: Sequence[int]) -> Dict[int, int]:
+    """Balanced shard → worker map that keeps as many shards with their current owner as possible"""
+    workers = sorted(workers)
+    if not workers:
+        return {}
+    base, extra = divmod(shards, len(workers))
+    # Workers already holding the most shards get the larger quotas, so fewer shards move
+    by_load = sorted(workers, key=lambda w: -sum(1 for owner in current.values() if owner == w))
+    quota = {worker: base + (1 if i < extra else 0) for i, worker in enumerate(by_load)}
+    owned: Dict[int, List[int]] = {worker: [] for worker in workers}
+    free = []
+    for shard in range(shards):
+        owner = current.get(shard)
+        if owner in owned and len(owned[owner]) < quota[owner]:
+            owned[owner].append(shard)
+        else:
+            free.append(shard)
+    for worker in workers:
+        while len(owned[worker]) < quota[worker]:
+            owned[worker].append(free.pop())
+    return {shard: worker for worker, held in owned.items() for shard in held}
+
+
+class ClusterWorker:
+    """Worker-process side: one AlertEngine for the owned shards, driven by inbox messages"""
+
+    def __init__(self, worker_id: int, inbox, outbox, shards: int = CLUSTER_SHARDS,
+                 token: Optional[str] = TELEGRAM_BOT_TOKEN, db_path: str = ALERT_DB_PATH,
+                 global_rate: float = NOTIFY_GLOBAL_RATE):
+        self.worker_id = worker_id
+        self.inbox = inbox
+        self.outbox = outbox
+        self.shards = shards
+        self.token = token
+        self.global_rate = global_rate
+        self.store = SQLiteAlertStore(db_path, shards=shards)
+        self.engine = AlertEngine()
+        self.owned: Set[int] = set()
+        self.notifier = None
+
+    async def run(self) -> None:
+        if self.token:
+            bot = Bot(self.token)
+            await bot.initialize()
+            self.notifier = NotificationDispatcher(bot, global_rate=self.global_rate)
+            self.notifier.start()
+        loop = asyncio.get_running_loop()
+        self.outbox.put(('ready', self.worker_id))
+        try:
+            while True:
+                message = await loop.run_in_executor(None, self.inbox.get)
+                if message[0] == 'stop':
+                    break
+                try:
+                    await self.handle(message)
+                except Exception as e:
+                    logger.error(f"Worker {self.worker_id} failed on {message[0]}: {str(e)}")
+        finally:
+            if self.notifier is not None:
+                await self.notifier.stop()
+                await self.notifier.bot.shutdown()
+            await asyncio.to_thread(self.store.close)
+
+    async def handle(self, message: Tuple) -> None:
+        kind = message[0]
+        if kind == 'snapshot':
+            self.evaluate(message[1], message[2])
+        elif kind == 'alert':
+            alert = Alert(*message[1])
+            if alert.alert_id not in self.engine.alerts:
+                self.engine.restore(alert)
+        elif kind == 'acquire':
+            loaded = await asyncio.to_thread(self.acquire, message[1])
+            self.outbox.put(('acquired', self.worker_id, loaded))
+        elif kind == 'release':
+            self.release(message[1])
+            await asyncio.to_thread(self.store.flush)
+            self.outbox.put(('released', self.worker_id, len(self.engine)))
+        elif kind == 'rate':
+            self.global_rate = message[1]
+            if self.notifier is not None:
+                self.notifier.set_global_rate(self.global_rate)
+
+    def evaluate(self, seq: int, rates: Dict[str, float]) -> None:
+        start = time.perf_counter()
+        triggered = self.engine.evaluate(rates)
+        kept = 0
+        for alert in triggered:
+            text = format_alert_message(alert, rates[alert.currency])
+            if (self.notifier is not None
+                    and not self.notifier.submit(alert.user_id, text, priority=PRIORITY_ALERT)
+                    and not self.notifier.is_pending(alert.user_id, text)):
+                # Refused for lack of room, not as a duplicate: keep the alert so the next snapshot
+                # triggers it again
+                self.engine.restore(alert)
+                kept += 1
+            else:
+                self.store.delete(alert.alert_id)
+        if kept:
+            logger.error(f"Worker {self.worker_id}: notification queue full, kept {kept} triggered alerts")
+        self.outbox.put(('evaluated', self.worker_id, seq, len(triggered) - kept,
+                         time.perf_counter() - start))
+
+    def acquire(self, shards: Iterable[int]) -> int:
+        """Take ownership of shards and load their alerts from the store"""
+        new = set(shards) - self.owned
+        self.owned |= new
+        loaded = 0
+        for page in self.store.iter_pages(shards=new):
+            loaded += self.engine.bulk_restore([alert for alert in page if alert.alert_id not in self.engine.alerts])
+        return loaded
+
+    def release(self, shards: Iterable[int]) -> None:
+        """Drop shards and their alerts; the new owner reloads them from the store"""
+        gone = set(shards) & self.owned
+        self.owned -= gone
+        for user_id in [user for user in self.engine.by_user if shard_of(user, self.shards) in gone]:
+            for alert_id in list(self.engine.by_user.get(user_id, ())):
+                self.engine.remove(alert_id)
+        # Drop the released alerts' heap entries, so a later acquire of the same shards starts clean
+        self.engine.compact()
+
+
+def run_worker(worker_id: int, inbox, outbox, shards: int, token: Optional[str], db_path: str,
+               global_rate: float) -> None:
+    """Worker process entry point"""
+    worker = ClusterWorker(worker_id, inbox, outbox, shards, token, db_path, global_rate)
+    asyncio.run(worker.run())
+
+
+@dataclass
+class WorkerHandle:
+    process: multiprocessing.Process
+    inbox: "multiprocessing.Queue"
+    shards: FrozenSet[int] = frozenset()
+    alerts: int = 0
+    evaluated_seq: int = 0
+    triggered: int = 0
+    eval_seconds: float = 0.0
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class ClusterCoordinator:
+    """Shards alert evaluation and notification across worker processes
+
+    Users are hashed into a fixed number of shards and every worker process
+    owns a set of them: it holds those users' alerts in its own AlertEngine,
+    evaluates each published snapshot and sends the notifications. Snapshots
+    and new alerts travel over per-worker multiprocessing queues; workers
+    answer on one shared queue.
+
+    The bot-wide message rate is split evenly between the workers and the
+    main process's dispatcher (``dispatcher``, which sends replies and
+    digests); shares are recomputed whenever the set of workers changes.
+
+    When workers join or leave, moved shards are released by their old owner
+    (after flushing its pending store writes) and then loaded by the new one
+    from the SQLite alert store, which reads only those shards' rows through
+    its shard index. Deletes are tombstoned, so an alert that triggers
+    before the coordinator's save of it is written is not revived by that
+    save. A worker that dies has its shards reloaded from the store, so
+    deletions it had not flushed yet may fire once more.
+    ``token=None`` runs workers without a Telegram bot, as the benchmark does.
+    """
+
+    def __init__(self, store: AlertStore, shards: int = CLUSTER_SHARDS,
+                 token: Optional[str] = TELEGRAM_BOT_TOKEN, global_rate: float = NOTIFY_GLOBAL_RATE):
+        if not isinstance(store, SQLiteAlertStore):
+            raise ValueError("Cluster mode needs the sqlite alert store backend")
+        if store.shards != shards:
+            raise ValueError(f"Alert store is sharded {store.shards} ways, cluster expects {shards}")
+        self.store = store
+        self.shards = shards
+        self.token = token
+        self.db_path = store.path
+        self.global_rate = global_rate
+        self.dispatcher: Optional[NotificationDispatcher] = None
+        self.context = multiprocessing.get_context('spawn')
+        self.outbox = self.context.Queue()
+        self.workers: Dict[int, WorkerHandle] = {}
+        self.assignment: Dict[int, int] = {}
+        self.planned_workers = 1
+        self._worker_ids = itertools.count(1)
+        self._alert_ids = itertools.count(1)
+        self._seq = 0
+        self._acks: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._evaluated = asyncio.Condition()
+        self._lock = asyncio.Lock()
+        self._reader: Optional[asyncio.Task] = None
+        self._monitor: Optional[asyncio.Task] = None
+
+    async def start(self, workers: int, dispatcher: Optional[NotificationDispatcher] = None) -> None:
+        self.dispatcher = dispatcher
+        self.reserve_ids(await asyncio.to_thread(self.store.last_id))
+        self._reader = asyncio.create_task(self._read_outbox())
+        self._monitor = asyncio.create_task(self._watch_workers())
+        await self.scale_to(workers)
+        logger.info(f"Cluster started with {len(self.workers)} workers over {self.shards} shards")
+
+    def reserve_ids(self, last_id: int) -> None:
+        self._alert_ids = itertools.count(last_id + 1)
+
+    async def scale_to(self, count: int) -> None:
+        """Add or remove workers until count are running"""
+        self.planned_workers = max(1, count)
+        if len(self.workers) < count:
+            # Start every new process first and hand out shards once, so each row is loaded once
+            await asyncio.gather(*(self._spawn() for _ in range(count - len(self.workers))))
+            await self.rebalance()
+        while len(self.workers) > count:
+            await self.remove_worker(max(self.workers))
+
+    async def add_worker(self) -> int:
+        worker_id = await self._spawn()
+        await self.rebalance()
+        return worker_id
+
+    async def _spawn(self) -> int:
+        """Start a worker process and wait until it is ready; it owns no shards yet"""
+        worker_id = next(self._worker_ids)
+        inbox = self.context.Queue()
+        process = self.context.Process(
+            target=run_worker, name=f'alert-worker-{worker_id}', daemon=True,
+            args=(worker_id, inbox, self.outbox, self.shards, self.token, self.db_path,
+                  self.rate_share(self.planned_workers)))
+        handle = self.workers[worker_id] = WorkerHandle(process, inbox)
+        process.start()
+        await asyncio.wait_for(handle.ready.wait(), ACK_TIMEOUT)
+        return worker_id
+
+    def rate_share(self, workers: int) -> float:
+        """Each worker's and the main dispatcher's equal slice of the bot-wide message rate"""
+        return self.global_rate / (workers + 1)
+
+    def _share_rate(self, live: Sequence[int]) -> None:
+        share = self.rate_share(len(live))
+        for worker_id in live:
+            self.workers[worker_id].inbox.put(('rate', share))
+        if self.dispatcher is not None:
+            self.dispatcher.set_global_rate(share)
+
+    async def remove_worker(self, worker_id: int) -> None:
+        """Move a worker's shards away, then stop it"""
+        handle = self.workers.get(worker_id)
+        if handle is None:
+            return
+        await self.rebalance(exclude={worker_id})
+        del self.workers[worker_id]
+        handle.inbox.put(('stop',))
+        await asyncio.to_thread(handle.process.join, ACK_TIMEOUT)
+
+    async def rebalance(self, exclude: Set[int] = frozenset()) -> None:
+        """Reassign shards over the live workers, handing moved shards over through the store"""
+        async with self._lock:
+            live = [worker_id for worker_id in self.workers if worker_id not in exclude]
+            self._share_rate(live)
+            plan = plan_assignment(self.shards, self.assignment, live)
+            losing: Dict[int, Set[int]] = {}
+            gaining: Dict[int, Set[int]] = {}
+            for shard in range(self.shards):
+                old, new = self.assignment.get(shard), plan.get(shard)
+                if old != new:
+                    if old in self.workers:
+                        losing.setdefault(old, set()).add(shard)
+                    if new is not None:
+                        gaining.setdefault(new, set()).add(shard)
+            # New alerts route to the new owner from here on
+            self.assignment = plan
+            await self._request(losing, 'release')
+            await asyncio.to_thread(self.store.flush)
+            await self._request(gaining, 'acquire')
+            for worker_id, handle in self.workers.items():
+                handle.shards = frozenset(s for s, owner in plan.items() if owner == worker_id)
+            if losing or gaining:
+                logger.info(f"Rebalanced shards: {sum(map(len, gaining.values()))} moved "
+                            f"across {len(live)} workers")
+
+    async def _request(self, shards_by_worker: Dict[int, Set[int]], kind: str) -> None:
+        loop = asyncio.get_running_loop()
+        waits = []
+        for worker_id, shards in shards_by_worker.items():
+            future = self._acks[(kind, worker_id)] = loop.create_future()
+            self.workers[worker_id].inbox.put((kind, frozenset(shards)))
+            waits.append(future)
+        if waits:
+            await asyncio.wait_for(asyncio.gather(*waits), ACK_TIMEOUT)
+
+    def add_alert(self, user_id: int, currency: str, threshold: float, is_above: bool) -> Alert:
+        """Create, persist and route a new alert to the worker owning its user"""
+        if not math.isfinite(threshold):
+            raise ValueError(f"Alert threshold must be a finite number, got {threshold!r}")
+        alert = Alert(next(self._alert_ids), user_id, currency, float(threshold), is_above)
+        self.store.save(alert)
+        owner = self.assignment.get(shard_of(user_id, self.shards))
+        if owner in self.workers:
+            self.workers[owner].inbox.put(('alert', tuple(alert)))
+            self.workers[owner].alerts += 1
+        return alert
+
+    def publish(self, snapshot: RateSnapshot) -> int:
+        """Send a snapshot to every worker; returns its sequence number"""
+        self._seq += 1
+        rates = dict(snapshot.rates)
+        for handle in self.workers.values():
+            handle.inbox.put(('snapshot', self._seq, rates))
+        return self._seq
+
+    async def on_snapshot(self, snapshot: RateSnapshot) -> None:
+        """Poller listener"""
+        self.publish(snapshot)
+
+    async def wait_evaluated(self, seq: int, timeout: float = ACK_TIMEOUT) -> None:
+        """Wait until every worker has evaluated snapshot seq"""
+        async with self._evaluated:
+            await asyncio.wait_for(self._evaluated.wait_for(
+                lambda: all(h.evaluated_seq >= seq for h in self.workers.values())), timeout)
+
+    async def _read_outbox(self) -> None:
+        while True:
+            message = await asyncio.to_thread(self.outbox.get)
+            if message is None:
+                return
+            kind, worker_id = message[0], message[1]
+            handle = self.workers.get(worker_id)
+            if handle is None:
+                continue
+            if kind == 'ready':
+                handle.ready.set()
+            elif kind == 'evaluated':
+                _, _, seq, triggered, seconds = message
+                handle.evaluated_seq = seq
+                handle.triggered += triggered
+                handle.eval_seconds += seconds
+                ALERT_EVALUATION.observe(seconds)
+                handle.alerts -= triggered
+                async with self._evaluated:
+                    self._evaluated.notify_all()
+            elif kind in ('acquired', 'released'):
+                if kind == 'acquired':
+                    handle.alerts += message[2]
+                else:
+                    handle.alerts = message[2]
+                future = self._acks.pop((ACKS[kind], worker_id), None)
+                if future is not None and not future.done():
+                    future.set_result(message[2])
+
+    async def _watch_workers(self) -> None:
+        """Rebalance away from workers that died"""
+        while True:
+            await asyncio.sleep(1.0)
+            dead = [worker_id for worker_id, handle in self.workers.items() if not handle.process.is_alive()]
+            for worker_id in dead:
+                logger.error(f"Alert worker {worker_id} exited with code "
+                             f"{self.workers[worker_id].process.exitcode}; reassigning its shards")
+                del self.workers[worker_id]
+                for (kind, owner), future in list(self._acks.items()):
+                    if owner == worker_id and not future.done():
+                        future.set_result(0)
+            if dead:
+                await self.rebalance()
+
+    async def stop(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+        for handle in self.workers.values():
+            handle.inbox.put(('stop',))
+        for handle in self.workers.values():
+            await asyncio.to_thread(handle.process.join, ACK_TIMEOUT)
+        self.workers.clear()
+        self.outbox.put(None)
+        if self._reader is not None:
+            await self._reader
+        logger.info("Cluster stopped")
+
+    def stats(self):
+        return {
+            worker_id: {
+                'shards': len(handle.shards),
+                'alerts': handle.alerts,
+                'evaluated_seq': handle.evaluated_seq,
+                'triggered': handle.triggered,
+                'eval_seconds': round(handle.eval_seconds, 4),
+            }
+            for worker_id, handle in self.workers.items()
+        }
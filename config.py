@@ -3,16 +3,109 @@ import os
 # Telegram Bot Configuration
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '7720238192:AAGEPt_rkf12xJDraH5ajRFhDdvLFsO8Xus')
 
+# Run mode: 'polling' (default) or 'webhook'
+BOT_RUN_MODE = os.getenv('BOT_RUN_MODE', 'polling')
+
+# Webhook mode: public URL Telegram posts to, local listener, and the secret token
+# Telegram echoes back (a random one is generated per process if unset, which only works
+# when the bot registers the webhook itself, i.e. with WEBHOOK_URL set)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', '30'))
+
+# Update processing: bounded ingestion queue and number of updates handled concurrently
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '10000'))
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '32'))
+
 # MOEX API Configuration
 # Updated URL format to use tomorrow's rates (TOM) for all currency pairs
-MOEX_API_BASE_URL = "https://iss.moex.com/iss/engines/currency/markets/selt/securities.json?iss.meta=off&securities=CNYRUB_TOM,USD000UTSTOM,JPYRUB_TOM,EURRUB_TOM,BYNRUB_TOM,GBPRUB_TOM&iss.only=marketdata,securities&lang=en"
+MOEX_API_BASE_URL = "https://iss.moex.com/iss/engines/currency/markets/selt/securities.json?iss.meta=off&securities=CNYRUB_TOM,USD000UTSTOM,JPYRUB_TOM,EURRUB_TOM,BYNRUB_TOM,GBPRUB_TOM&iss.only=marketdata&marketdata.columns=SECID,BOARDID,TRADINGSTATUS,LAST&lang=en"
+
+# Upstream HTTP client: per-request timeouts (seconds) and keep-alive pool size
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+
+# Rate snapshot cache: seconds a fetched snapshot is served before refreshing, and seconds
+# after a failed refresh before the next one is attempted
+RATE_CACHE_TTL = float(os.getenv('RATE_CACHE_TTL', '30'))
+RATE_CACHE_FAILURE_TTL = float(os.getenv('RATE_CACHE_FAILURE_TTL', '5'))
+
+# Last-known-good snapshot, rewritten on every poll and loaded at startup so commands are
+# answered before the first poll completes (empty disables); snapshots older than
+# SNAPSHOT_MAX_AGE seconds are not loaded
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', 'last_snapshot.json')
+SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', '86400'))
+
+# Inline mode: distinct query texts whose answers are kept for the current snapshot
+INLINE_CACHE_SIZE = int(os.getenv('INLINE_CACHE_SIZE', '10000'))
+
+# Background rate poller: refresh intervals and the cap for error backoff (seconds)
+MOEX_POLL_INTERVAL = float(os.getenv('MOEX_POLL_INTERVAL', '10'))
+CBR_POLL_INTERVAL = float(os.getenv('CBR_POLL_INTERVAL', '3600'))
+POLL_MAX_BACKOFF = float(os.getenv('POLL_MAX_BACKOFF', '300'))
+
+# Command middleware: per-user and per-chat token buckets (requests/second, burst)
+# and the number of command handlers allowed to run at once
+USER_RATE_LIMIT = float(os.getenv('USER_RATE_LIMIT', '1'))
+USER_BURST = float(os.getenv('USER_BURST', '5'))
+CHAT_RATE_LIMIT = float(os.getenv('CHAT_RATE_LIMIT', '3'))
+CHAT_BURST = float(os.getenv('CHAT_BURST', '10'))
+HANDLER_CONCURRENCY = int(os.getenv('HANDLER_CONCURRENCY', '16'))
+
+# Metrics endpoint (port 0 disables it) and the on-demand sampling profiler at /debug/profile
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+# Cluster mode: alert worker processes (0 = evaluate alerts in the bot process)
+# and the number of user shards spread across them
+CLUSTER_WORKERS = int(os.getenv('CLUSTER_WORKERS', '0'))
+CLUSTER_SHARDS = int(os.getenv('CLUSTER_SHARDS', '64'))
+
+# Rate sources: seconds to wait for the primary before also asking the fallback,
+# and consecutive failures that open a source's circuit breaker / seconds it stays open
+RATE_HEDGE_DELAY = float(os.getenv('RATE_HEDGE_DELAY', '1.0'))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+
+# Outgoing notifications: sender pool, queue bound and Telegram rate limits (messages/second)
+NOTIFY_WORKERS = int(os.getenv('NOTIFY_WORKERS', '8'))
+NOTIFY_QUEUE_SIZE = int(os.getenv('NOTIFY_QUEUE_SIZE', '100000'))
+NOTIFY_GLOBAL_RATE = float(os.getenv('NOTIFY_GLOBAL_RATE', '25'))
+NOTIFY_CHAT_RATE = float(os.getenv('NOTIFY_CHAT_RATE', '1'))
+NOTIFY_MAX_RETRIES = int(os.getenv('NOTIFY_MAX_RETRIES', '3'))
+
+# Rate digests: width of a schedule bucket (also the tick interval, seconds), the UTC hour
+# daily digests go out, and the share of the notification queue a digest may fill so
+# alerts and replies always find room
+DIGEST_BUCKET_SECONDS = int(os.getenv('DIGEST_BUCKET_SECONDS', '60'))
+DIGEST_DAILY_HOUR = int(os.getenv('DIGEST_DAILY_HOUR', '6'))
+DIGEST_QUEUE_SHARE = float(os.getenv('DIGEST_QUEUE_SHARE', '0.5'))
+
+# Alert storage: 'sqlite' (default) or 'memory'; write-behind batching and startup paging
+ALERT_STORE_BACKEND = os.getenv('ALERT_STORE_BACKEND', 'sqlite')
+ALERT_DB_PATH = os.getenv('ALERT_DB_PATH', 'alerts.db')
+ALERT_STORE_BATCH_SIZE = int(os.getenv('ALERT_STORE_BATCH_SIZE', '1000'))
+ALERT_STORE_FLUSH_INTERVAL = float(os.getenv('ALERT_STORE_FLUSH_INTERVAL', '0.5'))
+ALERT_LOAD_PAGE_SIZE = int(os.getenv('ALERT_LOAD_PAGE_SIZE', '50000'))
+
+# Rate history: storage directory, records per chunk file and ticks buffered before writing
+# (rollup points are written as soon as their bucket closes)
+HISTORY_DIR = os.getenv('HISTORY_DIR', 'history')
+HISTORY_CHUNK_RECORDS = int(os.getenv('HISTORY_CHUNK_RECORDS', '262144'))
+HISTORY_FLUSH_RECORDS = int(os.getenv('HISTORY_FLUSH_RECORDS', '6'))
 
 # Russian Central Bank API Configuration
 CBR_API_URL = "https://www.cbr-xml-daily.ru/daily_json.js"
 
 # Logging Configuration
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-LOG_LEVEL = 'DEBUG'  # Keep at DEBUG for detailed logging
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()  # DEBUG logs every skipped MOEX row
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))  # records buffered for the log writer thread
 
 # Currency pairs to track
 CURRENCY_PAIRS = {
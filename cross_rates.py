@@ -0,0 +1,78 @@
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from rate_cache import RateSnapshot
+
+BASE_CURRENCY = 'RUB'
+
+# NumPy is imported on first use, not at startup; False once it is known to be missing
+_numpy = None
+
+
+def load_numpy():
+    """Return the numpy module, importing it on first call; None if it is not installed"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:  # NumPy is optional; fall back to nested lists
+            _numpy = False
+    return _numpy or None
+
+
+class CrossRateMatrix:
+    """Conversion factors between every pair of currencies in one snapshot
+
+    ``factor(a, b)`` is how many units of ``b`` one unit of ``a`` buys. The
+    whole matrix is built once per snapshot as the outer product of the RUB
+    rates and their reciprocals, so any conversion is a single lookup.
+    """
+
+    def __init__(self, rates: Mapping[str, float]):
+        usable = {currency: float(rate) for currency, rate in rates.items() if rate}
+        usable[BASE_CURRENCY] = 1.0
+        self.currencies: Tuple[str, ...] = tuple(sorted(usable))
+        self.index: Dict[str, int] = {currency: i for i, currency in enumerate(self.currencies)}
+        rub_per_unit = [usable[currency] for currency in self.currencies]
+        np = load_numpy()
+        if np is not None:
+            vector = np.array(rub_per_unit, dtype=np.float64)
+            self.matrix = np.outer(vector, 1.0 / vector)
+            # Plain floats make single lookups cheaper than indexing the array
+            self.table = self.matrix.tolist()
+        else:
+            self.matrix = self.table = [[a / b for b in rub_per_unit] for a in rub_per_unit]
+
+    def __contains__(self, currency: str) -> bool:
+        return currency in self.index
+
+    def factor(self, from_currency: str, to_currency: str) -> float:
+        """Units of to_currency per unit of from_currency; KeyError if either is unknown"""
+        return self.table[self.index[from_currency]][self.index[to_currency]]
+
+    def convert(self, amount: float, from_currency: str, to_currency: str) -> float:
+        return amount * self.factor(from_currency, to_currency)
+
+    def convert_many(self, amounts: Sequence[float], from_currency: str, to_currency: str) -> List[float]:
+        """Convert a list of amounts in one call"""
+        factor = self.factor(from_currency, to_currency)
+        np = load_numpy()
+        if np is not None:
+            return (np.asarray(amounts, dtype=np.float64) * factor).tolist()
+        return [amount * factor for amount in amounts]
+
+
+class CrossRateCache:
+    """Keeps the matrix for the most recent snapshot only"""
+
+    def __init__(self):
+        self._source: Optional[RateSnapshot] = None
+        self._matrix: Optional[CrossRateMatrix] = None
+        self.builds = 0
+
+    def get(self, snapshot: RateSnapshot) -> CrossRateMatrix:
+        if snapshot is not self._source:
+            self._matrix = CrossRateMatrix(snapshot.rates)
+            self._source = snapshot
+            self.builds += 1
+        return self._matrix
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from typing import Callable, Dict, Optional, Sequence, Set, Tuple
+
+from alert_store import AlertStore
+from config import CURRENCY_PAIRS, DIGEST_BUCKET_SECONDS, DIGEST_QUEUE_SHARE
+from logger import logger
+from notifier import NotificationDispatcher, PRIORITY_BULK
+from rate_cache import RateSnapshot
+from subscriptions import ScheduleIndex, Subscription, next_due_time
+from utils import format_digest_message
+
+# Digest titles per language; other languages get English
+DIGEST_TITLES = {
+    'en': {'hourly': 'Hourly rate digest', 'daily': 'Daily rate digest'},
+    'ru': {'hourly': 'Ежечасная сводка курсов', 'daily': 'Ежедневная сводка курсов'},
+}
+
+DigestKey = Tuple[str, str, Tuple[str, ...]]
+
+
+def digest_language(language_code: Optional[str]) -> str:
+    """Map a Telegram language code onto a language digests are written in"""
+    language = (language_code or '').split('-')[0].lower()
+    return language if language in DIGEST_TITLES else 'en'
+
+
+def render_digest(snapshot: RateSnapshot, language: str, cadence: str, currencies: Sequence[str]) -> str:
+    return format_digest_message(DIGEST_TITLES[language][cadence], snapshot.rates, currencies,
+                                 snapshot.fetched_at)
+
+
+class DigestScheduler:
+    """Sends periodic rate digests to subscribed chats
+
+    Subscriptions live in a ScheduleIndex keyed by due time, so each tick
+    pops only the chats that are due. A digest is rendered once per tick
+    for every (language, cadence, currencies) combination and the same text
+    is queued for every matching chat at bulk priority; the notification
+    dispatcher spreads the sends within Telegram's limits. A tick never
+    fills more than ``queue_share`` of the dispatcher's queue, so alerts
+    and replies are not crowded out.
+    """
+
+    def __init__(self, store: AlertStore, snapshot: Callable[[], Optional[RateSnapshot]],
+                 bucket_seconds: int = DIGEST_BUCKET_SECONDS, queue_share: float = DIGEST_QUEUE_SHARE):
+        self.store = store
+        self.snapshot = snapshot
+        self.index = ScheduleIndex(bucket_seconds)
+        self.queue_share = queue_share
+        self.notifier: Optional[NotificationDispatcher] = None
+        self._task: Optional[asyncio.Task] = None
+        # Chats subscribed or unsubscribed while load() runs; their stored rows are stale
+        self._touched: Optional[Set[int]] = None
+        self.ticks = 0
+        self.renders = 0
+        self.queued = 0
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def subscribe(self, chat_id: int, cadence: str, currencies: Sequence[str],
+                  language: str, now: Optional[float] = None) -> Subscription:
+        """Create or replace a chat's subscription; the first digest goes out in the next slot"""
+        ordered = tuple(currency for currency in CURRENCY_PAIRS if currency in currencies)
+        subscription = Subscription(chat_id, cadence, ordered, language,
+                                    next_due_time(cadence, now if now is not None else time.time()))
+        self.index.add(subscription)
+        self.store.save_subscriptions([subscription])
+        if self._touched is not None:
+            self._touched.add(chat_id)
+        return subscription
+
+    def unsubscribe(self, chat_id: int) -> bool:
+        if self._touched is not None:
+            self._touched.add(chat_id)
+        if self.index.remove(chat_id) is None:
+            return False
+        self.store.delete_subscription(chat_id)
+        return True
+
+    async def load(self) -> None:
+        """Page stored subscriptions into the index, keeping changes made while loading"""
+        self._touched = set()
+        try:
+            pages = self.store.iter_subscriptions()
+            while True:
+                page = await asyncio.to_thread(next, pages, None)
+                if page is None:
+                    break
+                for subscription in page:
+                    if subscription.chat_id not in self._touched:
+                        self.index.add(subscription)
+            logger.info(f"Loaded {len(self.index)} digest subscriptions")
+        except Exception as e:
+            logger.error(f"Error loading digest subscriptions: {str(e)}")
+        finally:
+            self._touched = None
+
+    def start(self, notifier: NotificationDispatcher) -> None:
+        self.notifier = notifier
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        bucket = self.index.bucket_seconds
+        while True:
+            # Wake at the start of every bucket; a slow tick just delays the next one
+            await asyncio.sleep(bucket - time.time() % bucket)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Error sending rate digests: {str(e)}")
+
+    async def tick(self, now: Optional[float] = None) -> int:
+        """Queue digests for every due subscription; returns how many were queued"""
+        snapshot = self.snapshot()
+        if snapshot is None or not snapshot.rates:
+            logger.warning("Skipping digest tick: no rates yet")
+            return 0
+        now = now if now is not None else time.time()
+        due = self.index.pop_due(now)
+        if not due:
+            return 0
+        self.ticks += 1
+
+        # Reschedule before sending, so unsubscribes during a long fan-out are seen
+        rescheduled = [subscription._replace(next_due=next_due_time(subscription.cadence, now))
+                       for subscription in due]
+        for subscription in rescheduled:
+            self.index.add(subscription)
+        self.store.save_subscriptions(rescheduled)
+
+        rendered: Dict[DigestKey, str] = {}
+        room = max(1, int(self.notifier.max_queue * self.queue_share))
+        queued = 0
+        for subscription in rescheduled:
+            if self.index.get(subscription.chat_id) is not subscription:
+                continue  # unsubscribed or changed since the tick began
+            key = (subscription.language, subscription.cadence, subscription.currencies)
+            text = rendered.get(key)
+            if text is None:
+                text = rendered[key] = render_digest(snapshot, *key)
+            while self.notifier.depth >= room:
+                await asyncio.sleep(0.05)
+            if self.notifier.submit(subscription.chat_id, text, priority=PRIORITY_BULK):
+                queued += 1
+        self.renders += len(rendered)
+        self.queued += queued
+        logger.info(f"Queued {queued} rate digests ({len(rendered)} distinct)")
+        return queued
+
+    def stats(self):
+        return {
+            'subscriptions': len(self.index),
+            'ticks': self.ticks,
+            'renders': self.renders,
+            'queued': self.queued,
+        }
@@ -1,113 +1,233 @@
-import requests
-from datetime import datetime
-from config import MOEX_API_BASE_URL, CURRENCY_PAIRS, CBR_API_URL
+import asyncio
+import logging
+import httpx
+from typing import Dict, Optional, Sequence, Tuple
+from config import (
+    MOEX_API_BASE_URL, CURRENCY_PAIRS, CBR_API_URL,
+    HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_POOL_SIZE
+)
 from logger import logger
 
-class MOEXAPI:
-    def __init__(self):
-        self.base_url = MOEX_API_BASE_URL
-        self.valid_boards = ['CETS', 'CNGD', 'LICU']
+try:
+    from orjson import loads as json_loads
+except ImportError:  # orjson is optional; the stdlib decoder accepts bytes as well
+    from json import loads as json_loads
+
+# MOEX security ID -> currency code, so each ISS row costs one dict lookup
+SECID_TO_CURRENCY = {secid: currency for currency, secid in CURRENCY_PAIRS.items()}
+
+# The only marketdata columns the parser reads, in the order it unpacks them
+ISS_COLUMNS = ('SECID', 'BOARDID', 'TRADINGSTATUS', 'LAST')
+
+
+class RateParser:
+    """Shared parsing of MOEX ISS and CBR responses"""
+    valid_boards = frozenset(['CETS', 'CNGD', 'LICU'])
+
+    # Column layout -> positions of ISS_COLUMNS, shared by every parser instance
+    _column_indices: Dict[Tuple[str, ...], Tuple[int, ...]] = {}
+
+    def __init__(self, base_url: str = MOEX_API_BASE_URL, cbr_url: str = CBR_API_URL):
+        self.base_url = base_url
+        self.cbr_url = cbr_url
         self.cbr_rates = {}
-        self._fetch_cbr_rates()
+
+    def _parse_cbr_rates(self, data) -> Dict[str, float]:
+        """Extract per-unit RUB rates from a CBR daily JSON payload"""
+        rates = {}
+        if 'Valute' in data:
+            currencies = {
+                'EUR': 'EUR',
+                'CNY': 'CNY',
+                'BYN': 'BYN',
+                'USD': 'USD',
+                'JPY': 'JPY',
+                'GBP': 'GBP'  # Added GBP to CBR currencies
+            }
+
+            for code, cbr_code in currencies.items():
+                if cbr_code in data['Valute']:
+                    rate = float(data['Valute'][cbr_code]['Value'])
+                    nominal = float(data['Valute'][cbr_code]['Nominal'])
+                    rates[code] = round(rate / nominal, 4)
+        logger.debug("Fetched CBR rates: %s", rates)
+        return rates
+
+    def _parse_moex_rates(self, data) -> Optional[Dict[str, float]]:
+        """Extract rates from a MOEX ISS payload, None if the payload is unusable"""
+        rates = {}
+
+        if 'marketdata' not in data:
+            logger.warning("No marketdata in MOEX response")
+            return None
+
+        securities_data = data['marketdata']['data']
+        indices = self._marketdata_indices(data['marketdata']['columns'])
+        if indices is None:
+            return None
+        secid_index, board_index, status_index, last_index = indices
+        valid_boards = self.valid_boards
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        # Process each row in MOEX data
+        for row in securities_data:
+            if not row:
+                continue
+
+            # Map MOEX security ID to currency code; unrelated securities stop here
+            currency = SECID_TO_CURRENCY.get(row[secid_index])
+            if currency is None:
+                continue
+
+            # Skip if not on valid boards or not actively trading
+            if row[board_index] not in valid_boards or row[status_index] != 'T':
+                if debug:
+                    logger.debug("Skipping %s: board=%s, status=%s",
+                                 row[secid_index], row[board_index], row[status_index])
+                continue
+
+            last_price = row[last_index]
+            try:
+                if last_price is not None:
+                    price = float(last_price)
+                    if price > 0:
+                        if currency == 'JPY':
+                            price = price / 100  # Adjust JPY rate
+                        rates[currency] = round(price, 4)
+            except (ValueError, TypeError) as e:
+                logger.error(f"Error processing MOEX rate for {currency}: {str(e)}")
+
+        logger.info("Using MOEX rates (LAST price): %s", rates)
+        return rates
+
+    def _marketdata_indices(self, columns: Sequence[str]) -> Optional[Tuple[int, ...]]:
+        """Positions of ISS_COLUMNS in a marketdata column list, cached per layout"""
+        key = tuple(columns)
+        indices = self._column_indices.get(key)
+        if indices is None:
+            try:
+                indices = tuple(key.index(column) for column in ISS_COLUMNS)
+            except ValueError as e:
+                logger.error(f"Column index error: {str(e)}")
+                return None
+            self._column_indices[key] = indices
+        return indices
+
+    def _merge_with_cbr(self, rates: Optional[Dict[str, float]]) -> Dict[str, float]:
+        """Fill currencies missing from MOEX with CBR data"""
+        if rates is None:
+            return self.cbr_rates
+
+        for currency in CURRENCY_PAIRS.keys():
+            if currency not in rates and currency in self.cbr_rates:
+                rates[currency] = self.cbr_rates[currency]
+                logger.info("Using CBR fallback rate for %s: %s", currency, rates[currency])
+
+        return rates if rates else self.cbr_rates
+
+
+class MOEXAPI(RateParser):
+    """Blocking MOEX/CBR client; nothing touches the network until rates are first requested"""
+
+    def __init__(self, base_url: str = MOEX_API_BASE_URL, cbr_url: str = CBR_API_URL):
+        super().__init__(base_url, cbr_url)
+        self._cbr_fetched = False
 
     def _fetch_cbr_rates(self):
         """Fetch exchange rates from Russian Central Bank as fallback"""
+        import requests  # only the blocking client needs requests; keep it off the startup path
+        self._cbr_fetched = True
         try:
-            response = requests.get(CBR_API_URL)
+            response = requests.get(self.cbr_url, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT))
             response.raise_for_status()
-            data = response.json()
-
-            if 'Valute' in data:
-                currencies = {
-                    'EUR': 'EUR',
-                    'CNY': 'CNY',
-                    'BYN': 'BYN',
-                    'USD': 'USD',
-                    'JPY': 'JPY',
-                    'GBP': 'GBP'  # Added GBP to CBR currencies
-                }
-
-                for code, cbr_code in currencies.items():
-                    if cbr_code in data['Valute']:
-                        rate = float(data['Valute'][cbr_code]['Value'])
-                        nominal = float(data['Valute'][cbr_code]['Nominal'])
-                        self.cbr_rates[code] = round(rate / nominal, 4)
-                        logger.debug(f"Fetched CBR rate for {code}: {self.cbr_rates[code]}")
-
-        except requests.RequestException as e:
+            self.cbr_rates.update(self._parse_cbr_rates(json_loads(response.content)))
+
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"Error fetching CBR rates: {str(e)}")
 
     def get_exchange_rates(self):
         """Fetch exchange rates from MOEX API with CBR fallback"""
+        import requests
+        if not self._cbr_fetched:
+            self._fetch_cbr_rates()
         try:
-            response = requests.get(self.base_url)
+            response = requests.get(self.base_url, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT))
             response.raise_for_status()
-            data = response.json()
-            rates = {}
+            return self._merge_with_cbr(self._parse_moex_rates(json_loads(response.content)))
 
-            if 'marketdata' not in data:
-                logger.warning("No marketdata in MOEX response")
-                return self.cbr_rates
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Error fetching MOEX rates: {str(e)}")
+            logger.info("Using CBR rates as fallback")
+            return self.cbr_rates
+
+
+class AsyncMOEXAPI(RateParser):
+    """Non-blocking MOEX/CBR client backed by a pooled keep-alive httpx client"""
+
+    def __init__(self, base_url: str = MOEX_API_BASE_URL, cbr_url: str = CBR_API_URL,
+                 client: Optional[httpx.AsyncClient] = None):
+        super().__init__(base_url, cbr_url)
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_POOL_SIZE
+                )
+            )
+        return self._client
+
+    async def fetch_cbr_rates(self):
+        """Fetch exchange rates from Russian Central Bank as fallback"""
+        try:
+            await self.refresh_cbr_rates()
 
-            securities_data = data['marketdata']['data']
-            marketdata_columns = data['marketdata']['columns']
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Error fetching CBR rates: {str(e)}")
 
-            try:
-                indices = {
-                    'LAST': marketdata_columns.index('LAST'),
-                    'TRADINGSTATUS': marketdata_columns.index('TRADINGSTATUS'),
-                    'BOARDID': marketdata_columns.index('BOARDID'),
-                    'SECID': marketdata_columns.index('SECID')
-                }
-            except ValueError as e:
-                logger.error(f"Column index error: {str(e)}")
-                return self.cbr_rates
-
-            # Process each row in MOEX data
-            for row in securities_data:
-                if not row:
-                    continue
-
-                secid = row[indices['SECID']]
-                boardid = row[indices['BOARDID']]
-                trading_status = row[indices['TRADINGSTATUS']]
-                last_price = row[indices['LAST']]
-
-                # Skip if not on valid boards or not actively trading
-                if boardid not in self.valid_boards or trading_status != 'T':
-                    logger.debug(f"Skipping {secid}: board={boardid}, status={trading_status}")
-                    continue
-
-                # Map MOEX security ID to currency code
-                currency = None
-                for curr, pair in CURRENCY_PAIRS.items():
-                    if pair == secid:
-                        currency = curr
-                        break
-
-                if not currency:
-                    continue
-
-                try:
-                    if last_price is not None:
-                        price = float(last_price)
-                        if price > 0:
-                            if currency == 'JPY':
-                                price = price / 100  # Adjust JPY rate
-                            rates[currency] = round(price, 4)
-                            logger.info(f"Using MOEX rate for {currency}: {rates[currency]} (LAST price)")
-                except (ValueError, TypeError) as e:
-                    logger.error(f"Error processing MOEX rate for {currency}: {str(e)}")
-
-            # Fill missing rates with CBR data
-            for currency in CURRENCY_PAIRS.keys():
-                if currency not in rates and currency in self.cbr_rates:
-                    rates[currency] = self.cbr_rates[currency]
-                    logger.info(f"Using CBR fallback rate for {currency}: {rates[currency]}")
-
-            return rates if rates else self.cbr_rates
-
-        except requests.RequestException as e:
+    async def refresh_cbr_rates(self) -> Dict[str, float]:
+        """Fetch CBR rates, raising on failure"""
+        response = await self.client.get(self.cbr_url)
+        response.raise_for_status()
+        self.cbr_rates.update(self._parse_cbr_rates(json_loads(response.content)))
+        return self.cbr_rates
+
+    async def get_exchange_rates(self):
+        """Fetch exchange rates from MOEX API with CBR fallback"""
+        if not self.cbr_rates:
+            # First call: load the fallback alongside MOEX instead of before it
+            moex, _ = await asyncio.gather(self._get_moex(), self.fetch_cbr_rates())
+        else:
+            moex = await self._get_moex()
+        return self._merge_with_cbr(moex)
+
+    async def fetch_moex_rates(self) -> Dict[str, float]:
+        """Fetch MOEX rates alone, raising on failure or an unusable response"""
+        rates = await self._fetch_moex()
+        if rates is None:
+            raise ValueError("Unusable MOEX response")
+        return rates
+
+    async def _fetch_moex(self) -> Optional[Dict[str, float]]:
+        response = await self.client.get(self.base_url)
+        response.raise_for_status()
+        return self._parse_moex_rates(json_loads(response.content))
+
+    async def _get_moex(self) -> Optional[Dict[str, float]]:
+        try:
+            return await self._fetch_moex()
+
+        except (httpx.HTTPError, ValueError) as e:
             logger.error(f"Error fetching MOEX rates: {str(e)}")
             logger.info("Using CBR rates as fallback")
-            return self.cbr_rates
\ No newline at end of file
+            return None
+
+    async def aclose(self) -> None:
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
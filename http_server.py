@@ -0,0 +1,149 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from logger import logger
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+STATUS_TEXT = {
+    200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b''
+    content_type: str = 'text/plain; charset=utf-8'
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HTTPServer:
+    """Small asyncio HTTP/1.1 server for internal endpoints (webhook, metrics)
+
+    Supports keep-alive and Content-Length bodies only, which is all the
+    Telegram webhook sender and metrics scrapers need.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.routes: Dict[Tuple[str, str], Handler] = {}
+        self._server: Optional[asyncio.Server] = None
+        self._connections: Set[asyncio.Task] = set()
+        self._idle: Set[asyncio.Task] = set()
+        self._closing = False
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        self.routes[(method.upper(), path)] = handler
+
+    @property
+    def bound_port(self) -> int:
+        """Actual listening port (useful when started with port 0)"""
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"HTTP server listening on {self.host}:{self.bound_port}")
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Stop accepting connections and let in-flight requests finish"""
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+        # Keep-alive connections waiting for their next request can go right away
+        for task in self._idle:
+            task.cancel()
+        if self._connections:
+            _, pending = await asyncio.wait(self._connections, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while not self._closing:
+                self._idle.add(task)
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                finally:
+                    self._idle.discard(task)
+                request, keep_alive = await self._read_request(head, reader)
+                if request is None:
+                    response, keep_alive = Response(400), False
+                else:
+                    response = await self._dispatch(request)
+                self._write_response(writer, response, keep_alive and not self._closing)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            self._idle.discard(task)
+            writer.close()
+
+    async def _read_request(self, head: bytes, reader: asyncio.StreamReader):
+        if len(head) > MAX_HEADER_BYTES:
+            return None, False
+        try:
+            lines = head.decode('latin-1').split('\r\n')
+            method, target, version = lines[0].split(' ', 2)
+            headers = {}
+            for line in lines[1:]:
+                if line:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', '0'))
+        except ValueError:
+            return None, False
+        if length < 0 or length > MAX_BODY_BYTES:
+            return None, False
+        body = await reader.readexactly(length) if length else b''
+        url = urlsplit(target)
+        keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+        return Request(method.upper(), url.path, dict(parse_qsl(url.query)), headers, body), keep_alive
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            known_path = any(path == request.path for _, path in self.routes)
+            return Response(405 if known_path else 404)
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"Error handling {request.method} {request.path}: {str(e)}")
+            return Response(500)
+
+    def _write_response(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool) -> None:
+        headers = [
+            f"HTTP/1.1 {response.status} {STATUS_TEXT.get(response.status, 'Unknown')}",
+            f"Content-Type: {response.content_type}",
+            f"Content-Length: {len(response.body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        headers.extend(f"{name}: {value}" for name, value in response.headers.items())
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + response.body)
@@ -0,0 +1,151 @@
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+
+from config import INLINE_CACHE_SIZE, MOEX_POLL_INTERVAL
+from cross_rates import BASE_CURRENCY, CrossRateCache
+from rate_cache import RateSnapshot
+from rendering import RateRenderer
+
+# Words allowed between the two currencies: "100 usd to eur", "100 usd in eur"
+CONNECTORS = frozenset(['to', 'in', '=', '->'])
+
+# (amount or None, currencies to convert from, currencies to convert to)
+InlineKey = Tuple[Optional[float], Tuple[str, ...], Tuple[str, ...]]
+
+
+def _amount(token: str) -> Optional[float]:
+    try:
+        value = float(token.replace(',', '.'))
+    except ValueError:
+        return None
+    return value if value > 0 and math.isfinite(value) else None
+
+
+def parse_inline_query(text: str, currencies: Sequence[str]) -> Optional[InlineKey]:
+    """Normalise "[AMOUNT] [FROM] [to] [TO]" into a cache key; None if it cannot be answered
+
+    Currency tokens may be unfinished ("100 usd e"): they match every
+    currency they are a prefix of, so each keystroke already has results.
+    """
+    tokens = text.split()
+    amount = _amount(tokens[0]) if tokens else None
+    if amount is not None:
+        tokens = tokens[1:]
+    tokens = [token.upper() for token in tokens if token.lower() not in CONNECTORS]
+    if len(tokens) > 2:
+        return None
+    matched = []
+    for token in tokens:
+        candidates = tuple(currency for currency in currencies if currency.startswith(token))
+        if not candidates:
+            return None
+        matched.append(candidates)
+    sources = matched[0] if matched else ()
+    targets = matched[1] if len(matched) > 1 else ()
+    return amount, sources, targets
+
+
+def _article(result_id: str, title: str, text: str, description: Optional[str] = None) -> InlineQueryResultArticle:
+    return InlineQueryResultArticle(id=result_id, title=title, description=description,
+                                    input_message_content=InputTextMessageContent(text))
+
+
+class InlineAnswerCache:
+    """Inline query results for the current snapshot, built once per distinct query
+
+    Lookups go raw query text -> results, then normalised key -> results,
+    so repeated keystrokes cost one dict lookup and spelling variants of the
+    same question share one build. Everything comes from the snapshot and
+    the cross-rate matrix, never from upstream. A new snapshot empties the
+    cache.
+    """
+
+    def __init__(self, renderer: RateRenderer, cross_rates: CrossRateCache,
+                 max_entries: int = INLINE_CACHE_SIZE, poll_interval: float = MOEX_POLL_INTERVAL):
+        self.renderer = renderer
+        self.cross_rates = cross_rates
+        self.max_entries = max_entries
+        self.poll_interval = poll_interval
+        self._snapshot: Optional[RateSnapshot] = None
+        self._by_text: Dict[str, List[InlineQueryResultArticle]] = {}
+        self._by_key: Dict[InlineKey, List[InlineQueryResultArticle]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+
+    async def on_snapshot(self, snapshot: RateSnapshot) -> None:
+        """Poller listener: precompute the answers users see first, the empty query and one currency"""
+        self.answer(snapshot, '')
+        for currency in self.cross_rates.get(snapshot).currencies:
+            self.answer(snapshot, currency.lower())
+
+    def cache_time(self, snapshot: RateSnapshot) -> int:
+        """Seconds Telegram may reuse our answer: until the poller publishes the next snapshot"""
+        return max(0, int(self.poll_interval - snapshot.age()))
+
+    def answer(self, snapshot: RateSnapshot, query: str) -> Tuple[List[InlineQueryResultArticle], int]:
+        """Results and cache_time for query against snapshot"""
+        if snapshot is not self._snapshot:
+            self._snapshot = snapshot
+            self._by_text.clear()
+            self._by_key.clear()
+        results = self._by_text.get(query)
+        if results is not None:
+            self.hits += 1
+            return results, self.cache_time(snapshot)
+
+        self.misses += 1
+        matrix = self.cross_rates.get(snapshot)
+        key = parse_inline_query(query, matrix.currencies)
+        if key is None:
+            results = []
+        else:
+            results = self._by_key.get(key)
+            if results is None:
+                results = self._by_key[key] = self._build(snapshot, key)
+                self.builds += 1
+        if len(self._by_text) >= self.max_entries:
+            self._by_text.clear()
+            self._by_key.clear()
+        self._by_text[query] = results
+        return results, self.cache_time(snapshot)
+
+    def _build(self, snapshot: RateSnapshot, key: InlineKey) -> List[InlineQueryResultArticle]:
+        amount, sources, targets = key
+        matrix = self.cross_rates.get(snapshot)
+        if amount is None and not sources:
+            # Empty query: the same messages /allrates and the single-rate commands send
+            results = [_article('all', 'All rates', self.renderer.all_rates(snapshot), 'Every currency in RUB')]
+            for currency in snapshot.rates:
+                message = self.renderer.single(snapshot, currency)
+                if message is not None:
+                    results.append(_article(currency, f"{currency} rate", message,
+                                            f"1 {currency} = {matrix.factor(currency, BASE_CURRENCY):.4f} RUB"))
+            return results
+
+        amount = amount or 1.0
+        if not sources:
+            sources = tuple(currency for currency in matrix.currencies if currency != BASE_CURRENCY)
+            targets = (BASE_CURRENCY,)
+        results = []
+        for source in sources:
+            for target in targets or matrix.currencies:
+                if source == target:
+                    continue
+                factor = matrix.factor(source, target)
+                line = f"{amount:.2f} {source} = {amount * factor:.2f} {target}"
+                results.append(_article(f"{source}-{target}", line, line, f"1 {source} = {factor:.4f} {target}"))
+        # Telegram accepts at most 50 results per answer
+        return results[:50]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'builds': self.builds,
+            'entries': len(self._by_text),
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
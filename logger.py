@@ -1,22 +1,46 @@
+import atexit
 import logging
-from config import LOG_FORMAT, LOG_LEVEL
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from config import LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that never blocks the caller; records are dropped when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
 
 def setup_logger():
     """Configure and return logger instance"""
     logger = logging.getLogger('CurrencyBot')
     logger.setLevel(LOG_LEVEL)
-    
+
     # Create console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(LOG_LEVEL)
-    
+
     # Create formatter
     formatter = logging.Formatter(LOG_FORMAT)
     console_handler.setFormatter(formatter)
-    
+
+    # Callers only enqueue; a listener thread does the formatting and writing
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    listener = QueueListener(log_queue, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
     # Add handler to logger
-    logger.addHandler(console_handler)
-    
+    logger.addHandler(DroppingQueueHandler(log_queue))
+
     return logger
 
 logger = setup_logger()
@@ -0,0 +1,289 @@
+import asyncio
+import bisect
+import math
+import sys
+import threading
+import time
+from collections import Counter as TallyCounter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from config import METRICS_LISTEN, METRICS_PORT, PROFILER_ENABLED
+from http_server import HTTPServer, Request, Response
+from logger import logger
+
+# Histogram bucket upper bounds in seconds; the last bucket catches everything slower
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+LabelValues = Tuple[str, ...]
+Sample = Union[float, Dict[LabelValues, float]]
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram; quantiles resolve to a bucket's upper bound"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+        }
+
+
+class CounterValue:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class GaugeValue:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Metric:
+    """A named metric family; ``labels(...)`` returns the child for one label set"""
+
+    kind = 'untyped'
+    child_type: Callable = CounterValue
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), **child_kwargs):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.child_kwargs = child_kwargs
+        self.children: Dict[LabelValues, object] = {}
+        if not self.labelnames:
+            self.children[()] = self.child_type(**child_kwargs)
+
+    def labels(self, *values) -> object:
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            child = self.children[key] = self.child_type(**self.child_kwargs)
+        return child
+
+    def __getattr__(self, attr):
+        # Unlabelled metrics forward inc/set/observe/time to their single child
+        if attr.startswith('__') or self.labelnames:
+            raise AttributeError(attr)
+        return getattr(self.children[()], attr)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        return [(self.name, key, child.value) for key, child in self.children.items()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+    child_type = CounterValue
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+    child_type = GaugeValue
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    child_type = LatencyHistogram
+
+    def samples(self):
+        samples = []
+        for key, child in self.children.items():
+            cumulative = 0
+            for bound, count in zip(child.buckets, child.counts):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                samples.append((self.name + '_bucket', key + (('le', le),), cumulative))
+            samples.append((self.name + '_count', key, child.count))
+            samples.append((self.name + '_sum', key, child.sum))
+        return samples
+
+
+class CallbackMetric(Metric):
+    """Value read from a function at scrape time, so the hot path pays nothing"""
+
+    def __init__(self, name: str, documentation: str, kind: str, fn: Callable[[], Sample],
+                 labelnames: Sequence[str] = ()):
+        self.kind = kind
+        self.fn = fn
+        super().__init__(name, documentation, labelnames)
+        self.children = {}
+
+    def samples(self):
+        value = self.fn()
+        if isinstance(value, dict):
+            return [(self.name, key if isinstance(key, tuple) else (key,), float(v)) for key, v in value.items()]
+        return [] if value is None else [(self.name, (), float(value))]
+
+
+def format_value(value: float) -> str:
+    if value != value:
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Registry:
+    """Metric families rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def callback(self, name: str, documentation: str, kind: str, fn: Callable[[], Sample],
+                 labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, kind, fn, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                logger.error(f"Error collecting metric {metric.name}: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in samples:
+                labels = []
+                for i, item in enumerate(key):
+                    if isinstance(item, tuple):
+                        labels.append(f'{item[0]}="{item[1]}"')
+                    else:
+                        labels.append(f'{metric.labelnames[i]}="{item}"')
+                label_text = '{' + ','.join(labels) + '}' if labels else ''
+                lines.append(f"{name}{label_text} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.histogram(
+    'bot_handler_seconds', 'Command handler latency', ['command'])
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    'bot_upstream_fetch_seconds', 'Upstream rate fetch latency', ['source'])
+UPSTREAM_ERRORS = REGISTRY.counter(
+    'bot_upstream_errors_total', 'Failed upstream rate fetches', ['source'])
+ALERT_EVALUATION = REGISTRY.histogram(
+    'bot_alert_evaluation_seconds', 'Time to evaluate all alerts against one snapshot')
+INLINE_ANSWER = REGISTRY.histogram(
+    'bot_inline_answer_seconds', 'Time to build an inline query answer, excluding the Bot API call',
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01, math.inf))
+
+
+class SamplingProfiler:
+    """Samples thread stacks from a background thread into collapsed-stack lines
+
+    The output (``frame;frame;frame count`` per line) feeds flamegraph.pl or
+    speedscope directly. Only one profile runs at a time.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, thread_id: Optional[int] = None) -> str:
+        """Sample for ``seconds`` (the main thread unless thread_id is given) and return collapsed stacks"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            target = thread_id if thread_id is not None else threading.main_thread().ident
+            stacks: TallyCounter = TallyCounter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(target)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    stacks[';'.join(reversed(stack))] += 1
+                time.sleep(self.interval)
+            return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        finally:
+            self._lock.release()
+
+
+class MetricsServer:
+    """Serves GET /metrics, plus GET /debug/profile?seconds=N when the profiler is enabled"""
+
+    def __init__(self, registry: Registry = REGISTRY, host: str = METRICS_LISTEN, port: int = METRICS_PORT,
+                 profiler: bool = PROFILER_ENABLED):
+        self.registry = registry
+        self.server = HTTPServer(host, port)
+        self.server.route('GET', '/metrics', self.metrics)
+        self.profiler = SamplingProfiler() if profiler else None
+        if self.profiler is not None:
+            self.server.route('GET', '/debug/profile', self.profile)
+
+    async def metrics(self, request: Request) -> Response:
+        return Response(200, self.registry.render().encode(), 'text/plain; version=0.0.4; charset=utf-8')
+
+    async def profile(self, request: Request) -> Response:
+        try:
+            seconds = min(float(request.query.get('seconds', '10')), 300.0)
+        except ValueError:
+            return Response(400, b'seconds must be a number')
+        try:
+            stacks = await asyncio.to_thread(self.profiler.profile, seconds)
+        except RuntimeError as e:
+            return Response(503, str(e).encode())
+        return Response(200, stacks.encode())
+
+    async def start(self) -> None:
+        await self.server.start()
+
+    async def stop(self) -> None:
+        await self.server.stop()
@@ -0,0 +1,104 @@
+import asyncio
+import functools
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Set
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config import (
+    USER_RATE_LIMIT, USER_BURST, CHAT_RATE_LIMIT, CHAT_BURST, HANDLER_CONCURRENCY
+)
+from logger import logger
+from metrics import HANDLER_LATENCY
+from ratelimit import BucketRegistry
+
+Handler = Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[None]]
+
+THROTTLED_MESSAGE = "Too many requests. Please wait a few seconds and try again."
+
+
+class CommandMiddleware:
+    """Admission control in front of command handlers
+
+    ``wrap`` applies per-user and per-chat token buckets and runs admitted
+    handlers through a bounded concurrency pool. ``shared`` lets a handler
+    collapse identical in-flight computations, so a burst of the same
+    command produces one result that every caller replies with.
+    """
+
+    def __init__(self, user_rate: float = USER_RATE_LIMIT, user_burst: float = USER_BURST,
+                 chat_rate: float = CHAT_RATE_LIMIT, chat_burst: float = CHAT_BURST,
+                 concurrency: int = HANDLER_CONCURRENCY):
+        self.users = BucketRegistry(user_rate, user_burst)
+        self.chats = BucketRegistry(chat_rate, chat_burst)
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._throttled: Set[Hashable] = set()
+        self.busy = 0
+        self.served = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def admit(self, update: Update) -> bool:
+        """Take a token from the sender's and the chat's bucket"""
+        user = update.effective_user
+        chat = update.effective_chat
+        if user is not None and not self.users.get(user.id).try_acquire():
+            return False
+        if chat is not None and chat.id != getattr(user, 'id', None):
+            return self.chats.get(chat.id).try_acquire()
+        return True
+
+    def wrap(self, handler: Handler) -> Handler:
+        """Rate-limit handler and run it inside the concurrency pool"""
+        latency = HANDLER_LATENCY.labels(handler.__name__)
+
+        @functools.wraps(handler)
+        async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            key = update.effective_chat.id if update.effective_chat else None
+            if not self.admit(update):
+                self.dropped += 1
+                # Say so once per burst rather than answering every dropped message
+                if key not in self._throttled and update.effective_message is not None:
+                    if len(self._throttled) >= self.users.max_keys:
+                        self._throttled.clear()
+                    self._throttled.add(key)
+                    await update.effective_message.reply_text(THROTTLED_MESSAGE)
+                logger.debug("Dropped %s from chat %s: rate limited", handler.__name__, key)
+                return
+            self._throttled.discard(key)
+            async with self._semaphore:
+                self.served += 1
+                self.busy += 1
+                start = time.perf_counter()
+                try:
+                    await handler(update, context)
+                finally:
+                    latency.observe(time.perf_counter() - start)
+                    self.busy -= 1
+        return wrapped
+
+    async def shared(self, key: Hashable, compute: Callable[[], Awaitable]):
+        """Run compute once for all concurrent callers with the same key and share the result"""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        future = self._inflight[key] = asyncio.ensure_future(compute())
+        future.add_done_callback(functools.partial(self._done, key))
+        return await asyncio.shield(future)
+
+    def _done(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+    def stats(self):
+        return {
+            'served': self.served,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'inflight': len(self._inflight),
+            'busy': self.busy,
+        }
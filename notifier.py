@@ -0,0 +1,215 @@
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from telegram.error import Forbidden, NetworkError, RetryAfter, TelegramError
+
+from config import (
+    NOTIFY_WORKERS, NOTIFY_QUEUE_SIZE, NOTIFY_GLOBAL_RATE,
+    NOTIFY_CHAT_RATE, NOTIFY_MAX_RETRIES
+)
+from logger import logger
+from ratelimit import BucketRegistry, TokenBucket
+
+# Lower values are delivered first
+PRIORITY_ALERT = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BULK = 10
+
+
+@dataclass
+class Notification:
+    chat_id: int
+    text: str
+    priority: int = PRIORITY_NORMAL
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def key(self) -> Tuple[int, str]:
+        return self.chat_id, self.text
+
+
+class NotificationDispatcher:
+    """Bounded, prioritised, rate-limited fan-out of outgoing messages
+
+    A pool of sender tasks drains a priority queue. Every send takes a token
+    from the global bucket and from the recipient chat's bucket; chats that
+    are over their limit are re-queued later instead of blocking a sender.
+    RetryAfter from Telegram pauses all senders for the requested time.
+    Identical messages to the same chat are collapsed while one is pending.
+
+    ``bot`` is anything with an async ``send_message(chat_id=..., text=...)``.
+    """
+
+    def __init__(self, bot: Any, workers: int = NOTIFY_WORKERS, max_queue: int = NOTIFY_QUEUE_SIZE,
+                 global_rate: float = NOTIFY_GLOBAL_RATE, chat_rate: float = NOTIFY_CHAT_RATE,
+                 max_retries: int = NOTIFY_MAX_RETRIES):
+        self.bot = bot
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        # Capacity 1 keeps sends evenly spaced, so no one-second window exceeds the limit
+        self.global_bucket = TokenBucket(global_rate, capacity=1.0)
+        self.chat_buckets = BucketRegistry(chat_rate, capacity=1.0)
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._pending: Set[Tuple[int, str]] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._paused_until = 0.0
+        self._tasks: List[asyncio.Task] = []
+        self._started_at: Optional[float] = None
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._delivery_time = 0.0
+
+    @property
+    def depth(self) -> int:
+        """Notifications waiting to be sent, including deferred retries"""
+        return len(self._pending)
+
+    def is_pending(self, chat_id: int, text: str) -> bool:
+        """Whether this exact message is queued for chat_id, e.g. why submit() refused a duplicate"""
+        return (chat_id, text) in self._pending
+
+    def submit(self, chat_id: int, text: str, priority: int = PRIORITY_NORMAL) -> bool:
+        """Queue a message; False if it duplicates a pending one or the queue is full"""
+        note = Notification(chat_id, text, priority)
+        if note.key in self._pending:
+            self.deduplicated += 1
+            return False
+        if len(self._pending) >= self.max_queue:
+            self.dropped += 1
+            logger.warning(f"Notification queue full, dropping message to {chat_id}")
+            return False
+        self._pending.add(note.key)
+        self._idle.clear()
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, len(self._pending))
+        self._enqueue(note)
+        return True
+
+    def _enqueue(self, note: Notification) -> None:
+        self._queue.put_nowait((note.priority, next(self._seq), note))
+
+    def _defer(self, note: Notification, delay: float) -> None:
+        asyncio.get_running_loop().call_later(delay, self._enqueue, note)
+
+    def _finish(self, note: Notification) -> None:
+        self._pending.discard(note.key)
+        if not self._pending:
+            self._idle.set()
+
+    def set_global_rate(self, rate: float) -> None:
+        """Change the bot-wide send rate, e.g. when cluster workers join or leave"""
+        self.global_bucket.set_rate(rate)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._started_at = time.monotonic()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Notification dispatcher started with {self.workers} senders")
+
+    async def join(self) -> None:
+        """Wait until every queued notification is sent or given up on"""
+        await self._idle.wait()
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Drain the queue for up to drain_timeout seconds, then stop the senders"""
+        if self._pending:
+            try:
+                await asyncio.wait_for(self.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Stopping dispatcher with {self.depth} notifications undelivered")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, note = await self._queue.get()
+            try:
+                await self._deliver(note)
+            except Exception as e:
+                logger.error(f"Unexpected error delivering to {note.chat_id}: {str(e)}")
+                self.failed += 1
+                self._finish(note)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, note: Notification) -> None:
+        chat_bucket = self.chat_buckets.get(note.chat_id)
+        wait = chat_bucket.delay()
+        if wait > 0:
+            self._defer(note, wait)
+            return
+
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.global_bucket.acquire()
+            # A flood-wait may have begun while this sender waited for its token
+            if self._paused_until <= time.monotonic():
+                break
+        if not chat_bucket.try_acquire():
+            # Another sender used this chat's token while we waited
+            self._defer(note, chat_bucket.delay())
+            return
+
+        try:
+            await self.bot.send_message(chat_id=note.chat_id, text=note.text)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self.retried += 1
+            logger.warning(f"Flood limit hit, pausing sends for {retry_after}s")
+            self._defer(note, retry_after)
+            return
+        except Forbidden as e:
+            # Bot was blocked or removed from the chat; retrying will not help
+            logger.info(f"Cannot message {note.chat_id}: {str(e)}")
+            self.failed += 1
+        except NetworkError as e:
+            note.attempts += 1
+            if note.attempts <= self.max_retries:
+                self.retried += 1
+                self._defer(note, 2 ** note.attempts)
+                return
+            logger.error(f"Giving up on message to {note.chat_id} after {note.attempts} attempts: {str(e)}")
+            self.failed += 1
+        except TelegramError as e:
+            logger.error(f"Error sending message to {note.chat_id}: {str(e)}")
+            self.failed += 1
+        else:
+            self.sent += 1
+            self._delivery_time += time.monotonic() - note.enqueued_at
+        self._finish(note)
+
+    def stats(self) -> Dict[str, float]:
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            'submitted': self.submitted,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'deduplicated': self.deduplicated,
+            'dropped': self.dropped,
+            'queue_depth': self.depth,
+            'max_queue_depth': self.max_depth,
+            'sent_per_second': self.sent / elapsed if elapsed else 0.0,
+            'mean_delivery_seconds': self._delivery_time / self.sent if self.sent else 0.0,
+        }
@@ -0,0 +1,112 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import MOEX_POLL_INTERVAL, CBR_POLL_INTERVAL, POLL_MAX_BACKOFF
+from logger import logger
+from rate_cache import RateCache, RateSnapshot
+from rate_sources import RateAggregator
+
+SnapshotListener = Callable[[RateSnapshot], Awaitable[None]]
+
+
+class RatePoller:
+    """Background refresh of MOEX and CBR rates
+
+    Rates are read through the hedged source aggregator every MOEX interval,
+    and the CBR source is refreshed on its own, slower interval. Every
+    successful read publishes a new immutable snapshot into the rate cache
+    and notifies listeners (alert checks and the like), so handlers read
+    rates without any network I/O. Failing polls back off exponentially
+    with jitter.
+    """
+
+    def __init__(self, sources: RateAggregator, cache: RateCache,
+                 moex_interval: float = MOEX_POLL_INTERVAL,
+                 cbr_interval: float = CBR_POLL_INTERVAL,
+                 max_backoff: float = POLL_MAX_BACKOFF):
+        self.sources = sources
+        self.cache = cache
+        self.moex_interval = moex_interval
+        self.cbr_interval = cbr_interval
+        self.max_backoff = max_backoff
+        self.listeners: List[SnapshotListener] = []
+        self.last_success: Dict[str, Optional[float]] = {'rates': None, 'cbr': None}
+        self.failures: Dict[str, int] = {'rates': 0, 'cbr': 0}
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def snapshot(self) -> Optional[RateSnapshot]:
+        """Latest published snapshot, None until the first poll completes"""
+        return self.cache.snapshot
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def subscribe(self, listener: SnapshotListener) -> None:
+        """Call listener with every newly published snapshot"""
+        self.listeners.append(listener)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        logger.info(f"Starting rate poller (MOEX every {self.moex_interval}s, CBR every {self.cbr_interval}s)")
+        self._tasks = [
+            asyncio.create_task(self._run('cbr', self.cbr_interval, self._poll_cbr)),
+            asyncio.create_task(self._run('rates', self.moex_interval, self._poll_rates)),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Rate poller stopped")
+
+    def staleness(self) -> Dict[str, Optional[float]]:
+        """Seconds since the snapshot and each polling loop last succeeded"""
+        now = time.monotonic()
+        result = {
+            source: (now - last if last is not None else None)
+            for source, last in self.last_success.items()
+        }
+        result['snapshot'] = self.snapshot.age() if self.snapshot else None
+        return result
+
+    def backoff_delay(self, interval: float, failures: int) -> float:
+        """Exponential backoff capped at max_backoff, with jitter to avoid lockstep retries"""
+        delay = min(self.max_backoff, interval * (2 ** failures))
+        return random.uniform(delay / 2, delay)
+
+    async def _run(self, source: str, interval: float, poll: Callable[[], Awaitable[None]]) -> None:
+        while True:
+            try:
+                await poll()
+                self.failures[source] = 0
+                self.last_success[source] = time.monotonic()
+                delay = interval
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures[source] += 1
+                delay = self.backoff_delay(interval, self.failures[source])
+                logger.error(f"Error polling {source} rates (attempt {self.failures[source]}), "
+                             f"retrying in {delay:.1f}s: {str(e)}")
+            await asyncio.sleep(delay)
+
+    async def _poll_cbr(self) -> None:
+        await self.sources.refresh('cbr')
+
+    async def _poll_rates(self) -> None:
+        await self.publish(await self.sources.fetch())
+
+    async def publish(self, snapshot: RateSnapshot) -> None:
+        """Make snapshot current and notify listeners"""
+        self.cache.publish(snapshot)
+        for listener in self.listeners:
+            try:
+                await listener(snapshot)
+            except Exception as e:
+                logger.error(f"Error in snapshot listener {listener!r}: {str(e)}")
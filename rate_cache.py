@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Awaitable, Callable, Dict, Mapping, Optional, Union
+
+from config import RATE_CACHE_FAILURE_TTL, RATE_CACHE_TTL, SNAPSHOT_MAX_AGE
+from logger import logger
+
+
+@dataclass(frozen=True)
+class RateSnapshot:
+    """Immutable set of exchange rates captured at a single point in time
+
+    ``sources`` names the provider each rate came from (e.g. 'moex', 'cbr').
+    """
+    rates: Mapping[str, float]
+    fetched_at: float = field(default_factory=time.time)
+    monotonic: float = field(default_factory=time.monotonic)
+    sources: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+
+    @classmethod
+    def from_rates(cls, rates: Optional[Dict[str, float]],
+                   sources: Optional[Dict[str, str]] = None) -> "RateSnapshot":
+        return cls(rates=MappingProxyType(dict(rates or {})),
+                   sources=MappingProxyType(dict(sources or {})))
+
+    def age(self) -> float:
+        """Seconds elapsed since the snapshot was taken"""
+        return time.monotonic() - self.monotonic
+
+
+def save_snapshot(snapshot: RateSnapshot, path: str) -> None:
+    """Write snapshot to path atomically, so a crash never leaves a truncated file"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'rates': dict(snapshot.rates), 'sources': dict(snapshot.sources),
+                   'fetched_at': snapshot.fetched_at}, f)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str, max_age: float = SNAPSHOT_MAX_AGE) -> Optional[RateSnapshot]:
+    """Read a snapshot written by save_snapshot; None if missing, unreadable or older than max_age"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        fetched_at = float(data['fetched_at'])
+        rates = {currency: float(rate) for currency, rate in data['rates'].items()}
+        sources = {currency: str(source) for currency, source in data.get('sources', {}).items()}
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.warning(f"Ignoring unreadable snapshot file {path}: {str(e)}")
+        return None
+    age = max(time.time() - fetched_at, 0.0)
+    if not rates or age > max_age:
+        return None
+    # Back-date the monotonic stamp so age() and cache freshness count the time spent on disk
+    return RateSnapshot(rates=MappingProxyType(rates), fetched_at=fetched_at,
+                        monotonic=time.monotonic() - age, sources=MappingProxyType(sources))
+
+
+class RateCache:
+    """TTL cache for rate snapshots with single-flight refresh
+
+    Concurrent callers that find the snapshot expired share one in-flight
+    refresh, so upstream calls are bounded to one per TTL window regardless
+    of how many handlers are waiting. A failed refresh is remembered for
+    ``failure_ttl`` seconds, during which callers get the stale (or empty)
+    snapshot instead of starting another upstream call.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[Union[Dict[str, float], "RateSnapshot"]]],
+                 ttl: float = RATE_CACHE_TTL, failure_ttl: float = RATE_CACHE_FAILURE_TTL):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.snapshot: Optional[RateSnapshot] = None
+        self._inflight: Optional[asyncio.Future] = None
+        self._failed_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    def is_fresh(self) -> bool:
+        return self.snapshot is not None and self.snapshot.age() < self.ttl
+
+    async def get(self) -> RateSnapshot:
+        """Return the cached snapshot, refreshing it if it has expired"""
+        if self.is_fresh():
+            self.hits += 1
+            return self.snapshot
+
+        self.misses += 1
+        if self._inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(self._inflight)
+        if self._failed_at is not None and time.monotonic() - self._failed_at < self.failure_ttl:
+            # The last refresh failed moments ago; don't hammer a struggling upstream
+            return self.snapshot or RateSnapshot.from_rates({})
+
+        self._inflight = asyncio.ensure_future(self._refresh())
+        return await asyncio.shield(self._inflight)
+
+    async def _refresh(self) -> RateSnapshot:
+        self.refreshes += 1
+        try:
+            rates = await self.fetch()
+        except Exception as e:
+            logger.error(f"Error refreshing rate snapshot: {str(e)}")
+            rates = None
+        finally:
+            self._inflight = None
+
+        snapshot = rates if isinstance(rates, RateSnapshot) else RateSnapshot.from_rates(rates)
+        if snapshot.rates:
+            self.publish(snapshot)
+            return self.snapshot
+        self._failed_at = time.monotonic()
+        self.failures += 1
+        if self.snapshot is None:
+            # Nothing to serve yet; hand back an empty snapshot without caching it
+            return RateSnapshot.from_rates({})
+        logger.warning("Rate refresh returned no data, serving stale snapshot")
+        return self.snapshot
+
+    def current(self) -> Optional[RateSnapshot]:
+        """The published snapshot whatever its age, counted as a hit; None before the first one
+
+        For readers fed by the background poller, which keeps the snapshot
+        current and serves a stale one rather than fetching on demand.
+        """
+        if self.snapshot is not None:
+            self.hits += 1
+        return self.snapshot
+
+    def publish(self, snapshot: RateSnapshot) -> None:
+        """Replace the cached snapshot"""
+        self.snapshot = snapshot
+        self._failed_at = None
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'coalesced': self.coalesced,
+            'failures': self.failures,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'age': self.snapshot.age() if self.snapshot else None,
+        }
@@ -0,0 +1,249 @@
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from config import HISTORY_DIR, HISTORY_CHUNK_RECORDS, HISTORY_FLUSH_RECORDS
+from rate_cache import RateSnapshot
+
+# Rollup resolutions in seconds; 'tick' keeps every polled snapshot
+RESOLUTIONS = {'tick': 0, '1m': 60, '1h': 3600, '1d': 86400}
+
+Point = Tuple[float, float]
+
+
+class _MappedChunk:
+    """Read-only float64 views over one chunk's timestamp and price files"""
+
+    def __init__(self, ts_path: str, px_path: str):
+        self._files = [open(ts_path, 'rb'), open(px_path, 'rb')]
+        self._maps = [mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) for f in self._files]
+        self.ts = memoryview(self._maps[0]).cast('d')
+        self.px = memoryview(self._maps[1]).cast('d')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.ts.release()
+        self.px.release()
+        for m in self._maps:
+            m.close()
+        for f in self._files:
+            f.close()
+
+
+class Series:
+    """Append-only (timestamp, price) columns split into fixed-size chunk files
+
+    Each chunk is a pair of raw float64 files, ``NNNNNNNN.ts`` and
+    ``NNNNNNNN.px``, holding up to ``chunk_records`` values. Queries
+    memory-map only the chunks they touch and binary-search the timestamp
+    column, so history is never loaded into memory as a whole. New points
+    are buffered in ``array('d')`` tails and written every ``flush_records``.
+    """
+
+    def __init__(self, directory: str, chunk_records: int = HISTORY_CHUNK_RECORDS,
+                 flush_records: int = HISTORY_FLUSH_RECORDS):
+        self.directory = directory
+        self.chunk_records = chunk_records
+        self.flush_records = flush_records
+        os.makedirs(directory, exist_ok=True)
+        self.first_ts: List[float] = []   # first timestamp of every chunk on disk
+        self.sizes: List[int] = []        # records in every chunk on disk
+        self.last_point: Optional[Point] = None
+        self._tail_ts = array('d')
+        self._tail_px = array('d')
+        self._scan()
+
+    def _path(self, chunk: int, column: str) -> str:
+        return os.path.join(self.directory, f'{chunk:08d}.{column}')
+
+    def _scan(self) -> None:
+        chunk = 0
+        while os.path.exists(self._path(chunk, 'ts')):
+            size = min(os.path.getsize(self._path(chunk, 'ts')), os.path.getsize(self._path(chunk, 'px'))) // 8
+            if size == 0:
+                break
+            # A crash between the two column writes leaves them uneven; drop the partial record
+            for column in ('ts', 'px'):
+                if os.path.getsize(self._path(chunk, column)) != size * 8:
+                    os.truncate(self._path(chunk, column), size * 8)
+            with _MappedChunk(self._path(chunk, 'ts'), self._path(chunk, 'px')) as mapped:
+                self.first_ts.append(mapped.ts[0])
+                self.last_point = (mapped.ts[size - 1], mapped.px[size - 1])
+            self.sizes.append(size)
+            chunk += 1
+
+    def __len__(self) -> int:
+        return sum(self.sizes) + len(self._tail_ts)
+
+    def append(self, ts: float, price: float) -> None:
+        """Add a point; timestamps must not go backwards"""
+        if self.last_point is not None and ts < self.last_point[0]:
+            raise ValueError(f"Out-of-order timestamp {ts} < {self.last_point[0]}")
+        self._tail_ts.append(ts)
+        self._tail_px.append(price)
+        self.last_point = (ts, price)
+        if len(self._tail_ts) >= self.flush_records:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered points to disk, starting new chunks as they fill"""
+        written = 0
+        pending = len(self._tail_ts)
+        while written < pending:
+            if not self.sizes or self.sizes[-1] >= self.chunk_records:
+                self.sizes.append(0)
+                self.first_ts.append(self._tail_ts[written])
+            chunk = len(self.sizes) - 1
+            count = min(self.chunk_records - self.sizes[-1], pending - written)
+            with open(self._path(chunk, 'ts'), 'ab') as f:
+                self._tail_ts[written:written + count].tofile(f)
+            with open(self._path(chunk, 'px'), 'ab') as f:
+                self._tail_px[written:written + count].tofile(f)
+            self.sizes[-1] += count
+            written += count
+        del self._tail_ts[:]
+        del self._tail_px[:]
+
+    def range(self, start: float, end: float) -> List[Point]:
+        """Points with start <= timestamp <= end, oldest first"""
+        points: List[Point] = []
+        first = max(0, bisect_right(self.first_ts, start) - 1)
+        for chunk in range(first, len(self.sizes)):
+            if self.first_ts[chunk] > end:
+                break
+            with _MappedChunk(self._path(chunk, 'ts'), self._path(chunk, 'px')) as mapped:
+                ts = mapped.ts[:self.sizes[chunk]]
+                lo = bisect_left(ts, start)
+                hi = bisect_right(ts, end)
+                points.extend(zip(ts[lo:hi].tolist(), mapped.px[lo:hi].tolist()))
+                ts.release()
+        lo = bisect_left(self._tail_ts, start)
+        hi = bisect_right(self._tail_ts, end)
+        points.extend(zip(self._tail_ts[lo:hi], self._tail_px[lo:hi]))
+        return points
+
+    def last(self, n: int) -> List[Point]:
+        """The n most recent points, oldest first"""
+        if n <= 0:
+            return []
+        tail = list(zip(self._tail_ts[-n:], self._tail_px[-n:]))
+        needed = n - len(tail)
+        chunks: List[List[Point]] = []
+        chunk = len(self.sizes) - 1
+        while needed > 0 and chunk >= 0:
+            size = self.sizes[chunk]
+            take = min(needed, size)
+            with _MappedChunk(self._path(chunk, 'ts'), self._path(chunk, 'px')) as mapped:
+                chunks.append(list(zip(mapped.ts[size - take:size].tolist(),
+                                       mapped.px[size - take:size].tolist())))
+            needed -= take
+            chunk -= 1
+        points = [point for part in reversed(chunks) for point in part]
+        return points + tail
+
+
+class RateHistory:
+    """Per-currency tick history plus 1m/1h/1d rollups of closing prices
+
+    A rollup bucket is written as soon as a later tick shows it has closed
+    (only ticks are buffered, since a lost closed bucket could not be
+    reopened after a restart); the bucket still in progress is kept in
+    memory and included in queries.
+
+    Methods are thread-safe, so the bot calls them through asyncio.to_thread
+    and keeps file I/O off the event loop. Ticks whose timestamp goes back
+    in time (a wall-clock step) are recorded at the last tick's timestamp.
+    """
+
+    def __init__(self, root: str = HISTORY_DIR, chunk_records: int = HISTORY_CHUNK_RECORDS,
+                 flush_records: int = HISTORY_FLUSH_RECORDS):
+        self.root = root
+        self.chunk_records = chunk_records
+        self.flush_records = flush_records
+        self.series: Dict[Tuple[str, str], Series] = {}
+        self._open_buckets: Dict[Tuple[str, str], Point] = {}
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+        for currency in sorted(os.listdir(root)):
+            if os.path.isdir(os.path.join(root, currency)):
+                self._resume(currency)
+
+    def _series(self, currency: str, resolution: str) -> Series:
+        key = (currency, resolution)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = Series(
+                os.path.join(self.root, currency, resolution), self.chunk_records,
+                self.flush_records if resolution == 'tick' else 1
+            )
+        return series
+
+    def _resume(self, currency: str) -> None:
+        """Reopen the in-progress rollup buckets from the last stored tick"""
+        last = self._series(currency, 'tick').last_point
+        if last is None:
+            return
+        for resolution, seconds in RESOLUTIONS.items():
+            if seconds:
+                stored = self._series(currency, resolution).last_point
+                bucket = last[0] - last[0] % seconds
+                if stored is None or stored[0] < bucket:
+                    self._open_buckets[(currency, resolution)] = (bucket, last[1])
+
+    def currencies(self) -> List[str]:
+        return sorted({currency for currency, _ in self.series})
+
+    def append(self, currency: str, ts: float, price: float) -> None:
+        with self._lock:
+            ticks = self._series(currency, 'tick')
+            if ticks.last_point is not None and ts < ticks.last_point[0]:
+                ts = ticks.last_point[0]
+            ticks.append(ts, price)
+            for resolution, seconds in RESOLUTIONS.items():
+                if not seconds:
+                    continue
+                key = (currency, resolution)
+                bucket = ts - ts % seconds
+                current = self._open_buckets.get(key)
+                if current is not None and current[0] < bucket:
+                    self._series(currency, resolution).append(*current)
+                self._open_buckets[key] = (bucket, price)
+
+    def append_snapshot(self, snapshot: RateSnapshot) -> None:
+        with self._lock:
+            for currency, price in snapshot.rates.items():
+                if price is not None:
+                    self.append(currency, snapshot.fetched_at, float(price))
+
+    def flush(self) -> None:
+        with self._lock:
+            for series in self.series.values():
+                series.flush()
+
+    def _with_open_bucket(self, currency: str, resolution: str, points: List[Point],
+                          start: float = float('-inf'), end: float = float('inf')) -> List[Point]:
+        current = self._open_buckets.get((currency, resolution))
+        if current is not None and start <= current[0] <= end:
+            points.append(current)
+        return points
+
+    def range(self, currency: str, start: float, end: float, resolution: str = 'tick') -> List[Point]:
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        with self._lock:
+            points = self._series(currency, resolution).range(start, end)
+            return self._with_open_bucket(currency, resolution, points, start, end)
+
+    def last(self, currency: str, n: int, resolution: str = 'tick') -> List[Point]:
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        with self._lock:
+            if resolution == 'tick' or (currency, resolution) not in self._open_buckets:
+                return self._series(currency, resolution).last(n)
+            points = self._series(currency, resolution).last(n - 1)
+            return self._with_open_bucket(currency, resolution, points)
@@ -0,0 +1,267 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+
+from config import (
+    CBR_POLL_INTERVAL, RATE_HEDGE_DELAY, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+)
+from exchange_api import AsyncMOEXAPI
+from logger import logger
+from metrics import UPSTREAM_ERRORS, UPSTREAM_LATENCY
+from rate_cache import RateSnapshot
+
+
+class CircuitOpenError(Exception):
+    """Raised when a source is skipped because its circuit breaker is open"""
+
+
+class NoRatesAvailable(Exception):
+    """Raised when no source produced usable rates"""
+
+
+class CircuitBreaker:
+    """Closed → open after consecutive failures, half-open again once reset_timeout has passed
+
+    A half-open breaker lets calls through; the first result closes it or
+    opens it again. RateSource shares one in-flight call, so that is a
+    single trial request.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; moves an expired open breaker to half-open"""
+        if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        return self.state != self.OPEN
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = self.clock()
+
+
+class RateSource(ABC):
+    """One upstream provider of RUB rates
+
+    ``get()`` guards ``fetch()`` with the circuit breaker, records latency,
+    and shares a single in-flight request between concurrent callers. Answers
+    younger than ``max_age`` are served from memory without a request.
+    """
+
+    name = 'source'
+
+    def __init__(self, max_age: float = 0.0, breaker: Optional[CircuitBreaker] = None):
+        self.max_age = max_age
+        self.breaker = breaker or CircuitBreaker()
+        # Shared per source name with the /metrics endpoint
+        self.latency = UPSTREAM_LATENCY.labels(self.name)
+        self._error_counter = UPSTREAM_ERRORS.labels(self.name)
+        self.last_rates: Dict[str, float] = {}
+        self.last_success: Optional[float] = None
+        self.errors = 0
+        self._inflight: Optional[asyncio.Future] = None
+
+    @abstractmethod
+    async def fetch(self) -> Dict[str, float]:
+        """Request rates upstream, raising on any failure"""
+
+    @property
+    def available(self) -> bool:
+        return (self._inflight is not None or bool(self.last_rates and self.is_fresh())
+                or self.breaker.allow())
+
+    def is_fresh(self) -> bool:
+        return (self.last_success is not None
+                and time.monotonic() - self.last_success < self.max_age)
+
+    async def get(self) -> Dict[str, float]:
+        """Latest rates from this source, fetching them unless a fresh answer is held"""
+        if self.last_rates and self.is_fresh():
+            return self.last_rates
+        return await self.refresh()
+
+    async def refresh(self) -> Dict[str, float]:
+        """Fetch now (joining a request already in flight), ignoring max_age"""
+        if self._inflight is None:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            self._inflight = asyncio.ensure_future(self._call())
+            self._inflight.add_done_callback(self._clear_inflight)
+        return await asyncio.shield(self._inflight)
+
+    def _clear_inflight(self, future: asyncio.Future) -> None:
+        if self._inflight is future:
+            self._inflight = None
+        if not future.cancelled():
+            future.exception()  # retrieved here so losing hedges never warn
+
+    async def _call(self) -> Dict[str, float]:
+        start = time.perf_counter()
+        try:
+            rates = await self.fetch()
+            if not rates:
+                raise ValueError(f"{self.name} returned no rates")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.errors += 1
+            self._error_counter.inc()
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+        self.breaker.record_success()
+        self.last_rates = dict(rates)
+        self.last_success = time.monotonic()
+        return self.last_rates
+
+    def stats(self):
+        return {
+            'state': self.breaker.state,
+            'trips': self.breaker.trips,
+            'errors': self.errors,
+            'latency': self.latency.stats(),
+        }
+
+
+class MOEXSource(RateSource):
+    """Live exchange rates from MOEX ISS"""
+
+    name = 'moex'
+
+    def __init__(self, api: AsyncMOEXAPI, **kwargs):
+        super().__init__(**kwargs)
+        self.api = api
+
+    async def fetch(self) -> Dict[str, float]:
+        return await self.api.fetch_moex_rates()
+
+
+class CBRSource(RateSource):
+    """Central Bank official rates; published daily, so answers are reused for max_age"""
+
+    name = 'cbr'
+
+    def __init__(self, api: AsyncMOEXAPI, max_age: float = CBR_POLL_INTERVAL, **kwargs):
+        super().__init__(max_age=max_age, **kwargs)
+        self.api = api
+
+    async def fetch(self) -> Dict[str, float]:
+        return dict(await self.api.refresh_cbr_rates())
+
+
+class RateAggregator:
+    """Hedged reads across rate sources in priority order
+
+    The first available source is queried; if it has not answered within
+    ``hedge_delay`` (or fails, or its breaker is open) the next one is
+    queried as well, and the first usable answer wins. Currencies missing
+    from the winner are filled from the other sources' last good answers,
+    and the snapshot records which source every rate came from.
+    """
+
+    def __init__(self, sources: Sequence[RateSource], hedge_delay: float = RATE_HEDGE_DELAY):
+        self.sources: List[RateSource] = list(sources)
+        self.hedge_delay = hedge_delay
+        self.hedged = 0
+        self.wins: Dict[str, int] = {source.name: 0 for source in self.sources}
+
+    def source(self, name: str) -> RateSource:
+        for source in self.sources:
+            if source.name == name:
+                return source
+        raise KeyError(name)
+
+    async def refresh(self, name: str) -> Dict[str, float]:
+        """Refresh one source outside the hedged path (e.g. the daily CBR poll)"""
+        return await self.source(name).refresh()
+
+    async def fetch(self) -> RateSnapshot:
+        """Rates from the fastest healthy source, raising NoRatesAvailable if none answers"""
+        candidates = iter([source for source in self.sources if source.available])
+        pending: Dict[asyncio.Task, RateSource] = {}
+        winner: Optional[RateSource] = None
+        rates: Dict[str, float] = {}
+
+        def launch() -> bool:
+            source = next(candidates, None)
+            if source is None:
+                return False
+            pending[asyncio.ensure_future(source.get())] = source
+            return True
+
+        has_more = launch()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, timeout=self.hedge_delay if has_more else None,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary is over its latency budget: ask the next source too
+                    self.hedged += 1
+                    has_more = launch()
+                    continue
+                for task in done:
+                    source = pending.pop(task)
+                    try:
+                        rates = task.result()
+                    except Exception as e:
+                        logger.warning(f"Rate source {source.name} failed: {str(e)}")
+                        has_more = launch()
+                        continue
+                    winner = source
+                    break
+                if winner is not None:
+                    break
+        finally:
+            # Losing requests keep running in their sources and still feed breakers and histograms
+            for task in pending:
+                task.cancel()
+
+        if winner is None:
+            raise NoRatesAvailable("No rate source returned usable data")
+        self.wins[winner.name] += 1
+        return self._merge(winner, rates)
+
+    def _merge(self, winner: RateSource, rates: Dict[str, float]) -> RateSnapshot:
+        merged = dict(rates)
+        sources = dict.fromkeys(rates, winner.name)
+        for source in self.sources:
+            if source is winner:
+                continue
+            for currency, rate in source.last_rates.items():
+                if currency not in merged:
+                    merged[currency] = rate
+                    sources[currency] = source.name
+        return RateSnapshot.from_rates(merged, sources)
+
+    def stats(self):
+        return {
+            'hedged': self.hedged,
+            'wins': dict(self.wins),
+            'sources': {source.name: source.stats() for source in self.sources},
+        }
+
+
+def default_sources(api: AsyncMOEXAPI) -> RateAggregator:
+    """MOEX first, CBR as the hedge and gap filler"""
+    return RateAggregator([MOEXSource(api), CBRSource(api)])
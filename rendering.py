@@ -0,0 +1,70 @@
+from typing import Dict, Mapping, Optional
+
+from logger import logger
+from rate_cache import RateSnapshot
+from utils import format_currency_message
+
+
+class RenderedSnapshot:
+    """Message texts for one snapshot, rendered once and reused for every request"""
+
+    def __init__(self, snapshot: RateSnapshot, previous: Optional[RateSnapshot]):
+        previous_rates: Mapping[str, float] = previous.rates if previous else {}
+        self.snapshot = snapshot
+        self.all_rates = format_currency_message(snapshot.rates, previous_rates, snapshot.fetched_at)
+        self.single: Dict[str, str] = {
+            currency: format_currency_message({currency: rate}, previous_rates, snapshot.fetched_at)
+            for currency, rate in snapshot.rates.items()
+            if rate
+        }
+
+
+class RateRenderer:
+    """Caches rendered rate messages for the current snapshot
+
+    Rate moods compare each snapshot with the one published before it, so
+    every user sees the same text for the same snapshot. A new snapshot
+    replaces the cached rendering.
+    """
+
+    def __init__(self):
+        self.current: Optional[RenderedSnapshot] = None
+        self._previous: Optional[RateSnapshot] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _rendered(self, snapshot: RateSnapshot) -> RenderedSnapshot:
+        current = self.current
+        if current is not None and current.snapshot is snapshot:
+            self.hits += 1
+            return current
+        self.misses += 1
+        return self.render(snapshot)
+
+    def render(self, snapshot: RateSnapshot) -> RenderedSnapshot:
+        """Render snapshot against the previously rendered one and cache it"""
+        current = self.current
+        if current is not None and current.snapshot is not snapshot:
+            self._previous = current.snapshot
+        self.current = RenderedSnapshot(snapshot, self._previous)
+        logger.debug(f"Rendered rate messages for snapshot taken at {snapshot.fetched_at}")
+        return self.current
+
+    async def on_snapshot(self, snapshot: RateSnapshot) -> None:
+        """Poller listener: render a new snapshot before anyone asks for it"""
+        self.render(snapshot)
+
+    def all_rates(self, snapshot: RateSnapshot) -> str:
+        return self._rendered(snapshot).all_rates
+
+    def single(self, snapshot: RateSnapshot, currency: str) -> Optional[str]:
+        """Single-currency message, None if the snapshot has no rate for it"""
+        return self._rendered(snapshot).single.get(currency)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
@@ -30,7 +30,11 @@ setup(
     install_requires=[
         "python-telegram-bot[job-queue]>=21.10",
         "requests>=2.32.3",
+        "httpx>=0.27",
     ],
+    extras_require={
+        "fast": ["numpy>=1.24", "orjson>=3.9"],
+    },
     keywords="telegram bot currency exchange rates forex",
     project_urls={
         "Bug Reports": "https://github.com/yourusername/currency-telegram-bot/issues",
@@ -0,0 +1,93 @@
+import heapq
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from config import DIGEST_BUCKET_SECONDS, DIGEST_DAILY_HOUR
+
+# Seconds between digests for every supported cadence
+CADENCES = {'hourly': 3600, 'daily': 86400}
+
+
+class Subscription(NamedTuple):
+    """A chat's standing request for a periodic rate digest"""
+    chat_id: int
+    cadence: str
+    currencies: Tuple[str, ...]
+    language: str
+    next_due: float
+
+
+def next_due_time(cadence: str, after: float) -> float:
+    """First digest slot for cadence strictly after the given time
+
+    Hourly digests go out on the hour, daily ones at DIGEST_DAILY_HOUR UTC,
+    so every subscriber of a cadence shares a slot and one rendering.
+    """
+    period = CADENCES[cadence]
+    offset = DIGEST_DAILY_HOUR * 3600 if cadence == 'daily' else 0
+    return after - (after - offset) % period + period
+
+
+class ScheduleIndex:
+    """Subscriptions grouped into fixed-width buckets by due time
+
+    A tick pops whole buckets whose start has passed, so it touches only
+    the subscribers that are due, never the full table. Bucket keys sit in
+    a min-heap; a key whose bucket was emptied by unsubscribes is skipped
+    when popped.
+    """
+
+    def __init__(self, bucket_seconds: int = DIGEST_BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.buckets: Dict[int, Dict[int, Subscription]] = {}
+        self.by_chat: Dict[int, Subscription] = {}
+        self._keys: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.by_chat)
+
+    def _key(self, due: float) -> int:
+        return int(due // self.bucket_seconds)
+
+    def get(self, chat_id: int) -> Optional[Subscription]:
+        return self.by_chat.get(chat_id)
+
+    def add(self, subscription: Subscription) -> None:
+        """Insert or replace the chat's subscription"""
+        self.remove(subscription.chat_id)
+        key = self._key(subscription.next_due)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = {}
+            heapq.heappush(self._keys, key)
+        bucket[subscription.chat_id] = subscription
+        self.by_chat[subscription.chat_id] = subscription
+
+    def remove(self, chat_id: int) -> Optional[Subscription]:
+        subscription = self.by_chat.pop(chat_id, None)
+        if subscription is not None:
+            key = self._key(subscription.next_due)
+            bucket = self.buckets[key]
+            del bucket[chat_id]
+            if not bucket:
+                del self.buckets[key]
+        return subscription
+
+    def next_due(self) -> Optional[float]:
+        """Start of the earliest non-empty bucket"""
+        keys = self._keys
+        while keys and keys[0] not in self.buckets:
+            heapq.heappop(keys)
+        return keys[0] * self.bucket_seconds if keys else None
+
+    def pop_due(self, now: float) -> List[Subscription]:
+        """Remove and return every subscription in a bucket that has started by now"""
+        due: List[Subscription] = []
+        keys = self._keys
+        current = self._key(now)
+        while keys and keys[0] <= current:
+            bucket = self.buckets.pop(heapq.heappop(keys), None)
+            if bucket:
+                due.extend(bucket.values())
+                for chat_id in bucket:
+                    del self.by_chat[chat_id]
+        return due
@@ -0,0 +1,63 @@
+import math
+
+import pytest
+
+from alert_engine import Alert, AlertEngine
+
+
+def test_evaluate_pops_only_triggered_alerts():
+    engine = AlertEngine()
+    above = engine.add(1, 'USD', 90, True)
+    below = engine.add(2, 'USD', 110, False)
+    untouched = engine.add(3, 'USD', 120, True)
+    assert engine.evaluate({'USD': 100}) == [above, below]
+    assert list(engine.alerts) == [untouched.alert_id]
+    assert engine.evaluate({'USD': 100}) == []
+
+
+def test_removed_alert_does_not_trigger():
+    engine = AlertEngine()
+    alert = engine.add(1, 'USD', 90, True)
+    engine.remove(alert.alert_id)
+    assert engine.evaluate({'USD': 100}) == []
+
+
+@pytest.mark.parametrize('restore', ['restore', 'bulk_restore'])
+def test_restore_after_remove_triggers_once(restore):
+    engine = AlertEngine()
+    alert = engine.add(1, 'USD', 90, True)
+    engine.remove(alert.alert_id)
+    if restore == 'restore':
+        engine.restore(alert)
+    else:
+        engine.bulk_restore([alert])
+    assert engine.evaluate({'USD': 100}) == [alert]
+    assert len(engine) == 0
+
+
+def test_restore_after_evaluate_triggers_again():
+    engine = AlertEngine()
+    alert = engine.add(1, 'USD', 90, True)
+    assert engine.evaluate({'USD': 100}) == [alert]
+    engine.restore(alert)
+    assert engine.evaluate({'USD': 100}) == [alert]
+
+
+@pytest.mark.parametrize('threshold', [math.nan, math.inf, -math.inf])
+def test_non_finite_thresholds_are_rejected(threshold):
+    engine = AlertEngine()
+    with pytest.raises(ValueError):
+        engine.add(1, 'USD', threshold, True)
+    assert engine.bulk_restore([Alert(7, 1, 'USD', threshold, True)]) == 0
+    ok = engine.add(2, 'USD', 90, True)
+    assert engine.evaluate({'USD': 100}) == [ok]
+
+
+def test_bulk_restore_pages_match_single_pushes():
+    engine = AlertEngine()
+    alerts = [Alert(i, i, 'EUR', float(i % 97), i % 2 == 0) for i in range(1, 2001)]
+    for start in range(0, len(alerts), 100):
+        engine.bulk_restore(alerts[start:start + 100])
+    triggered = engine.evaluate({'EUR': 48.5})
+    expected = [a for a in alerts if a.is_triggered(48.5)]
+    assert sorted(triggered) == sorted(expected)
@@ -0,0 +1,58 @@
+import queue
+
+from alert_engine import Alert
+from alert_store import SQLiteAlertStore, shard_of
+from cluster import ClusterCoordinator, ClusterWorker, WorkerHandle
+
+SHARDS = 4
+
+
+def make_worker(tmp_path, alerts):
+    path = str(tmp_path / 'alerts.db')
+    store = SQLiteAlertStore(path, shards=SHARDS)
+    for alert in alerts:
+        store.save(alert)
+    store.flush()
+    store.close()
+    return ClusterWorker(1, queue.Queue(), queue.Queue(), SHARDS, token=None, db_path=path)
+
+
+def test_shard_handed_back_triggers_each_alert_once(tmp_path):
+    alerts = [Alert(i, user_id, 'USD', 90.0, True) for i, user_id in enumerate(range(1, 9), 1)]
+    worker = make_worker(tmp_path, alerts)
+    try:
+        assert worker.acquire(range(SHARDS)) == len(alerts)
+        moved = {shard_of(1, SHARDS)}
+        worker.release(moved)
+        worker.acquire(moved)
+        # The released alerts' old heap entries are gone, not duplicated alongside the reloaded ones
+        assert sum(len(index) for index in worker.engine.indexes.values()) == len(alerts)
+        worker.evaluate(1, {'USD': 95.0})
+        kind, _, seq, triggered, _ = worker.outbox.get_nowait()
+        assert (kind, seq, triggered) == ('evaluated', 1, len(alerts))
+        assert len(worker.engine) == 0
+    finally:
+        worker.store.close()
+
+
+def test_message_rate_is_split_with_the_main_dispatcher(tmp_path):
+    class Dispatcher:
+        rate = None
+
+        def set_global_rate(self, rate):
+            self.rate = rate
+
+    store = SQLiteAlertStore(str(tmp_path / 'alerts.db'), shards=SHARDS)
+    try:
+        coordinator = ClusterCoordinator(store, shards=SHARDS, token=None, global_rate=30.0)
+        coordinator.dispatcher = Dispatcher()
+        coordinator.workers = {worker_id: WorkerHandle(None, queue.Queue()) for worker_id in (1, 2)}
+        coordinator._share_rate([1, 2])
+        assert coordinator.dispatcher.rate == 10.0
+        assert [h.inbox.get_nowait() for h in coordinator.workers.values()] == [('rate', 10.0)] * 2
+        # A worker leaving raises the others' share
+        coordinator._share_rate([1])
+        assert coordinator.dispatcher.rate == 15.0
+        assert coordinator.workers[1].inbox.get_nowait() == ('rate', 15.0)
+    finally:
+        store.close()
@@ -0,0 +1,13 @@
+import pytest
+
+from bot import CurrencyBot
+
+
+@pytest.mark.parametrize('amount', ['nan', 'inf', '-inf', '-5', '0'])
+def test_non_finite_and_non_positive_amounts_are_rejected(amount):
+    with pytest.raises(ValueError):
+        CurrencyBot._parse_conversion(None, ['100', amount, 'USD', 'to', 'EUR'])
+
+
+def test_comma_decimal_amounts_are_parsed():
+    assert CurrencyBot._parse_conversion(None, ['1,5', 'USD', 'to', 'eur']) == ([1.5], 'USD', 'EUR')
@@ -0,0 +1,39 @@
+import asyncio
+
+from alert_store import MemoryAlertStore
+from digests import DigestScheduler
+from subscriptions import Subscription
+
+
+class PagedStore(MemoryAlertStore):
+    """Serves two pages of stored subscriptions, running a hook between them"""
+
+    def __init__(self, pages, between):
+        self.pages = pages
+        self.between = between
+
+    def iter_subscriptions(self, page_size=1000):
+        yield self.pages[0]
+        self.between()
+        yield from self.pages[1:]
+
+
+def stored(chat_id, cadence='daily'):
+    return Subscription(chat_id, cadence, ('USD',), 'en', 1e12)
+
+
+def test_load_keeps_changes_made_while_loading():
+    def between():
+        scheduler.unsubscribe(2)
+        scheduler.subscribe(3, 'hourly', ['EUR'], 'en', now=0.0)
+
+    store = PagedStore([[stored(1)], [stored(2), stored(3), stored(4)]], between)
+    scheduler = DigestScheduler(store, lambda: None)
+    asyncio.run(scheduler.load())
+    assert scheduler.index.get(1) == stored(1)
+    assert scheduler.index.get(2) is None
+    assert scheduler.index.get(3).cadence == 'hourly'
+    assert scheduler.index.get(4) == stored(4)
+    # Once loaded, later changes are applied as usual
+    scheduler.subscribe(1, 'hourly', ['USD'], 'en', now=0.0)
+    assert scheduler._touched is None
@@ -0,0 +1,16 @@
+from inline import InlineAnswerCache
+
+
+class Snapshot:
+    def __init__(self, age):
+        self._age = age
+
+    def age(self):
+        return self._age
+
+
+def test_cache_time_lasts_until_the_next_poll():
+    cache = InlineAnswerCache(None, None, poll_interval=10.0)
+    assert cache.cache_time(Snapshot(3.5)) == 6
+    # A snapshot older than one poll interval (e.g. the warm-start one) is not cached by Telegram
+    assert cache.cache_time(Snapshot(25.0)) == 0
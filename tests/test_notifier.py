@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from notifier import NotificationDispatcher
+
+
+class FloodOnceBot:
+    """Raises RetryAfter on the first send, records the time of every later one"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        self.flooded_at = None
+        self.sent_at = []
+
+    async def send_message(self, chat_id, text):
+        if self.flooded_at is None:
+            await asyncio.sleep(0.01)  # other senders reach the global bucket meanwhile
+            self.flooded_at = time.monotonic()
+            raise RetryAfter(self.retry_after)
+        self.sent_at.append(time.monotonic())
+
+
+def test_senders_waiting_for_a_token_respect_a_new_flood_wait():
+    async def run():
+        bot = FloodOnceBot(retry_after=0.3)
+        # A slow global bucket keeps several senders queued in acquire() when the flood-wait starts
+        dispatcher = NotificationDispatcher(bot, workers=4, global_rate=20, chat_rate=1000)
+        dispatcher.start()
+        for chat_id in range(6):
+            dispatcher.submit(chat_id, 'hello')
+        await asyncio.wait_for(dispatcher.join(), 5)
+        await dispatcher.stop()
+        return bot
+
+    bot = asyncio.run(run())
+    assert len(bot.sent_at) == 6
+    assert min(bot.sent_at) >= bot.flooded_at + 0.3
+
+
+def test_is_pending_tells_duplicates_from_a_full_queue():
+    async def run():
+        dispatcher = NotificationDispatcher(FloodOnceBot(0), max_queue=1)
+        assert dispatcher.submit(1, 'a')
+        assert not dispatcher.submit(1, 'a')
+        assert dispatcher.is_pending(1, 'a')
+        assert not dispatcher.submit(2, 'b')
+        assert not dispatcher.is_pending(2, 'b')
+
+    asyncio.run(run())
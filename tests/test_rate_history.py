@@ -0,0 +1,18 @@
+from rate_history import RateHistory
+
+
+def test_clock_step_back_is_recorded_at_the_last_timestamp(tmp_path):
+    history = RateHistory(str(tmp_path))
+    history.append('USD', 1000.0, 90.0)
+    history.append('USD', 990.0, 91.0)  # e.g. an NTP step
+    history.append('USD', 1010.0, 92.0)
+    assert history.last('USD', 3, 'tick') == [(1000.0, 90.0), (1000.0, 91.0), (1010.0, 92.0)]
+
+
+def test_closed_rollups_survive_a_restart_without_flush(tmp_path):
+    history = RateHistory(str(tmp_path))
+    for ts in range(0, 3 * 3600 + 1, 60):
+        history.append('USD', float(ts), float(ts))
+    # No flush: a crash keeps whatever was written
+    reopened = RateHistory(str(tmp_path))
+    assert [ts for ts, _ in reopened.range('USD', 0, 2 * 3600, '1h')] == [0.0, 3600.0, 7200.0]
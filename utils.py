@@ -1,17 +1,12 @@
 from datetime import datetime
-from typing import Dict, Optional
+from typing import List, Mapping, Optional, Sequence, Tuple
 
-# Store previous rates for comparison
-previous_rates: Dict[str, float] = {}
-
-def get_rate_mood(currency: str, current_rate: float) -> str:
-    """Determine emoji mood based on rate changes"""
-    if currency not in previous_rates:
-        previous_rates[currency] = current_rate
+def get_rate_mood(current_rate: float, previous_rate: Optional[float]) -> str:
+    """Determine emoji mood based on the change from the previous rate"""
+    if not previous_rate:
         return "😐"  # Neutral face for first reading
 
-    change = ((current_rate - previous_rates[currency]) / previous_rates[currency]) * 100
-    previous_rates[currency] = current_rate  # Update previous rate
+    change = ((current_rate - previous_rate) / previous_rate) * 100
 
     # Define moods based on percentage changes
     if change > 2.5:
@@ -25,12 +20,20 @@ def get_rate_mood(currency: str, current_rate: float) -> str:
     else:
         return "😐"  # Stable
 
-def format_currency_message(rates: Optional[Dict[str, float]]) -> str:
-    """Format currency rates message according to specifications"""
+def format_currency_message(rates: Optional[Mapping[str, float]],
+                            previous_rates: Optional[Mapping[str, float]] = None,
+                            timestamp: Optional[float] = None) -> str:
+    """Format currency rates message according to specifications
+
+    Moods compare against previous_rates; the date is taken from timestamp
+    (defaulting to now).
+    """
     if not rates:
         return "Sorry, unable to fetch currency rates at the moment."
 
-    current_date = datetime.now().strftime("%d.%m.%Y")
+    moment = datetime.fromtimestamp(timestamp) if timestamp else datetime.now()
+    current_date = moment.strftime("%d.%m.%Y")
+    previous_rates = previous_rates or {}
 
     message_lines = [
         f"CURRENT DATE: {current_date}",
@@ -49,9 +52,63 @@ def format_currency_message(rates: Optional[Dict[str, float]]) -> str:
     for currency, format_string in currency_formats.items():
         rate = rates.get(currency)
         if rate:
-            mood = get_rate_mood(currency, float(rate))
+            mood = get_rate_mood(float(rate), previous_rates.get(currency))
             message_lines.append(format_string.format(float(rate), mood))
         else:
             message_lines.append(f"{currency} rate unavailable ❌")
 
-    return "\n".join(message_lines)
\ No newline at end of file
+    return "\n".join(message_lines)
+
+SPARK_BARS = "▁▂▃▄▅▆▇█"
+
+def sparkline(values: List[float]) -> str:
+    """Render values as a one-line bar chart"""
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    span = (high - low) or 1.0
+    return "".join(SPARK_BARS[min(len(SPARK_BARS) - 1, int((v - low) / span * len(SPARK_BARS)))] for v in values)
+
+def format_history_message(currency: str, resolution: str, points: List[Tuple[float, float]]) -> str:
+    """Format recent closing rates, newest first"""
+    if not points:
+        return f"No {currency} history recorded yet."
+
+    time_format = "%d.%m.%Y" if resolution == '1d' else "%d.%m.%Y %H:%M"
+    lines = [f"{currency} rate history ({resolution}):"]
+    for ts, price in reversed(points):
+        lines.append(f"{datetime.fromtimestamp(ts).strftime(time_format)}  {price:.4f} RUB")
+    return "\n".join(lines)
+
+def format_chart_message(currency: str, resolution: str, points: List[Tuple[float, float]]) -> str:
+    """Format a sparkline chart of closing rates"""
+    if not points:
+        return f"No {currency} history recorded yet."
+
+    prices = [price for _, price in points]
+    time_format = "%d.%m.%Y" if resolution == '1d' else "%d.%m %H:%M"
+    start = datetime.fromtimestamp(points[0][0]).strftime(time_format)
+    end = datetime.fromtimestamp(points[-1][0]).strftime(time_format)
+    return (
+        f"{currency} ({resolution}, {start} - {end})\n"
+        f"{sparkline(prices)}\n"
+        f"min {min(prices):.4f}  max {max(prices):.4f}  last {prices[-1]:.4f} RUB"
+    )
+
+def format_alert_message(alert, rate: float) -> str:
+    """Format the notification sent when an alert triggers"""
+    return (f"🚨 Alert! {alert.currency} rate is {alert.direction} {alert.threshold:.2f}.\n"
+            f"Current rate: {rate:.2f} RUB")
+
+def format_digest_message(title: str, rates: Mapping[str, float], currencies: Sequence[str],
+                          timestamp: Optional[float] = None) -> str:
+    """Format a subscription digest: a title, the rates' time, then one line per chosen currency"""
+    moment = datetime.fromtimestamp(timestamp) if timestamp else datetime.now()
+    lines = [f"📬 {title}", moment.strftime("%d.%m.%Y %H:%M")]
+    for currency in currencies:
+        rate = rates.get(currency)
+        if rate:
+            lines.append(f"1{currency} = {float(rate):.4f} ROUBLES")
+        else:
+            lines.append(f"{currency} rate unavailable ❌")
+    return "\n".join(lines)
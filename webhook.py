@@ -0,0 +1,140 @@
+import asyncio
+import hmac
+import json
+import secrets
+import signal
+from typing import List, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from config import (
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    UPDATE_QUEUE_SIZE, UPDATE_WORKERS, WEBHOOK_DRAIN_TIMEOUT
+)
+from http_server import HTTPServer, Request, Response
+from logger import logger
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+
+class WebhookIngestor:
+    """Receives webhook updates into a bounded queue drained by concurrent workers
+
+    Requests without the expected secret token are rejected with 403. When
+    the queue is full the endpoint answers 503, so Telegram retries the
+    update later instead of the process buffering without limit.
+    """
+
+    def __init__(self, application: Application, secret: str = WEBHOOK_SECRET,
+                 host: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT, path: str = WEBHOOK_PATH,
+                 queue_size: int = UPDATE_QUEUE_SIZE, workers: int = UPDATE_WORKERS):
+        self.application = application
+        self.secret = (secret or secrets.token_urlsafe(32)).encode()
+        self.path = path
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.server = HTTPServer(host, port)
+        self.server.route('POST', path, self.handle)
+        self._tasks: List[asyncio.Task] = []
+        self.received = 0
+        self.rejected = 0
+        self.overflowed = 0
+        self.processed = 0
+
+    async def handle(self, request: Request) -> Response:
+        token = request.headers.get(SECRET_HEADER, '').encode()
+        if not hmac.compare_digest(token, self.secret):
+            self.rejected += 1
+            return Response(403)
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Malformed webhook update: {str(e)}")
+            return Response(400)
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.overflowed += 1
+            return Response(503)
+        self.received += 1
+        return Response(200)
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.application.process_update(update)
+            except Exception as e:
+                logger.error(f"Error processing update {update.update_id}: {str(e)}")
+            finally:
+                self.processed += 1
+                self.queue.task_done()
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        await self.server.start()
+
+    async def stop(self, drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT) -> None:
+        """Stop accepting updates, then finish everything already queued"""
+        await self.server.stop()
+        try:
+            await asyncio.wait_for(self.queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self.queue.qsize()} queued updates after {drain_timeout}s drain")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'rejected': self.rejected,
+            'overflowed': self.overflowed,
+            'processed': self.processed,
+            'queue_depth': self.queue.qsize(),
+        }
+
+
+async def serve_webhook(application: Application, stop_event: Optional[asyncio.Event] = None,
+                        url: str = WEBHOOK_URL, ingestor: Optional[WebhookIngestor] = None) -> None:
+    """Run the application in webhook mode until stop_event is set or SIGINT/SIGTERM"""
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+    if ingestor is None:
+        if not url and not WEBHOOK_SECRET:
+            # Whoever registers the webhook externally cannot know a secret generated here,
+            # so every update would be rejected with 403
+            raise RuntimeError("WEBHOOK_SECRET must be set when WEBHOOK_URL is not")
+        ingestor = WebhookIngestor(application)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    await ingestor.start()
+    try:
+        if url:
+            await application.bot.set_webhook(
+                url=url.rstrip('/') + ingestor.path,
+                secret_token=ingestor.secret.decode(),
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True,
+            )
+        else:
+            logger.warning("WEBHOOK_URL is not set; expecting the webhook to be registered externally")
+        logger.info("Bot running in webhook mode")
+        await stop_event.wait()
+    finally:
+        logger.info("Draining webhook updates...")
+        await ingestor.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)